@@ -0,0 +1,259 @@
+import json
+import os
+import shutil
+import subprocess
+import time
+from dataclasses import dataclass
+
+from cloud_init.iso_builder import CloudInitISOBuilder
+from readiness import ReadinessWaiter
+from tables import format_table
+from tracing import get_tracer
+from utils import OSUtils
+from vms.layers import LayerCatalog, LayerStatus, bake_domain_name
+from vms.template import get_domain_validator
+
+DEFAULT_BAKE_DEADLINE = 1800.0
+DEFAULT_SHUTDOWN_TIMEOUT = 120.0
+SHUTDOWN_POLL_INTERVAL = 2.0
+
+# Run in the bake VM once cloud-init is done: every node cloned from the layer
+# must boot as a new instance with its own machine-id and SSH host keys.
+SEAL_SCRIPT = (
+    "cloud-init clean --logs --machine-id && rm -f /etc/ssh/ssh_host_*_key* && sync"
+)
+
+
+@dataclass
+class BakeResult:
+    role: str
+    status: str = "pending"
+    layer_path: str = None
+    seconds: float = None
+    detail: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("baked", "current", "skipped")
+
+
+class LayerBaker:
+    # Boots a throwaway domain per role on an overlay of the base disk, lets
+    # cloud-init install the role's packages and run its runcmd, seals the
+    # guest and keeps the overlay as the role's layer. Nodes then start from
+    # an image that already has everything installed.
+    def __init__(self, cli, catalog: LayerCatalog):
+        self.cli = cli
+        self.catalog = catalog
+        self.config = cli.config_parser.bake_config
+        self.backend = cli.backend
+        self.tracer = get_tracer()
+
+    def _bake_node(self, role: str) -> dict:
+        node = self.config.get("node") or {}
+        missing = [
+            key
+            for key in ("ip_address", "gateway_address", "mac_address")
+            if not node.get(key)
+        ]
+        if missing:
+            raise ValueError(f"bake.node is missing required key(s): {missing}")
+        return {
+            "name": bake_domain_name(self.cli.config_parser.base_vm_name, role),
+            "ip_address": node["ip_address"],
+            "gateway_address": node["gateway_address"],
+            "mac_address": node["mac_address"],
+            "vcpu": node.get("vcpu", 2),
+            "memory_gb": node.get("memory_gb", 4),
+        }
+
+    def _remove_domain(self, vm_name: str) -> None:
+        if not self.cli.inventory.has_domain(vm_name):
+            return
+        try:
+            if self.backend.is_active(vm_name):
+                self.backend.destroy(vm_name)
+        except Exception:
+            pass
+        self.backend.undefine(vm_name)
+        self.cli.inventory.remove_domain(vm_name)
+
+    def _wait_shutdown(self, vm_name: str, timeout: float) -> None:
+        deadline_at = time.monotonic() + timeout
+        while self.backend.is_active(vm_name):
+            if time.monotonic() >= deadline_at:
+                raise RuntimeError(f"{vm_name} did not power off within {timeout:.0f}s")
+            time.sleep(SHUTDOWN_POLL_INTERVAL)
+
+    def _seal(self, waiter: ReadinessWaiter, node: dict) -> None:
+        host = node["ip_address"]
+        with self.tracer.span("bake.seal", "bake", node["name"]):
+            OSUtils.run_command(
+                waiter.ssh_command(host, "sudo", "sh", "-c", SEAL_SCRIPT)
+            )
+        try:
+            OSUtils.run_command(waiter.ssh_command(host, "sudo", "poweroff"))
+        except subprocess.CalledProcessError:
+            pass  # The guest drops the connection as it goes down.
+        with self.tracer.span("bake.shutdown", "bake", node["name"]):
+            self._wait_shutdown(
+                node["name"],
+                float(self.config.get("shutdown_timeout", DEFAULT_SHUTDOWN_TIMEOUT)),
+            )
+        # The next bake, or a node, reuses this IP with new host keys.
+        waiter.sessions.discard([host])
+
+    def _build(self, role: str, base_disk_path: str, layer_path: str) -> None:
+        node = self._bake_node(role)
+        vm_name = node["name"]
+        partial_path = f"{layer_path}.partial"
+        # Left over from an interrupted bake of this role.
+        self._remove_domain(vm_name)
+
+        OSUtils.run_command(
+            [
+                "qemu-img",
+                "create",
+                "-f",
+                "qcow2",
+                "-b",
+                base_disk_path,
+                "-F",
+                "qcow2",
+                partial_path,
+            ],
+            sudo=True,
+        )
+        iso_dir = None
+        try:
+            seed = self.cli.cloud_init_renderers[(role, False)].render(node)
+            iso_path = CloudInitISOBuilder(
+                seed, self.cli.cloud_init_base_dir, self.cli.iso_method
+            ).build_iso()
+            iso_dir = os.path.dirname(iso_path)
+            template = self.cli.inventory.domain_template(
+                self.cli.config_parser.base_vm_name
+            )
+            rendered = template.render(node, partial_path, iso_path)
+            get_domain_validator().validate(rendered.xml)
+            self.backend.define_xml(rendered.xml)
+            self.cli.inventory.add_domain(vm_name)
+            self.backend.start(vm_name)
+
+            waiter = ReadinessWaiter.from_config(
+                self.cli.config_parser,
+                float(self.config.get("deadline_seconds", DEFAULT_BAKE_DEADLINE)),
+            )
+            print(f"Baking {role} layer in {vm_name} (up to {waiter.deadline:.0f}s)...")
+            readiness = waiter.wait([node])[0]
+            if not readiness.ok:
+                raise RuntimeError(
+                    f"{vm_name} did not finish cloud-init: "
+                    f"{readiness.detail or readiness.status}"
+                )
+            self._seal(waiter, node)
+            self._remove_domain(vm_name)
+            OSUtils.run_command(["mv", partial_path, layer_path], sudo=True)
+        except BaseException:
+            try:
+                self._remove_domain(vm_name)
+            finally:
+                OSUtils.run_command(["rm", "-f", partial_path], sudo=True)
+            raise
+        finally:
+            if iso_dir is not None:
+                shutil.rmtree(iso_dir, ignore_errors=True)
+
+    def bake(self, role: str, force: bool = False) -> BakeResult:
+        result = BakeResult(role)
+        started = time.monotonic()
+        with self.tracer.span("bake", "bake", role) as span:
+            try:
+                if self.backend.manages_storage:
+                    raise ValueError("layers are baked on the local hypervisor only")
+                base_disk_path = self.cli.base_disk_path()
+                result.layer_path = self.catalog.layer_path(role, base_disk_path)
+                if self.catalog.recipe(role).empty:
+                    result.status = "skipped"
+                    result.detail = "no packages or runcmd to bake"
+                elif os.path.exists(result.layer_path) and not force:
+                    result.status = "current"
+                else:
+                    self._build(role, base_disk_path, result.layer_path)
+                    result.status = "baked"
+            except Exception as e:
+                result.status = "failed"
+                result.detail = str(e).strip() or type(e).__name__
+                span.error = result.detail
+            span.attrs["status"] = result.status
+        result.seconds = time.monotonic() - started
+        return result
+
+    def _backing_files(self) -> tuple[set, list[str]]:
+        # Every file some defined domain's disk chains onto, directly or not,
+        # and the disks whose chain could not be read.
+        in_use, unknown = set(), []
+        for vm_name in self.cli.inventory.domains():
+            root = self.cli.inventory.domain_xml(vm_name)
+            for source in root.findall(".//disk[@device='disk']/source[@file]"):
+                try:
+                    output = OSUtils.run_command(
+                        [
+                            "qemu-img",
+                            "info",
+                            "-U",
+                            "--backing-chain",
+                            "--output=json",
+                            source.get("file"),
+                        ],
+                        check_output=True,
+                        sudo=True,
+                    )
+                    chain = json.loads(output) if output else []
+                except (subprocess.CalledProcessError, OSError, ValueError):
+                    unknown.append(source.get("file"))
+                    continue
+                for image in chain if isinstance(chain, list) else [chain]:
+                    backing = image.get("full-backing-filename") or image.get(
+                        "backing-filename"
+                    )
+                    if backing:
+                        in_use.add(backing)
+        return in_use, unknown
+
+    def prune(self, dry_run: bool = False) -> list[LayerStatus]:
+        stale = [
+            layer
+            for layer in self.catalog.layers(self.cli.base_disk_path())
+            if not layer.current
+        ]
+        if not stale:
+            return []
+        in_use, unknown = self._backing_files()
+        if unknown:
+            # Any stale layer may sit somewhere in a chain we could not read.
+            print(
+                f"Keeping {len(stale)} stale layer(s): could not read the backing "
+                f"chain of {', '.join(unknown)}"
+            )
+            return []
+        removable = [layer for layer in stale if layer.path not in in_use]
+        if not dry_run:
+            for layer in removable:
+                OSUtils.run_command(["rm", "-f", layer.path], sudo=True)
+        return removable
+
+
+def format_bake_table(results: list[BakeResult]) -> str:
+    headers = ("ROLE", "STATUS", "TIME", "LAYER", "DETAIL")
+    rows = [
+        (
+            r.role,
+            r.status,
+            f"{r.seconds:.1f}s" if r.seconds is not None else "-",
+            r.layer_path or "-",
+            r.detail,
+        )
+        for r in results
+    ]
+    return format_table(headers, rows)
@@ -0,0 +1,117 @@
+import argparse
+import copy
+import time
+import xml.etree.ElementTree as ET
+
+from benchmarks.shims import BASE_DOMAIN_XML
+from vms.domain import memory_gb_to_kib
+from vms.template import DomainTemplate, DomainValidator, patch_domain
+
+BASE_DISK = "/var/lib/libvirt/images/bench-base.qcow2"
+
+
+def synthetic_nodes(count: int) -> list[tuple[dict, str, str]]:
+    nodes = [
+        {
+            "name": f"bench-worker-{i + 1}",
+            "role": "worker",
+            "pool": "bench-worker",
+            "vcpu": 4,
+            "memory_gb": 8,
+            "mac_address": f"52:54:00:30:{(i >> 8) & 0xff:02x}:{i & 0xff:02x}",
+        }
+        for i in range(count)
+    ]
+    return [
+        (
+            node,
+            f"/var/lib/libvirt/images/{node['name']}.qcow2",
+            f"/srv/cloud-init-data/{node['name']}/{node['name']}-cidata.iso",
+        )
+        for node in nodes
+    ]
+
+
+def _patched(root: ET.Element, node: dict, disk_path: str, iso_path: str, uid: str):
+    patch_domain(
+        root,
+        name=node["name"],
+        domain_uuid=uid,
+        vcpu=node["vcpu"],
+        memory_kib=memory_gb_to_kib(node["memory_gb"]),
+        node_metadata=node,
+        disk_path=disk_path,
+        mac_address=node["mac_address"],
+        iso_path=iso_path,
+    )
+    return ET.tostring(root, encoding="unicode", xml_declaration=True)
+
+
+def render_reparse(base_xml: str, nodes: list, uuids: list[str]) -> list[str]:
+    # What every node used to pay: parse the dumped base XML, patch, serialise.
+    return [
+        _patched(ET.fromstring(base_xml), node, disk_path, iso_path, uid)
+        for (node, disk_path, iso_path), uid in zip(nodes, uuids)
+    ]
+
+
+def render_cached_tree(base_xml: str, nodes: list, uuids: list[str]) -> list[str]:
+    base_root = ET.fromstring(base_xml)
+    return [
+        _patched(copy.deepcopy(base_root), node, disk_path, iso_path, uid)
+        for (node, disk_path, iso_path), uid in zip(nodes, uuids)
+    ]
+
+
+def render_template(base_xml: str, nodes: list, uuids: list[str]) -> list[str]:
+    template = DomainTemplate.compile(ET.fromstring(base_xml))
+    return [
+        template.render(node, disk_path, iso_path, uid).xml
+        for (node, disk_path, iso_path), uid in zip(nodes, uuids)
+    ]
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare per-node domain XML generation cost."
+    )
+    parser.add_argument(
+        "-n",
+        "--nodes",
+        type=int,
+        nargs="+",
+        default=[100, 500, 1000],
+        help="Node counts to benchmark (default: 100 500 1000).",
+    )
+    args = parser.parse_args()
+
+    base_xml = BASE_DOMAIN_XML.format(name="bench-base", disk_path=BASE_DISK)
+    validator = DomainValidator()
+    print(f"Validation: {validator.mode}")
+    print(
+        f"{'NODES':>6}  {'REPARSE/NODE':>13}  {'TREE/NODE':>10}  "
+        f"{'TEMPLATE/NODE':>14}  {'VALIDATE/NODE':>14}  {'SPEEDUP':>7}"
+    )
+    for count in args.nodes:
+        nodes = synthetic_nodes(count)
+        uuids = [f"00000000-0000-4000-8000-{i:012d}" for i in range(count)]
+        reparse, reparse_seconds = timed(render_reparse, base_xml, nodes, uuids)
+        tree, tree_seconds = timed(render_cached_tree, base_xml, nodes, uuids)
+        template, template_seconds = timed(render_template, base_xml, nodes, uuids)
+        for expected, actual in zip(reparse, template):
+            if ET.canonicalize(expected) != ET.canonicalize(actual):
+                raise SystemExit(f"Template output differs from baseline at {count}")
+        _, validate_seconds = timed(lambda: [validator.validate(x) for x in template])
+        print(
+            f"{count:>6}  {reparse_seconds / count * 1e6:>11.1f}us"
+            f"  {tree_seconds / count * 1e6:>8.1f}us"
+            f"  {template_seconds / count * 1e6:>12.1f}us"
+            f"  {validate_seconds / count * 1e6:>12.1f}us"
+            f"  {reparse_seconds / template_seconds:>6.1f}x"
+        )
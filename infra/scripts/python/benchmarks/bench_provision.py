@@ -0,0 +1,287 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import yaml
+
+from benchmarks.shims import install_shims, read_calls
+
+BASE_VM_NAME = "bench-base"
+POOL_SIZE = 250
+DEFAULT_LATENCY_MS = {
+    "virsh": 5,
+    "virsh define": 15,
+    "virsh start": 30,
+    "qemu-img": 40,
+    "mkisofs": 20,
+}
+
+
+def percentile(values: list[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(math.ceil(pct / 100 * len(ordered)) - 1, 0)
+    return ordered[rank]
+
+
+def write_config(path: str, node_count: int, key_path: str) -> None:
+    node_defaults = {
+        "gateway_address": "10.20.0.1",
+        "vcpu": 2,
+        "memory_gb": 4,
+        "disk_gb": 20,
+        "is_cow_clone": True,
+    }
+    pools = []
+    remaining = node_count - 1
+    index = 0
+    while remaining > 0:
+        count = min(remaining, POOL_SIZE)
+        pools.append(
+            {
+                "name": f"bench-worker-{index}",
+                "role": "worker",
+                "count": count,
+                "base_ip": f"10.20.{index + 1}.2",
+                "base_mac": f"52:54:00:20:{index + 1:02x}:00",
+                "defaults": dict(
+                    node_defaults, gateway_address=f"10.20.{index + 1}.1"
+                ),
+            }
+        )
+        remaining -= count
+        index += 1
+
+    config = {
+        "base_vm_name": BASE_VM_NAME,
+        "hypervisor": {"backend": "virsh"},
+        "master_nodes": [
+            dict(
+                node_defaults,
+                name="bench-master-1",
+                ip_address="10.20.0.2",
+                mac_address="52:54:00:20:00:01",
+            )
+        ],
+        "node_pools": pools,
+        "ssh_user": "root",
+        "ssh_public_key_path": key_path,
+        "ssh_private_key_path": key_path,
+        "cloud_init_global_config": {
+            "nameservers": ["10.20.0.1"],
+            "package_update": True,
+            "packages": ["curl", "containerd"],
+        },
+    }
+    with open(path, "w") as f:
+        yaml.safe_dump(config, f, sort_keys=False)
+
+
+def run_scenario(node_count: int, parallel: int, iso_builder: str) -> dict:
+    from hypervisor.virsh import VirshBackend
+    from cli import CLI
+    from provisioner import Provisioner
+    from vms.parser import VMConfigParser
+
+    key_path = os.path.abspath("bench-key.pub")
+    with open(key_path, "w") as f:
+        f.write("ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIBenchmarkKey bench@host\n")
+    write_config("vm_config.yaml", node_count, key_path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.monotonic()
+        cli = CLI(
+            VMConfigParser("vm_config.yaml"),
+            backend=VirshBackend(),
+            iso_method=iso_builder,
+        )
+        parse_seconds = time.monotonic() - start
+
+        provisioner = Provisioner(cli, max_workers=parallel)
+        start = time.monotonic()
+        results = provisioner.provision(
+            [
+                ("master", cli.config_parser.master_nodes),
+                ("worker", cli.config_parser.worker_nodes),
+            ]
+        )
+        create_seconds = time.monotonic() - start
+        create_calls_end = time.time()
+
+        start = time.monotonic()
+        for node_config in cli.all_nodes_config:
+            cli.delete_vm(node_config["name"])
+        delete_seconds = time.monotonic() - start
+
+    return {
+        "nodes": node_count,
+        "failed": sum(1 for result in results if not result.ok),
+        "parse_seconds": parse_seconds,
+        "create_seconds": create_seconds,
+        "delete_seconds": delete_seconds,
+        "create_calls_end": create_calls_end,
+        "node_create_seconds": [result.duration for result in results],
+        "inventory": cli.inventory.stats(),
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+
+def summarize(scenario: dict, calls: list[dict]) -> dict:
+    phases = {}
+    for call in calls:
+        if call["tool"] == "sudo":
+            continue
+        phase = f"{call['tool']} {call['subcommand']}".strip()
+        phases.setdefault(phase, []).append((call["end"] - call["start"]) * 1000)
+
+    node_ms = [seconds * 1000 for seconds in scenario.pop("node_create_seconds")]
+    create_end = scenario.pop("create_calls_end")
+    tool_calls = [call for call in calls if call["tool"] != "sudo"]
+    scenario.update(
+        {
+            "subprocesses": len(calls),
+            "subprocesses_per_node": len(calls) / scenario["nodes"],
+            "create_subprocesses": sum(1 for c in calls if c["start"] <= create_end),
+            "tool_calls": len(tool_calls),
+            "node_create_ms": {
+                "p50": percentile(node_ms, 50),
+                "p95": percentile(node_ms, 95),
+                "p99": percentile(node_ms, 99),
+            },
+            "phases": {
+                phase: {
+                    "calls": len(samples),
+                    "p50_ms": percentile(samples, 50),
+                    "p95_ms": percentile(samples, 95),
+                    "p99_ms": percentile(samples, 99),
+                }
+                for phase, samples in sorted(phases.items())
+            },
+        }
+    )
+    return scenario
+
+
+def run_isolated(node_count: int, args: argparse.Namespace, latency: dict) -> dict:
+    # One child per scenario so peak RSS and PATH shims do not leak across runs.
+    with tempfile.TemporaryDirectory(prefix="bench-provision-") as root_dir:
+        env = install_shims(root_dir, BASE_VM_NAME, latency)
+        workdir = os.path.join(root_dir, "work")
+        result_path = os.path.join(root_dir, "result.json")
+        os.makedirs(workdir)
+        env["PYTHONPATH"] = os.pathsep.join(
+            filter(None, [os.getcwd(), env.get("PYTHONPATH")])
+        )
+        # Tool shims write to the inherited stdout, so results go through a file.
+        subprocess.run(
+            [
+                sys.executable,
+                "-m",
+                "benchmarks.bench_provision",
+                "--scenario",
+                str(node_count),
+                "--parallel",
+                str(args.parallel),
+                "--iso-builder",
+                args.iso_builder,
+                "--result-file",
+                result_path,
+            ],
+            cwd=workdir,
+            env=env,
+            check=True,
+            stdout=subprocess.DEVNULL,
+        )
+        with open(result_path, "r") as f:
+            return summarize(json.load(f), read_calls(root_dir))
+
+
+def print_report(summary: dict) -> None:
+    print(
+        f"== {summary['nodes']} node(s): create {summary['create_seconds']:.2f}s, "
+        f"delete {summary['delete_seconds']:.2f}s, failed {summary['failed']}, "
+        f"peak RSS {summary['peak_rss_kib'] / 1024:.1f}MiB"
+    )
+    print(
+        f"   subprocesses {summary['subprocesses']} "
+        f"({summary['subprocesses_per_node']:.1f}/node), "
+        f"inventory hits/misses {summary['inventory']['hits']}/"
+        f"{summary['inventory']['misses']}, "
+        f"node create p50/p95/p99 "
+        + "/".join(f"{summary['node_create_ms'][p]:.0f}" for p in ("p50", "p95", "p99"))
+        + "ms"
+    )
+    print(f"   {'PHASE':<18}{'CALLS':>7}{'P50':>9}{'P95':>9}{'P99':>9}")
+    for phase, stats in summary["phases"].items():
+        print(
+            f"   {phase:<18}{stats['calls']:>7}"
+            f"{stats['p50_ms']:>7.1f}ms{stats['p95_ms']:>7.1f}ms{stats['p99_ms']:>7.1f}ms"
+        )
+
+
+def parse_latency(values: list[str]) -> dict:
+    latency = dict(DEFAULT_LATENCY_MS)
+    for value in values:
+        tool, _, ms = value.rpartition("=")
+        latency[tool] = float(ms)
+    return latency
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark create/delete against fake virsh/qemu-img/mkisofs."
+    )
+    parser.add_argument(
+        "-n",
+        "--nodes",
+        type=int,
+        nargs="+",
+        default=[1, 10, 100],
+        help="Node counts to benchmark (default: 1 10 100).",
+    )
+    parser.add_argument(
+        "-j", "--parallel", type=int, default=8, help="Provisioner worker count."
+    )
+    parser.add_argument(
+        "--iso-builder",
+        choices=("native", "mkisofs"),
+        default="native",
+        help="Seed ISO builder to exercise (default: native).",
+    )
+    parser.add_argument(
+        "--latency",
+        action="append",
+        default=[],
+        metavar="TOOL[ SUBCOMMAND]=MS",
+        help="Override shim latency, e.g. --latency 'virsh start=100'.",
+    )
+    parser.add_argument("--json", help="Write the full results to this JSON file.")
+    parser.add_argument("--scenario", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.scenario is not None:
+        result = run_scenario(args.scenario, args.parallel, args.iso_builder)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        sys.exit(0)
+
+    latency = parse_latency(args.latency)
+    summaries = []
+    for node_count in args.nodes:
+        summary = run_isolated(node_count, args, latency)
+        summaries.append(summary)
+        print_report(summary)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"latency_ms": latency, "results": summaries}, f, indent=2)
@@ -0,0 +1,95 @@
+import argparse
+import ipaddress
+import time
+
+from cloud_init.config import CloudInit
+from cloud_init.renderer import CloudInitRenderer
+
+GLOBAL_CONFIG = {
+    "nameservers": ["8.8.8.8", "8.8.4.4"],
+    "timezone": "UTC",
+    "package_update": True,
+    "packages": ["curl", "vim", "containerd", "kubeadm", "kubelet", "kubectl"],
+    "runcmd": [
+        "systemctl enable --now containerd",
+        "systemctl enable --now kubelet",
+        ["sh", "-c", "swapoff -a && sed -i '/ swap / s/^/#/' /etc/fstab"],
+    ],
+}
+SSH_USER = "root"
+SSH_KEYS = ["ssh-ed25519 AAAAC3NzaC1lZDI1NTE5AAAAIBenchmarkKeyMaterial bench@host"]
+
+
+def synthetic_nodes(count: int) -> list[dict]:
+    base_ip = ipaddress.IPv4Address("10.10.0.10")
+    return [
+        {
+            "name": f"bench-k8s-worker-{i + 1}",
+            "ip_address": str(base_ip + i),
+            "gateway_address": "10.10.0.1",
+        }
+        for i in range(count)
+    ]
+
+
+def render_baseline(nodes: list[dict]) -> list[tuple[str, str]]:
+    rendered = []
+    for node in nodes:
+        cloud_init = CloudInit(
+            hostname=node["name"],
+            ip_address=node["ip_address"],
+            ssh_user=SSH_USER,
+            ssh_public_keys_content=SSH_KEYS,
+            nameservers=GLOBAL_CONFIG["nameservers"],
+            timezone=GLOBAL_CONFIG["timezone"],
+            package_update=GLOBAL_CONFIG["package_update"],
+            packages=GLOBAL_CONFIG["packages"],
+            runcmd=GLOBAL_CONFIG["runcmd"],
+            gateway=node["gateway_address"],
+        )
+        rendered.append(
+            (cloud_init.generate_user_data(), cloud_init.generate_network_config())
+        )
+    return rendered
+
+
+def render_batched(nodes: list[dict]) -> list[tuple[str, str]]:
+    renderer = CloudInitRenderer.from_global_config(SSH_USER, SSH_KEYS, GLOBAL_CONFIG)
+    return [
+        (seed.generate_user_data(), seed.generate_network_config())
+        for seed in renderer.render_all(nodes)
+    ]
+
+
+def timed(func, nodes: list[dict]):
+    start = time.perf_counter()
+    result = func(nodes)
+    return result, time.perf_counter() - start
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Compare per-node cloud-init render cost."
+    )
+    parser.add_argument(
+        "-n",
+        "--nodes",
+        type=int,
+        nargs="+",
+        default=[100, 1000, 5000],
+        help="Node counts to benchmark (default: 100 1000 5000).",
+    )
+    args = parser.parse_args()
+
+    print(f"{'NODES':>6}  {'BASELINE/NODE':>14}  {'BATCHED/NODE':>13}  {'SPEEDUP':>7}")
+    for count in args.nodes:
+        nodes = synthetic_nodes(count)
+        baseline, baseline_seconds = timed(render_baseline, nodes)
+        batched, batched_seconds = timed(render_batched, nodes)
+        if baseline != batched:
+            raise SystemExit(f"Rendered output differs from baseline at {count} nodes")
+        print(
+            f"{count:>6}  {baseline_seconds / count * 1e6:>12.1f}us"
+            f"  {batched_seconds / count * 1e6:>11.1f}us"
+            f"  {baseline_seconds / batched_seconds:>6.1f}x"
+        )
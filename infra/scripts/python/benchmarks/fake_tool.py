@@ -0,0 +1,115 @@
+import json
+import os
+import re
+import sys
+import time
+
+# Stand-in for virsh, qemu-img, mkisofs and sudo used by the provisioning
+# benchmarks. Installed on PATH by benchmarks.shims; state lives under
+# $BENCH_SHIM_STATE and every call is appended to calls.jsonl.
+
+
+def _virsh(args: list[str], state_dir: str) -> int:
+    if args[:1] == ["-c"]:
+        args = args[2:]
+    domains_dir = os.path.join(state_dir, "domains")
+    command, rest = args[0], args[1:]
+
+    if command == "list":
+        names = sorted(f[: -len(".xml")] for f in os.listdir(domains_dir))
+        print("\n".join(names))
+        return 0
+    if command == "define":
+        with open(rest[-1], "r") as f:
+            xml = f.read()
+        name = re.search(r"<name>(.*?)</name>", xml).group(1)
+        with open(os.path.join(domains_dir, f"{name}.xml"), "w") as f:
+            f.write(xml)
+        print(f"Domain '{name}' defined from {rest[-1]}")
+        return 0
+
+    names = [arg for arg in rest if not arg.startswith("--")]
+    path = os.path.join(domains_dir, f"{names[0]}.xml") if names else ""
+    if not os.path.exists(path):
+        sys.stderr.write(f"error: failed to get domain '{names[0] if names else ''}'\n")
+        return 1
+    if command == "dumpxml":
+        with open(path, "r") as f:
+            sys.stdout.write(f.read())
+    elif command == "undefine":
+        os.remove(path)
+    elif command not in ("start", "destroy", "domstate", "dominfo"):
+        sys.stderr.write(f"error: unsupported virsh command '{command}'\n")
+        return 1
+    return 0
+
+
+def _qemu_img(args: list[str], state_dir: str) -> int:
+    if args[0] == "create":
+        positional = [
+            arg
+            for i, arg in enumerate(args[1:], 1)
+            if not arg.startswith("-") and not args[i - 1] in ("-f", "-b", "-F", "-o")
+        ]
+        with open(positional[0], "w") as f:
+            f.write("QFI\xfb")
+    return 0
+
+
+def _mkisofs(args: list[str], state_dir: str) -> int:
+    output = args[args.index("-output") + 1]
+    inputs = [arg for arg in args if os.path.isfile(arg) and arg != output]
+    with open(output, "wb") as out:
+        for path in inputs:
+            with open(path, "rb") as f:
+                out.write(f.read())
+    return 0
+
+
+HANDLERS = {"virsh": _virsh, "qemu-img": _qemu_img, "mkisofs": _mkisofs}
+
+
+def _latency(tool: str, subcommand: str) -> float:
+    latency = json.loads(os.environ.get("BENCH_SHIM_LATENCY", "{}"))
+    ms = latency.get(f"{tool} {subcommand}", latency.get(tool, 0))
+    return ms / 1000
+
+
+def _subcommand(tool: str, args: list[str]) -> str:
+    if tool == "virsh" and args[:1] == ["-c"]:
+        args = args[2:]
+    if tool in ("virsh", "qemu-img") and args:
+        return args[0]
+    return ""
+
+
+def main() -> int:
+    tool, args = sys.argv[1], sys.argv[2:]
+    state_dir = os.environ["BENCH_SHIM_STATE"]
+    start = time.time()
+
+    if tool == "sudo":
+        rc = 0
+    else:
+        subcommand = _subcommand(tool, args)
+        time.sleep(_latency(tool, subcommand))
+        rc = HANDLERS[tool](args, state_dir)
+
+    record = {
+        "tool": tool,
+        "subcommand": "" if tool == "sudo" else subcommand,
+        "start": start,
+        "end": time.time(),
+        "rc": rc,
+    }
+    with open(os.path.join(state_dir, "calls.jsonl"), "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+    if tool == "sudo":
+        sys.stdout.flush()
+        os.execvp(args[0], args)
+    return rc
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+import json
+import os
+import sys
+
+FAKE_TOOL = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_tool.py")
+TOOLS = ("virsh", "qemu-img", "mkisofs", "sudo")
+
+BASE_DOMAIN_XML = """<domain type='kvm'>
+  <name>{name}</name>
+  <uuid>00000000-0000-4000-8000-000000000000</uuid>
+  <memory unit='KiB'>4194304</memory>
+  <currentMemory unit='KiB'>4194304</currentMemory>
+  <vcpu placement='static'>2</vcpu>
+  <os>
+    <type arch='x86_64' machine='q35'>hvm</type>
+  </os>
+  <cpu mode='host-passthrough'>
+    <topology sockets='1' dies='1' cores='2' threads='1'/>
+  </cpu>
+  <devices>
+    <emulator>/usr/bin/qemu-system-x86_64</emulator>
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='qcow2'/>
+      <source file='{disk_path}'/>
+      <target dev='vda' bus='virtio'/>
+    </disk>
+    <disk type='file' device='cdrom'>
+      <driver name='qemu' type='raw'/>
+      <target dev='sda' bus='sata'/>
+      <readonly/>
+    </disk>
+    <interface type='bridge'>
+      <mac address='52:54:00:ff:ff:ff'/>
+      <source bridge='br0'/>
+      <model type='virtio'/>
+    </interface>
+  </devices>
+</domain>
+"""
+
+
+def install_shims(root_dir: str, base_vm_name: str, latency_ms: dict) -> dict:
+    bin_dir = os.path.join(root_dir, "bin")
+    state_dir = os.path.join(root_dir, "state")
+    images_dir = os.path.join(root_dir, "images")
+    for path in (bin_dir, os.path.join(state_dir, "domains"), images_dir):
+        os.makedirs(path, exist_ok=True)
+
+    for tool in TOOLS:
+        shim_path = os.path.join(bin_dir, tool)
+        with open(shim_path, "w") as f:
+            f.write(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TOOL}" {tool} "$@"\n')
+        os.chmod(shim_path, 0o755)
+
+    base_disk_path = os.path.join(images_dir, f"{base_vm_name}.qcow2")
+    with open(base_disk_path, "w") as f:
+        f.write("QFI\xfb")
+    with open(os.path.join(state_dir, "domains", f"{base_vm_name}.xml"), "w") as f:
+        f.write(BASE_DOMAIN_XML.format(name=base_vm_name, disk_path=base_disk_path))
+
+    env = dict(os.environ)
+    env["PATH"] = bin_dir + os.pathsep + env.get("PATH", "")
+    env["BENCH_SHIM_STATE"] = state_dir
+    env["BENCH_SHIM_LATENCY"] = json.dumps(latency_ms)
+    env.pop("LIBVIRT_DEFAULT_URI", None)
+    return env
+
+
+def read_calls(root_dir: str) -> list[dict]:
+    calls_path = os.path.join(root_dir, "state", "calls.jsonl")
+    if not os.path.exists(calls_path):
+        return []
+    with open(calls_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
@@ -0,0 +1,1446 @@
+import os
+import argparse
+import atexit
+import copy
+import glob
+import json
+import threading
+import time
+from contextlib import nullcontext
+from functools import cached_property
+
+from baker import LayerBaker, format_bake_table
+from cloud_init.cache import CACHE_METADATA_FILE, SeedISOCache
+from cloud_init.iso_builder import ISO_METHODS, CloudInitISOBuilder
+from cloud_init.renderer import CloudInitRenderer
+from daemon_client import SOCKET_ENV, default_socket_path
+from fanout import DEFAULT_PARALLEL, FanOut, format_exec_table
+from hypervisor.base import HypervisorBackend
+from hypervisor.factory import BACKENDS, create_backend
+from hypervisor.virsh import TMP_XML_PREFIX
+from journal import DEFAULT_JOURNAL_PATH, JournalStep, ProvisionJournal, ResumePoint
+from provisioner import (
+    DEFAULT_MAX_WORKERS,
+    EXECUTORS,
+    AsyncProvisioner,
+    NodeResult,
+    Provisioner,
+    format_results_table,
+)
+from readiness import ReadinessWaiter, format_readiness_table
+from reconciler import PlannedChange, Reconciler, format_plan
+from scheduler import HostFleet, HostSpec, format_hosts, format_placements
+from snapshots import ClusterSnapshots, format_snapshot_list, format_snapshot_table
+from ssh_pool import SSHSessionPool
+from status import (
+    BASELINE_MAX_AGE,
+    DEFAULT_INTERVAL,
+    StatusMonitor,
+    format_status_table,
+    status_document,
+)
+from tracing import get_tracer
+from utils import AsyncCommandRunner, OSUtils
+from vms.builder import VMBuilder
+from vms.disk_clone import DiskCloner
+from vms.inventory import LibvirtInventory
+from vms.layers import ROLES, LayerCatalog
+from vms.parser import VMConfigParser
+from vms.storage import DiskPlacer, OverlayOptions, format_storage_table
+from vms.tuning import NUMAPlacer
+from vms.warm_pool import WarmPool
+
+CONFIG_FILE = "vm_config.yaml"
+
+# Temporary domain XML younger than this may belong to a define in flight.
+GC_TMP_XML_MIN_AGE = 300
+
+
+class CLI:
+    def __init__(
+        self,
+        config_parser: VMConfigParser,
+        cloud_init_base_dir: str = "cloud-init-data",
+        backend: HypervisorBackend = None,
+        iso_method: str = "native",
+        seed_cache: SeedISOCache = None,
+        journal: ProvisionJournal = None,
+        hosts: list[HostSpec] = None,
+    ):
+        self.config_parser = config_parser
+        self.cloud_init_base_dir = cloud_init_base_dir
+        self.iso_method = iso_method
+        self.seed_cache = seed_cache
+        self.journal = journal
+        self.backend = backend if backend is not None else create_backend()
+        self.inventory = LibvirtInventory(self.backend)
+        self.placer = NUMAPlacer(self.inventory)
+        provisioning_config = self.config_parser.provisioning_config
+        self.overlay_options = OverlayOptions.from_config(
+            provisioning_config.get("overlay")
+        )
+        self.disk_placer = DiskPlacer.from_config(
+            self.inventory, provisioning_config.get("disk_placement")
+        )
+        self.warm_pool = WarmPool(
+            self.config_parser.base_vm_name,
+            self.inventory,
+            overlay_options=self.overlay_options,
+        )
+        self.ssh_public_key_content = self._load_ssh_public_key()
+        self.layers = LayerCatalog(
+            self.config_parser.base_vm_name,
+            self.config_parser.cloud_init_global_config,
+            self.config_parser.bake_config,
+        )
+        # Per role, with and without the packages a baked layer already holds.
+        self.cloud_init_renderers = {
+            (role, baked): self._make_renderer(role, baked)
+            for role in ROLES
+            for baked in (False, True)
+        }
+        self._baked_layers = {}
+        self._baked_layers_lock = threading.Lock()
+        self._stats_baseline = None
+        self.tracer = get_tracer()
+        full_clone_config = provisioning_config.get("full_clone", {})
+        self.disk_cloner = DiskCloner(
+            chunk_size=int(full_clone_config.get("chunk_mb", 16)) * 1024 * 1024,
+            verify=full_clone_config.get("verify", "sample"),
+            progress_interval=full_clone_config.get("progress_interval", 2.0),
+        )
+        self.fleet = (
+            HostFleet(
+                self, hosts, self.config_parser.hypervisor_config.get("backend", "auto")
+            )
+            if hosts
+            else None
+        )
+
+    @cached_property
+    def all_nodes_config(self) -> list[dict]:
+        # Expanding every pool is only worth it for commands that walk them all.
+        return self.config_parser.all_nodes
+
+    def for_host(self, backend: HypervisorBackend) -> "CLI":
+        # Same configuration, renderer and journal; its own libvirt connection.
+        host_cli = copy.copy(self)
+        host_cli.backend = backend
+        host_cli.inventory = LibvirtInventory(backend)
+        host_cli.placer = NUMAPlacer(host_cli.inventory)
+        host_cli.disk_placer = DiskPlacer.from_config(
+            host_cli.inventory,
+            self.config_parser.provisioning_config.get("disk_placement"),
+        )
+        # Warm slots are local files staged against one base disk.
+        host_cli.warm_pool = None
+        host_cli.fleet = None
+        host_cli._baked_layers = {}
+        host_cli._baked_layers_lock = threading.Lock()
+        return host_cli
+
+    def _load_ssh_public_key(self) -> str:
+        public_key_path = self.config_parser.ssh_public_key_path
+        if not os.path.exists(public_key_path):
+            raise FileNotFoundError(f"SSH public key not found: {public_key_path}")
+        with open(public_key_path, "r") as f:
+            return f.read().strip()
+
+    def _make_renderer(self, role: str, baked: bool) -> CloudInitRenderer:
+        recipe = self.layers.recipe(role)
+        global_config = dict(self.config_parser.cloud_init_global_config)
+        global_config.update(
+            package_update=False if baked else recipe.package_update,
+            packages=None if baked else recipe.packages,
+            runcmd=None if baked else recipe.runcmd,
+        )
+        return CloudInitRenderer.from_global_config(
+            self.config_parser.ssh_user, [self.ssh_public_key_content], global_config
+        )
+
+    def base_disk_path(self) -> str:
+        base_vm_name = self.config_parser.base_vm_name
+        root = self.inventory.domain_xml(base_vm_name)
+        source = root.find(".//disk[@device='disk']/source[@file]")
+        if source is None:
+            raise ValueError(f"Could not find base disk path for VM: {base_vm_name}")
+        return source.get("file")
+
+    def baked_layer(self, node_config: dict) -> str:
+        # Layers are local files chained by qemu-img; full clones and remote
+        # hosts start from the base as before.
+        if not node_config.get("is_cow_clone", True) or self.backend.manages_storage:
+            return None
+        role = self.config_parser.node_role(node_config)
+        # Resolved once per run so a node's seed ISO and its disk always agree.
+        with self._baked_layers_lock:
+            if role not in self._baked_layers:
+                self._baked_layers[role] = self.layers.lookup(
+                    role, self.base_disk_path()
+                )
+            return self._baked_layers[role]
+
+    def list_vms(self):
+        try:
+            if self.fleet is not None:
+                for host, domains in self.fleet.domains().items():
+                    print(f"Existing VMs on {host}:")
+                    print("\n".join(domains))
+                return
+            output = "\n".join(self.inventory.domains())
+            print("Existing VMs:")
+            print(output)
+        except Exception as e:
+            print(f"Error listing VMs: {e}")
+
+    def status_monitor(self, nodes: list[dict] = None) -> StatusMonitor:
+        nodes = nodes if nodes is not None else self.all_nodes_config
+        placements = {}
+        if self.fleet is not None:
+            backends = {
+                name: host_cli.backend for name, host_cli in self.fleet.hosts.items()
+            }
+            if self.journal is not None:
+                placements = self.journal.placements()
+        else:
+            backends = {None: self.backend}
+        return StatusMonitor(
+            backends,
+            [(self.config_parser.node_role(node), node) for node in nodes],
+            placements,
+        )
+
+    def show_status(
+        self,
+        nodes: list[dict] = None,
+        watch: bool = False,
+        interval: float = None,
+        as_json: bool = False,
+    ) -> bool:
+        status_config = self.config_parser.status_config
+        interval = float(interval or status_config.get("interval", DEFAULT_INTERVAL))
+        monitor = self.status_monitor(nodes)
+        # Rates need two samples; --watch then reuses each one as the baseline.
+        # A long-lived CLI (the daemon) also keeps the last one between calls,
+        # so a status shortly after another needs no extra interval's wait.
+        previous = self._stats_baseline
+        if previous is None or time.monotonic() - previous.taken > BASELINE_MAX_AGE:
+            previous = monitor.sample()
+        next_tick = previous.taken + interval
+        try:
+            while True:
+                time.sleep(max(next_tick - time.monotonic(), 0))
+                next_tick += interval
+                current = monitor.sample()
+                statuses = monitor.statuses(current, previous)
+                previous = self._stats_baseline = current
+                if as_json:
+                    print(json.dumps(status_document(statuses, interval)), flush=True)
+                else:
+                    if watch:
+                        print("\033[H\033[2J", end="")
+                        print(
+                            f"Every {interval:g}s: {len(statuses)} node(s)  "
+                            f"{time.strftime('%H:%M:%S')}"
+                        )
+                    print(format_status_table(statuses), flush=True)
+                if not watch:
+                    return all(
+                        status.state != "undefined" and status.error is None
+                        for status in statuses
+                    )
+        except KeyboardInterrupt:
+            return True
+
+    def vm_exists(self, vm_name: str) -> bool:
+        return self.inventory.has_domain(vm_name)
+
+    def _lookup_seed(self, node_config: dict):
+        vm_name = node_config["name"]
+        with self.tracer.span("iso.render", "iso", vm_name):
+            renderer = self.cloud_init_renderers[
+                (
+                    self.config_parser.node_role(node_config),
+                    self.baked_layer(node_config) is not None,
+                )
+            ]
+            cloud_init_config_instance = renderer.render(node_config)
+
+        digest = None
+        cached_iso_path = None
+        if self.seed_cache is not None:
+            with self.tracer.span("iso.cache_lookup", "iso", vm_name) as span:
+                digest = self.seed_cache.seal(cloud_init_config_instance)
+                cached_iso_path = self.seed_cache.lookup(vm_name, digest)
+                span.attrs["hit"] = cached_iso_path is not None
+            if cached_iso_path is not None:
+                print(f"Reusing cached cloud-init ISO for {vm_name}.")
+        return cloud_init_config_instance, digest, cached_iso_path
+
+    def build_cloud_init_iso(self, node_config: dict) -> str:
+        vm_name = node_config["name"]
+        cloud_init_config_instance, digest, cached_iso_path = self._lookup_seed(
+            node_config
+        )
+        if cached_iso_path is not None:
+            return cached_iso_path
+
+        iso_builder = CloudInitISOBuilder(
+            cloud_init_config_instance, self.cloud_init_base_dir, self.iso_method
+        )
+        with self.tracer.span("iso.build", "iso", vm_name) as span:
+            span.attrs["method"] = self.iso_method
+            iso_path = iso_builder.build_iso()
+        if digest is not None:
+            self.seed_cache.store(vm_name, digest, iso_path)
+        return iso_path
+
+    async def build_cloud_init_iso_async(
+        self, node_config: dict, runner: AsyncCommandRunner
+    ) -> str:
+        vm_name = node_config["name"]
+        cloud_init_config_instance, digest, cached_iso_path = self._lookup_seed(
+            node_config
+        )
+        if cached_iso_path is not None:
+            return cached_iso_path
+
+        iso_builder = CloudInitISOBuilder(
+            cloud_init_config_instance, self.cloud_init_base_dir, self.iso_method
+        )
+        with self.tracer.span("iso.build", "iso", vm_name) as span:
+            span.attrs["method"] = self.iso_method
+            iso_path = await iso_builder.build_iso_async(runner)
+        if digest is not None:
+            self.seed_cache.store(vm_name, digest, iso_path)
+        return iso_path
+
+    def journal_step(self, vm_name: str, step: str):
+        if self.journal is None:
+            return nullcontext(JournalStep(vm_name, step, "started"))
+        return self.journal.step(vm_name, step)
+
+    def resume_point(self, node_config: dict, resume: bool = False) -> ResumePoint:
+        vm_name = node_config["name"]
+        exists = self.vm_exists(vm_name)
+        if self.journal is None:
+            return ResumePoint(defined=exists, started=exists)
+        if resume:
+            return self.journal.resume_point(vm_name, exists)
+        if not exists:
+            # A fresh create rebuilds every step; forget any earlier attempt.
+            self.journal.reset(vm_name)
+        return ResumePoint(defined=exists, started=exists)
+
+    def make_vm_builder(self, node_config: dict, cloud_init_iso_path: str) -> VMBuilder:
+        return VMBuilder(
+            node_config,
+            self.config_parser.base_vm_name,
+            cloud_init_iso_path,
+            inventory=self.inventory,
+            disk_cloner=self.disk_cloner,
+            warm_pool=self.warm_pool,
+            backing_layer=self.baked_layer(node_config),
+            profile=self.config_parser.node_profile(node_config),
+            placer=self.placer,
+            overlay_options=self.overlay_options,
+            disk_placer=self.disk_placer,
+        )
+
+    def create_vm(self, node_config: dict, resume: bool = False) -> bool:
+        vm_name = node_config["name"]
+        if self.fleet is not None:
+            host_cli = self.fleet.host_for(node_config)
+            return host_cli is not None and host_cli.create_vm(node_config, resume)
+
+        with self.tracer.span("provision", category="node", node=vm_name) as span:
+            try:
+                resume_point = self.resume_point(node_config, resume)
+                if resume_point.started:
+                    print(f"VM {vm_name} already exists. Skipping creation.")
+                    span.attrs["status"] = "skipped"
+                    return True
+                if resume_point.completed:
+                    print(f"Resuming {vm_name} after {resume_point.completed[-1]}.")
+
+                cloud_init_iso_path = resume_point.iso_path
+                if cloud_init_iso_path is None and not resume_point.defined:
+                    with self.tracer.span("iso"), self.journal_step(
+                        vm_name, "iso"
+                    ) as entry:
+                        cloud_init_iso_path = self.build_cloud_init_iso(node_config)
+                        entry.artifact = cloud_init_iso_path
+                vm_builder = self.make_vm_builder(node_config, cloud_init_iso_path)
+                if not resume_point.defined:
+                    new_disk_path = resume_point.disk_path
+                    if new_disk_path is None:
+                        with self.tracer.span("disk"), self.journal_step(
+                            vm_name, "disk"
+                        ) as entry:
+                            new_disk_path = vm_builder.prepare_disk()
+                            entry.artifact = new_disk_path
+                    with self.tracer.span("define"), self.journal_step(
+                        vm_name, "define"
+                    ):
+                        vm_builder.define_vm(new_disk_path)
+                with self.tracer.span("start"), self.journal_step(vm_name, "start"):
+                    vm_builder.start_vm()
+                print(f"VM {vm_name} created and started successfully.")
+                span.attrs["status"] = "created"
+                if self.warm_pool is not None:
+                    self.warm_pool.refill_in_background(
+                        self.config_parser.config_file_path
+                    )
+                return True
+
+            except Exception as e:
+                span.attrs["status"] = "failed"
+                span.error = str(e).strip() or type(e).__name__
+                print(f"Error creating VM {vm_name}: {e}")
+                return False
+
+    def make_provisioner(
+        self, max_workers: int = None, executor: str = None, resume: bool = False
+    ) -> Provisioner:
+        provisioning_config = self.config_parser.provisioning_config
+        max_workers = max_workers or provisioning_config.get(
+            "max_workers", DEFAULT_MAX_WORKERS
+        )
+        executor = executor or provisioning_config.get("executor", "threads")
+        if executor == "asyncio":
+            provisioner = AsyncProvisioner(
+                self,
+                AsyncCommandRunner.from_config(
+                    provisioning_config.get("async_executor", {})
+                ),
+                max_workers=max_workers,
+                resume=resume,
+            )
+        else:
+            provisioner = Provisioner(
+                self,
+                max_workers=max_workers,
+                phase_limits=provisioning_config.get("phase_limits"),
+                resume=resume,
+            )
+        return provisioner
+
+    def create_all_vms(
+        self, max_workers: int = None, executor: str = None, resume: bool = False
+    ) -> list[NodeResult]:
+        tiers = [
+            ("master", self.config_parser.master_nodes),
+            ("worker", self.config_parser.worker_nodes),
+        ]
+        if self.fleet is not None:
+            results = self.fleet.provision(
+                tiers,
+                lambda host_cli: host_cli.make_provisioner(
+                    max_workers, executor, resume
+                ),
+            )
+        else:
+            results = self.make_provisioner(max_workers, executor, resume).provision(
+                tiers
+            )
+        print()
+        print(format_results_table(results))
+        if self.fleet is None:
+            self.warm_pool.refill_in_background(self.config_parser.config_file_path)
+        return results
+
+    def schedule_nodes(self) -> bool:
+        states, placements = self.fleet.schedule(self.all_nodes_config, record=False)
+        print(format_hosts(states))
+        print()
+        print(format_placements(placements))
+        return all(placement.ok for placement in placements)
+
+    def show_storage(self) -> bool:
+        if not self.disk_placer.enabled:
+            print("No provisioning.disk_placement targets configured.")
+            return True
+        usage = self.disk_placer.usage()
+        print(format_storage_table(usage))
+        return all(entry.error is None for entry in usage)
+
+    def bake_layers(
+        self, roles: list[str] = None, force: bool = False, prune: bool = False
+    ) -> bool:
+        baker = LayerBaker(self, self.layers)
+        results = [baker.bake(role, force=force) for role in roles or ROLES]
+        print()
+        print(format_bake_table(results))
+        if prune and all(result.ok for result in results):
+            for layer in baker.prune():
+                print(f"Removed stale {layer.role} layer {layer.path}")
+        return all(result.ok for result in results)
+
+    def layer_status(self):
+        try:
+            base_disk_path = self.base_disk_path()
+        except Exception as e:
+            print(f"Error reading base VM: {e}")
+            return
+        print(f"Baked layers of {base_disk_path}:")
+        for role in ROLES:
+            recipe = self.layers.recipe(role)
+            if recipe.empty:
+                print(f"  {role}: nothing to bake")
+            elif self.layers.lookup(role, base_disk_path) is None:
+                print(f"  {role}: not baked; nodes install packages on first boot")
+        for layer in self.layers.layers(base_disk_path):
+            state = "current" if layer.current else "stale"
+            print(
+                f"  {layer.role}: {state}  {layer.size / 1024**2:.0f}M  {layer.path}"
+            )
+
+    def wait_for_nodes(self, nodes: list[dict] = None, deadline: float = None) -> bool:
+        nodes = nodes if nodes is not None else self.all_nodes_config
+        waiter = ReadinessWaiter.from_config(self.config_parser, deadline)
+        print(
+            f"Waiting up to {waiter.deadline:.0f}s for {len(nodes)} node(s) "
+            "to finish cloud-init..."
+        )
+        results = waiter.wait(nodes)
+        print()
+        print(format_readiness_table(results))
+        return all(result.ok for result in results)
+
+    def select_nodes(
+        self, pools: list[str] = None, roles: list[str] = None, names: list[str] = None
+    ) -> list[dict]:
+        by_role = {
+            "master": self.config_parser.master_nodes,
+            "worker": self.config_parser.worker_nodes,
+        }
+        # Each kind of selector narrows the set; repeats of one kind widen it.
+        selected = []
+        for role, nodes in by_role.items():
+            if roles and role not in roles:
+                continue
+            for node_config in nodes:
+                if pools and node_config.get("pool") not in pools:
+                    continue
+                if names and node_config["name"] not in names:
+                    continue
+                selected.append(node_config)
+        return selected
+
+    def exec_on_nodes(
+        self,
+        command: list[str],
+        nodes: list[dict] = None,
+        parallel: int = None,
+        timeout: float = None,
+        close: bool = False,
+    ) -> bool:
+        nodes = nodes if nodes is not None else self.all_nodes_config
+        exec_config = self.config_parser.exec_config
+        fan_out = FanOut(
+            SSHSessionPool.from_config(self.config_parser),
+            parallel=parallel or exec_config.get("parallel", DEFAULT_PARALLEL),
+            timeout=timeout or exec_config.get("timeout_seconds"),
+        )
+        results = fan_out.run(nodes, command, close=close)
+        print()
+        print(format_exec_table(results))
+        return all(result.ok for result in results)
+
+    def plan_changes(self) -> list[PlannedChange]:
+        planned = Reconciler(self).plan()
+        print(format_plan(planned))
+        return planned
+
+    def apply_changes(
+        self, max_workers: int = None, allow_replace: bool = False
+    ) -> bool:
+        planned = self.plan_changes()
+        if not planned:
+            return True
+        provisioning_config = self.config_parser.provisioning_config
+        results = Reconciler(self).apply(
+            planned,
+            max_workers=max_workers
+            or provisioning_config.get("max_workers", DEFAULT_MAX_WORKERS),
+            phase_limits=provisioning_config.get("phase_limits"),
+            allow_replace=allow_replace,
+        )
+        print()
+        print(format_results_table(results))
+        return all(result.status != "failed" for result in results)
+
+    def _snapshots(self) -> ClusterSnapshots:
+        return ClusterSnapshots(
+            self,
+            self.config_parser.provisioning_config.get(
+                "max_workers", DEFAULT_MAX_WORKERS
+            ),
+        )
+
+    def snapshot_cluster(
+        self, name: str, nodes: list[dict] = None, memory: bool = False
+    ) -> bool:
+        nodes = nodes if nodes is not None else self.all_nodes_config
+        results = self._snapshots().take(name, nodes, memory=memory)
+        print(format_snapshot_table(results))
+        if all(result.ok for result in results):
+            return True
+        print(
+            f"Snapshot '{name}' is incomplete; run `snapshot {name}` again to take "
+            "the nodes that failed."
+        )
+        return False
+
+    def reset_cluster(self, name: str, nodes: list[dict] = None) -> bool:
+        nodes = nodes if nodes is not None else self.all_nodes_config
+        results = self._snapshots().reset(name, nodes)
+        # Reset guests lost the TCP state any shared SSH master relied on.
+        self.discard_ssh_sessions([node["ip_address"] for node in nodes])
+        print(format_snapshot_table(results))
+        return all(result.ok for result in results)
+
+    def list_snapshots(self):
+        records = self.journal.snapshots() if self.journal is not None else []
+        if not records:
+            print("No snapshots.")
+            return
+        print(format_snapshot_list(records))
+
+    def discard_snapshots(self, vm_name: str) -> None:
+        # Overlays and memory files of a deleted node's snapshots.
+        if self.journal is None or not self.journal.snapshots(vm_name):
+            return
+        try:
+            self._snapshots().discard(vm_name)
+        except Exception as e:
+            print(f"Error removing snapshots of {vm_name}: {e}")
+
+    def delete_vm(self, vm_name: str):
+        if self.fleet is not None:
+            host_cli = self.fleet.locate(vm_name)
+            if host_cli is None:
+                print(f"VM {vm_name} does not exist on any host. Skipping deletion.")
+                return
+            host_cli.delete_vm(vm_name)
+            return
+        try:
+            if not self.inventory.has_domain(vm_name):
+                print(f"VM {vm_name} does not exist. Skipping deletion.")
+                return
+        except Exception as e:
+            print(f"Error deleting VM {vm_name}: {e}")
+            return
+        try:
+            self.remove_domain(vm_name)
+            print(f"VM {vm_name} destroyed and undefined.")
+        except Exception as e:
+            print(f"Error deleting VM {vm_name}: {e}")
+
+    def remove_domain(self, vm_name: str, disks: list[str] = ()) -> None:
+        # Everything deleting a node entails, for delete and the reconciler.
+        # disks are overlays only the domain knew of, which gc could not
+        # find from the config once the journal forgets them.
+        try:
+            self.backend.destroy(vm_name)
+        except Exception:
+            pass
+        self.backend.undefine(vm_name)
+        self.inventory.remove_domain(vm_name)
+        if disks:
+            OSUtils.run_command(["rm", "-f", *sorted(disks)], sudo=True)
+        if self.journal is not None:
+            self.journal.reset(vm_name)
+            self.journal.forget_placement(vm_name)
+            self.discard_snapshots(vm_name)
+        node_config = self.config_parser.get_node(vm_name)
+        if node_config is not None:
+            self.discard_ssh_sessions([node_config["ip_address"]])
+
+    def discard_ssh_sessions(self, hosts: list[str]) -> None:
+        SSHSessionPool.from_config(self.config_parser).discard(hosts)
+
+    def warm_pool_warm(self, count: int, disk_gb: int = None):
+        if disk_gb is None:
+            disk_gb = min(node["disk_gb"] for node in self.all_nodes_config)
+        try:
+            built = self.warm_pool.warm(count, disk_gb)
+            ready = len(self.warm_pool.slots())
+            print(f"Warm pool holds {ready} slot(s); built {built}.")
+        except Exception as e:
+            print(f"Error warming pool: {e}")
+
+    def warm_pool_status(self):
+        slots = self.warm_pool.slots()
+        print(f"Warm pool: {len(slots)}/{self.warm_pool.target()} slot(s) ready")
+        for slot in slots:
+            age = time.time() - slot.created
+            print(
+                f"  {slot.slot_id}  {slot.disk_gb}G  {age / 60:.0f}m  {slot.disk_path}"
+            )
+
+    def warm_pool_drain(self):
+        try:
+            print(f"Drained {self.warm_pool.drain()} warm slot(s).")
+        except Exception as e:
+            print(f"Error draining pool: {e}")
+
+    def seed_cache_stats(self, seed_cache: SeedISOCache):
+        stats = seed_cache.stats()
+        print(f"Seed ISO cache: {seed_cache.base_output_dir}")
+        print(f"  Entries:    {stats['entries']}")
+        print(f"  Size:       {stats['size_bytes'] / (1024 * 1024):.2f} MiB")
+        print(f"  Oldest use: {stats['oldest_age_days']:.1f} days ago")
+
+    def prune_seed_cache(self, seed_cache: SeedISOCache, dry_run: bool = False):
+        try:
+            in_use = set(self.inventory.domains())
+        except Exception as e:
+            print(f"Error listing VMs, refusing to prune: {e}")
+            return
+        evicted = seed_cache.prune(in_use=in_use, dry_run=dry_run)
+        action = "Would evict" if dry_run else "Evicted"
+        for entry in evicted:
+            print(f"{action} {entry.hostname} ({entry.size} bytes)")
+        print(f"{action} {len(evicted)} cached seed ISO(s).")
+
+    def _remote_disk_nodes(self) -> set:
+        # Nodes placed on a host whose disks live on that host, not here: a
+        # path of theirs that exists locally is some other file.
+        if self.fleet is None or self.journal is None:
+            return set()
+        return {
+            node
+            for node, host in self.journal.placements().items()
+            if host not in self.fleet.hosts
+            or self.fleet.hosts[host].backend.manages_storage
+        }
+
+    def _orphaned_artifacts(self, domains: set) -> tuple[list, set]:
+        # domains spans every host of a fleet, whose CLIs share this journal.
+        entries = self.journal.entries() if self.journal is not None else []
+        busy = {entry.node for entry in entries if entry.in_progress}
+        remote_disks = self._remote_disk_nodes()
+        candidates = {}
+        for entry in entries:
+            if entry.step == "disk" and entry.node in remote_disks:
+                continue
+            if entry.step in ("iso", "disk") and entry.artifact:
+                candidates.setdefault(entry.node, set()).add(
+                    (entry.step, entry.artifact)
+                )
+        # Also catch artifacts from runs that predate the journal. Placed
+        # nodes live on other hosts, so only a single local host is scanned.
+        for node_config in self.all_nodes_config if self.fleet is None else []:
+            vm_name = node_config["name"]
+            if vm_name in domains:
+                continue
+            iso_path = os.path.abspath(
+                os.path.join(self.cloud_init_base_dir, vm_name, f"{vm_name}-cidata.iso")
+            )
+            disk_paths = self.make_vm_builder(node_config, None).expected_disk_paths()
+            candidates.setdefault(vm_name, set()).update(
+                {("iso", iso_path)} | {("disk", path) for path in disk_paths}
+            )
+
+        orphans = []
+        nodes = set()
+        for vm_name, artifacts in sorted(candidates.items()):
+            if vm_name in domains or vm_name in busy:
+                continue
+            nodes.add(vm_name)
+            for step, path in sorted(artifacts):
+                if not os.path.exists(path):
+                    continue
+                cache_metadata = os.path.join(
+                    os.path.dirname(path), CACHE_METADATA_FILE
+                )
+                if step == "iso" and os.path.exists(cache_metadata):
+                    continue  # Owned by the seed ISO cache; see `cache prune`.
+                orphans.append(("overlay" if step == "disk" else "iso", path))
+
+        now = time.time()
+        for path in sorted(glob.glob(f"{TMP_XML_PREFIX}*.xml")):
+            if now - os.path.getmtime(path) >= GC_TMP_XML_MIN_AGE:
+                orphans.append(("xml", path))
+        if not busy:
+            orphans += [("xml", path) for path in self.warm_pool.orphaned_staged_xml()]
+        return orphans, nodes
+
+    def collect_garbage(self, dry_run: bool = False, force: bool = False) -> bool:
+        if self.journal is None and not (dry_run or force):
+            # Without it, a create in flight elsewhere looks just like a dead one.
+            print(
+                "provisioning.journal is off, so gc cannot tell a running create's "
+                "overlays and ISOs from orphans. Re-run with --force if no create "
+                "is running."
+            )
+            return False
+        try:
+            if self.fleet is not None:
+                domains = {
+                    name for names in self.fleet.domains().values() for name in names
+                }
+            else:
+                domains = set(self.inventory.domains())
+        except Exception as e:
+            print(f"Error listing VMs, refusing to collect garbage: {e}")
+            return False
+
+        orphans, nodes = self._orphaned_artifacts(domains)
+        action = "Would remove" if dry_run else "Removed"
+        removed = 0
+        for kind, path in orphans:
+            if not dry_run:
+                try:
+                    if kind == "overlay":
+                        OSUtils.run_command(["rm", "-f", path], sudo=True)
+                    else:
+                        os.remove(path)
+                except Exception as e:
+                    print(f"Error removing {path}: {e}")
+                    continue
+            removed += 1
+            print(f"{action} {kind} {path}")
+        if not dry_run and self.journal is not None:
+            for vm_name in nodes:
+                self.journal.reset(vm_name)
+        print(f"{action} {removed} orphaned artifact(s).")
+        return removed == len(orphans)
+
+    def list_available_commands(self):
+        print("Available Commands:")
+        print("  list_vms()")
+        print("  create_vm(node_config_dict, resume=False)")
+        print("  create_all_vms(max_workers=None, executor=None, resume=False)")
+        print("  schedule_nodes()")
+        print("  show_storage()")
+        print("  bake_layers(roles=None, force=False, prune=False)")
+        print("  plan_changes()")
+        print("  apply_changes(max_workers=None, allow_replace=False)")
+        print("  wait_for_nodes(nodes=None, deadline=None)")
+        print("  show_status(nodes=None, watch=False, interval=None, as_json=False)")
+        print("  exec_on_nodes(command, nodes=None, parallel=None, timeout=None)")
+        print("  snapshot_cluster(name, nodes=None, memory=False)")
+        print("  reset_cluster(name, nodes=None)")
+        print("  delete_vm(vm_name)")
+        print("  collect_garbage(dry_run=False, force=False)")
+        print("  list_available_commands()")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        description="A CLI tool for managing virtual machines.",
+        formatter_class=argparse.RawTextHelpFormatter,
+    )
+
+    parser.add_argument(
+        "-c",
+        "--config",
+        default=CONFIG_FILE,
+        help=f"Path to the VM configuration YAML file (default: {CONFIG_FILE})",
+    )
+
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default=None,
+        help="Hypervisor backend: libvirt-python API or forked virsh (default: auto).",
+    )
+    parser.add_argument(
+        "--uri",
+        default=None,
+        help="libvirt connection URI (default: $LIBVIRT_DEFAULT_URI).",
+    )
+    parser.add_argument(
+        "--iso-builder",
+        choices=ISO_METHODS,
+        default=None,
+        help="Build cloud-init seed ISOs in-process or with mkisofs (default: native).",
+    )
+
+    parser.add_argument(
+        "--trace-file",
+        default=None,
+        help="Write a Chrome trace (chrome://tracing, Perfetto) of the run to a file.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        default=None,
+        help="Write Prometheus textfile-collector metrics for the run to this file.",
+    )
+    parser.add_argument(
+        "--no-trace-summary",
+        action="store_true",
+        help="Do not print the per-phase timing summary on exit.",
+    )
+    parser.add_argument(
+        "--no-daemon",
+        action="store_true",
+        help="Run in this process even if a daemon is serving the configuration.",
+    )
+
+    subparsers = parser.add_subparsers(dest="command", help="Available commands")
+
+    list_parser = subparsers.add_parser(
+        "list", help="List all existing virtual machines."
+    )
+
+    create_parser = subparsers.add_parser(
+        "create", help="Create one or all virtual machines."
+    )
+    create_group = create_parser.add_mutually_exclusive_group(required=True)
+    create_group.add_argument(
+        "node_name",
+        nargs="?",
+        help="Specify a single node to create by name (e.g., 'test-k8s-master-1').",
+    )
+    create_group.add_argument(
+        "--all",
+        action="store_true",
+        help="Create all VMs defined in the configuration file.",
+    )
+    create_parser.add_argument(
+        "-j",
+        "--parallel",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Maximum number of nodes provisioned concurrently with --all.",
+    )
+    create_parser.add_argument(
+        "--executor",
+        choices=EXECUTORS,
+        default=None,
+        help="Provision --all with worker threads or on one asyncio loop "
+        "(default: threads).",
+    )
+    create_parser.add_argument(
+        "--wait",
+        action="store_true",
+        help="After creating, wait until SSH is up and cloud-init has finished.",
+    )
+    create_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Global deadline for --wait (default: readiness.deadline_seconds).",
+    )
+    create_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Continue interrupted nodes from their last journaled step instead "
+        "of skipping or rebuilding them.",
+    )
+    create_parser.add_argument(
+        "--seed-cache",
+        action="store_true",
+        help="Reuse cloud-init ISOs whose rendered inputs have not changed.",
+    )
+
+    wait_parser = subparsers.add_parser(
+        "wait", help="Wait until nodes accept SSH and cloud-init has finished."
+    )
+    wait_parser.add_argument(
+        "node_names",
+        nargs="*",
+        help="Nodes to wait for (default: every node in the configuration).",
+    )
+    wait_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Global deadline (default: readiness.deadline_seconds).",
+    )
+
+    status_parser = subparsers.add_parser(
+        "status",
+        help="Show state, CPU, memory, disk and network rates of every node from "
+        "one bulk domstats query.",
+    )
+    status_parser.add_argument(
+        "node_names",
+        nargs="*",
+        help="Nodes to show (default: every node in the configuration).",
+    )
+    status_parser.add_argument(
+        "-w",
+        "--watch",
+        action="store_true",
+        help="Refresh every interval until interrupted.",
+    )
+    status_parser.add_argument(
+        "-i",
+        "--interval",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Sampling interval for rates and --watch (default: status.interval).",
+    )
+    status_parser.add_argument(
+        "--json",
+        action="store_true",
+        help="Print one JSON document per sample instead of a table.",
+    )
+
+    exec_parser = subparsers.add_parser(
+        "exec",
+        help="Run a command over SSH on every (or selected) node in parallel.",
+        description="Run a command over SSH on every (or selected) node in "
+        "parallel. --pool, --role and --node combine: a node must match each "
+        "kind of selector given, and any one of its repeats.",
+    )
+    exec_parser.add_argument(
+        "--pool",
+        action="append",
+        default=[],
+        help="Only nodes of this node pool (repeatable).",
+    )
+    exec_parser.add_argument(
+        "--role",
+        action="append",
+        choices=("master", "worker"),
+        default=[],
+        help="Only nodes of this role (repeatable).",
+    )
+    exec_parser.add_argument(
+        "--node",
+        action="append",
+        default=[],
+        help="Only this node (repeatable).",
+    )
+    exec_parser.add_argument(
+        "-j",
+        "--parallel",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Maximum concurrent sessions (default: exec.parallel).",
+    )
+    exec_parser.add_argument(
+        "--timeout",
+        type=float,
+        default=None,
+        metavar="SECONDS",
+        help="Kill the command on a node after this long.",
+    )
+    exec_parser.add_argument(
+        "--close",
+        action="store_true",
+        help="Close the shared SSH sessions afterwards instead of keeping them warm.",
+    )
+    exec_parser.add_argument(
+        "remote_command",
+        nargs=argparse.REMAINDER,
+        help="Command to run, after '--' (e.g. -- kubeadm version).",
+    )
+
+    subparsers.add_parser(
+        "plan", help="Show the changes needed to converge live VMs to the config."
+    )
+
+    apply_parser = subparsers.add_parser(
+        "apply", help="Create, delete and resize only the VMs that changed."
+    )
+    apply_parser.add_argument(
+        "-j",
+        "--parallel",
+        type=int,
+        default=None,
+        metavar="N",
+        help="Maximum number of nodes changed concurrently.",
+    )
+    apply_parser.add_argument(
+        "--replace",
+        action="store_true",
+        help="Delete and recreate VMs whose disk path or MAC address drifted, "
+        "or whose vCPUs are pinned and need resizing.",
+    )
+
+    pool_parser = subparsers.add_parser(
+        "pool", help="Manage pre-built overlays used to speed up create."
+    )
+    pool_parser.add_argument("action", choices=("warm", "status", "drain"))
+    pool_parser.add_argument(
+        "count",
+        nargs="?",
+        type=int,
+        default=None,
+        help="Number of slots to keep warm (required for 'warm').",
+    )
+    pool_parser.add_argument(
+        "--disk-gb",
+        type=int,
+        default=None,
+        help="Overlay size for warm slots (default: smallest configured disk_gb).",
+    )
+
+    bake_parser = subparsers.add_parser(
+        "bake",
+        help="Pre-install each role's cloud-init packages into a qcow2 layer that "
+        "node overlays chain onto.",
+    )
+    bake_parser.add_argument(
+        "--role",
+        action="append",
+        choices=ROLES,
+        default=[],
+        help="Only bake this role (repeatable; default: every role).",
+    )
+    bake_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild layers even if they are current.",
+    )
+    bake_parser.add_argument(
+        "--prune",
+        action="store_true",
+        help="Afterwards remove stale layers no defined domain chains onto.",
+    )
+    bake_parser.add_argument(
+        "--status",
+        action="store_true",
+        help="Only show which layers exist and whether they are current.",
+    )
+
+    snapshot_parser = subparsers.add_parser(
+        "snapshot",
+        help="Take an external qcow2 snapshot of every node in the configuration.",
+    )
+    snapshot_parser.add_argument(
+        "snapshot_name",
+        nargs="?",
+        help="Name to reset to later (e.g. 'bootstrapped').",
+    )
+    snapshot_parser.add_argument(
+        "--memory",
+        action="store_true",
+        help="Also save the memory of running nodes so reset resumes them "
+        "instead of rebooting.",
+    )
+    snapshot_parser.add_argument(
+        "--list",
+        action="store_true",
+        help="List existing snapshots.",
+    )
+
+    reset_parser = subparsers.add_parser(
+        "reset",
+        help="Revert every node in the configuration to a snapshot; later "
+        "snapshots are discarded.",
+    )
+    reset_parser.add_argument("snapshot_name", help="Snapshot to revert to.")
+
+    subparsers.add_parser(
+        "schedule",
+        help="Show where each node would be placed across hypervisor.hosts.",
+    )
+
+    subparsers.add_parser(
+        "storage",
+        help="Show each disk placement target's free space and the disks on it.",
+    )
+
+    gc_parser = subparsers.add_parser(
+        "gc",
+        help="Remove overlays, ISOs and temporary XML left behind by interrupted "
+        "creates.",
+    )
+    gc_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what gc would remove.",
+    )
+    gc_parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Collect even with provisioning.journal off, when in-flight creates "
+        "cannot be told apart from interrupted ones.",
+    )
+
+    cache_parser = subparsers.add_parser(
+        "cache", help="Inspect or prune the cloud-init seed ISO cache."
+    )
+    cache_parser.add_argument("action", choices=("stats", "prune"))
+    cache_parser.add_argument(
+        "--max-age-days",
+        type=float,
+        default=None,
+        help="Evict entries not used for this many days.",
+    )
+    cache_parser.add_argument(
+        "--max-size-mb",
+        type=float,
+        default=None,
+        help="Evict least recently used entries until the cache fits.",
+    )
+    cache_parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="Only report what prune would evict.",
+    )
+
+    delete_parser = subparsers.add_parser(
+        "delete", help="Delete one or all virtual machines."
+    )
+    delete_group = delete_parser.add_mutually_exclusive_group(required=True)
+    delete_group.add_argument(
+        "vm_name",
+        nargs="?",
+        help="The name of the VM to delete (e.g., 'test-k8s-master-1').",
+    )
+    delete_group.add_argument(
+        "--all",
+        action="store_true",
+        help="Delete all VMs defined in the configuration file.",
+    )
+
+    daemon_parser = subparsers.add_parser(
+        "daemon",
+        help="Keep the configuration, caches and hypervisor connection loaded and "
+        "serve list, create, delete and status over a Unix socket.",
+    )
+    daemon_parser.add_argument(
+        "--socket",
+        default=None,
+        help=f"Socket to listen on (default: ${SOCKET_ENV}, else "
+        f"{default_socket_path()}).",
+    )
+
+    # By name, so a command can report a usage error in its own terms.
+    parser.command_parsers = subparsers.choices
+    return parser
+
+
+def build_cli(
+    args: argparse.Namespace,
+    vm_config_parser: VMConfigParser,
+    backend: HypervisorBackend = None,
+) -> tuple[CLI, SeedISOCache]:
+    hypervisor_config = vm_config_parser.hypervisor_config
+    if backend is None:
+        backend = create_backend(
+            args.backend or hypervisor_config.get("backend", "auto"),
+            args.uri or hypervisor_config.get("uri"),
+        )
+    cache_config = vm_config_parser.cloud_init_cache_config
+    seed_cache = SeedISOCache(
+        max_age_days=getattr(args, "max_age_days", None)
+        or cache_config.get("max_age_days"),
+        max_size_mb=getattr(args, "max_size_mb", None)
+        or cache_config.get("max_size_mb"),
+    )
+    use_seed_cache = cache_config.get("enabled", False) or getattr(
+        args, "seed_cache", False
+    )
+    journal_path = vm_config_parser.provisioning_config.get(
+        "journal", DEFAULT_JOURNAL_PATH
+    )
+    cli_app = CLI(
+        vm_config_parser,
+        backend=backend,
+        iso_method=args.iso_builder or vm_config_parser.cloud_init_iso_builder,
+        seed_cache=seed_cache if use_seed_cache else None,
+        journal=ProvisionJournal(journal_path) if journal_path else None,
+        hosts=[
+            HostSpec.from_config(spec) for spec in hypervisor_config.get("hosts", [])
+        ],
+    )
+    return cli_app, seed_cache
+
+
+def run_command(
+    args: argparse.Namespace,
+    parser: argparse.ArgumentParser,
+    cli_app: CLI,
+    seed_cache: SeedISOCache,
+) -> int:
+    vm_config_parser = cli_app.config_parser
+    if args.command == "list":
+        cli_app.list_vms()
+    elif args.command == "create":
+        if args.all:
+            print("Creating all VMs defined in the configuration...")
+            results = cli_app.create_all_vms(
+                max_workers=args.parallel,
+                executor=args.executor,
+                resume=args.resume,
+            )
+            print(cli_app.inventory.format_stats())
+            if not all(result.ok for result in results):
+                return 1
+            # Nodes that already existed were booted (and waited for) before.
+            created = [
+                vm_config_parser.get_node(result.name)
+                for result in results
+                if result.status == "created"
+            ]
+            if args.wait and not cli_app.wait_for_nodes(created, args.timeout):
+                return 1
+        elif args.node_name:
+            found_node = vm_config_parser.get_node(args.node_name)
+            if found_node:
+                if cli_app.create_vm(found_node, args.resume) and args.wait:
+                    if not cli_app.wait_for_nodes([found_node], args.timeout):
+                        return 1
+            else:
+                print(f"Error: Node '{args.node_name}' not found in configuration.")
+        else:
+            parser.command_parsers["create"].print_help()
+
+    elif args.command == "delete":
+        if args.all:
+            print("Deleting all VMs defined in the configuration...")
+            for node_config in cli_app.all_nodes_config:
+                cli_app.delete_vm(node_config["name"])
+            print(cli_app.inventory.format_stats())
+        elif args.vm_name:
+            cli_app.delete_vm(args.vm_name)
+        else:
+            parser.command_parsers["delete"].print_help()
+
+    elif args.command == "wait":
+        nodes = []
+        for node_name in args.node_names:
+            found_node = vm_config_parser.get_node(node_name)
+            if not found_node:
+                print(f"Error: Node '{node_name}' not found in configuration.")
+                return 1
+            nodes.append(found_node)
+        if not cli_app.wait_for_nodes(nodes or None, deadline=args.timeout):
+            return 1
+
+    elif args.command == "status":
+        nodes = []
+        for node_name in args.node_names:
+            found_node = vm_config_parser.get_node(node_name)
+            if not found_node:
+                print(f"Error: Node '{node_name}' not found in configuration.")
+                return 1
+            nodes.append(found_node)
+        if not cli_app.show_status(
+            nodes or None,
+            watch=args.watch,
+            interval=args.interval,
+            as_json=args.json,
+        ):
+            return 1
+
+    elif args.command == "exec":
+        remote_command = args.remote_command
+        if remote_command[:1] == ["--"]:
+            remote_command = remote_command[1:]
+        if not remote_command:
+            parser.command_parsers["exec"].error("no command given")
+        nodes = cli_app.select_nodes(args.pool, args.role, args.node)
+        if not nodes:
+            print("Error: No nodes match the selection.")
+            return 1
+        if not cli_app.exec_on_nodes(
+            remote_command,
+            nodes,
+            parallel=args.parallel,
+            timeout=args.timeout,
+            close=args.close,
+        ):
+            return 1
+
+    elif args.command == "plan":
+        cli_app.plan_changes()
+
+    elif args.command == "apply":
+        if not cli_app.apply_changes(
+            max_workers=args.parallel, allow_replace=args.replace
+        ):
+            return 1
+
+    elif args.command == "pool":
+        if args.action == "warm":
+            if args.count is None:
+                parser.command_parsers["pool"].error(
+                    "'pool warm' requires a slot count"
+                )
+            cli_app.warm_pool_warm(args.count, args.disk_gb)
+        elif args.action == "status":
+            cli_app.warm_pool_status()
+        else:
+            cli_app.warm_pool_drain()
+
+    elif args.command == "bake":
+        if args.status:
+            cli_app.layer_status()
+        elif not cli_app.bake_layers(args.role, args.force, args.prune):
+            return 1
+
+    elif args.command == "snapshot":
+        if args.list:
+            cli_app.list_snapshots()
+        elif not args.snapshot_name:
+            parser.command_parsers["snapshot"].error("a snapshot name is required")
+        elif not cli_app.snapshot_cluster(args.snapshot_name, memory=args.memory):
+            return 1
+
+    elif args.command == "reset":
+        if not cli_app.reset_cluster(args.snapshot_name):
+            return 1
+
+    elif args.command == "schedule":
+        if cli_app.fleet is None:
+            print("Error: No hypervisor.hosts configured; everything runs locally.")
+            return 1
+        if not cli_app.schedule_nodes():
+            return 1
+
+    elif args.command == "storage":
+        if not cli_app.show_storage():
+            return 1
+
+    elif args.command == "gc":
+        if not cli_app.collect_garbage(dry_run=args.dry_run, force=args.force):
+            return 1
+
+    elif args.command == "cache":
+        if args.action == "stats":
+            cli_app.seed_cache_stats(seed_cache)
+        else:
+            cli_app.prune_seed_cache(seed_cache, dry_run=args.dry_run)
+
+    else:
+        parser.print_help()  # If no command is given, print general help
+    return 0
+
+
+def main(argv: list[str] = None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    try:
+        if not os.path.exists(args.config):
+            raise FileNotFoundError(
+                f"Configuration file '{args.config}' not found. Please provide a valid configuration file."
+            )
+
+        vm_config_parser = VMConfigParser(args.config)
+        if args.command == "daemon":
+            from daemon import ProvisioningDaemon
+
+            return ProvisioningDaemon(parser, args, vm_config_parser).serve()
+
+        tracing_config = vm_config_parser.tracing_config
+        atexit.register(
+            get_tracer().finish,
+            summary=tracing_config.get("summary", True) and not args.no_trace_summary,
+            trace_file=args.trace_file or tracing_config.get("trace_file"),
+            metrics_file=args.metrics_file or tracing_config.get("metrics_file"),
+        )
+        cli_app, seed_cache = build_cli(args, vm_config_parser)
+        return run_command(args, parser, cli_app, seed_cache)
+
+    except FileNotFoundError as fnfe:
+        print(f"Error: {fnfe}")
+        return 1
+    except Exception as e:
+        print(f"An unexpected error occurred: {e}")
+        return 1
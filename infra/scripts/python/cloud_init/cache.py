@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+from dataclasses import dataclass
+
+from cloud_init.config import CloudInit
+
+CACHE_METADATA_FILE = ".seed-cache.json"
+
+
+def seed_digest(hostname: str, user_data: str, network_config: str) -> str:
+    hasher = hashlib.sha256()
+    for part in (hostname, user_data, network_config):
+        hasher.update(part.encode("utf-8"))
+        hasher.update(b"\x00")
+    return hasher.hexdigest()
+
+
+def file_digest(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def stable_instance_id(hostname: str, digest: str) -> str:
+    return f"k8s-{hostname}-{digest[:8]}"
+
+
+@dataclass
+class SeedCacheEntry:
+    hostname: str
+    digest: str
+    iso_path: str
+    size: int
+    created: float
+    last_used: float
+    iso_sha256: str = None
+
+
+class SeedISOCache:
+    def __init__(
+        self,
+        base_output_dir: str = "cloud-init-data",
+        max_age_days: float = None,
+        max_size_mb: float = None,
+    ):
+        self.base_output_dir = os.path.abspath(base_output_dir)
+        self.max_age_days = max_age_days
+        self.max_size_mb = max_size_mb
+
+    def _metadata_path(self, hostname: str) -> str:
+        return os.path.join(self.base_output_dir, hostname, CACHE_METADATA_FILE)
+
+    def _read_entry(self, hostname: str) -> SeedCacheEntry:
+        try:
+            with open(self._metadata_path(hostname), "r") as f:
+                return SeedCacheEntry(**json.load(f))
+        except (FileNotFoundError, ValueError, TypeError):
+            return None
+
+    def _write_entry(self, entry: SeedCacheEntry) -> None:
+        metadata_path = self._metadata_path(entry.hostname)
+        tmp_path = f"{metadata_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entry.__dict__, f, indent=2)
+        os.replace(tmp_path, metadata_path)
+
+    def seal(self, config: CloudInit) -> str:
+        digest = seed_digest(
+            config.hostname,
+            config.generate_user_data(),
+            config.generate_network_config(),
+        )
+        config.meta_data_config.instance_id = stable_instance_id(
+            config.hostname, digest
+        )
+        return digest
+
+    def lookup(self, hostname: str, digest: str) -> str:
+        entry = self._read_entry(hostname)
+        if entry is None or entry.digest != digest:
+            return None
+        # Builds without the cache rewrite the ISO in place and leave the
+        # record behind, so trust the record only for the file it describes.
+        try:
+            if entry.iso_sha256 != file_digest(entry.iso_path):
+                return None
+        except FileNotFoundError:
+            return None
+        entry.last_used = time.time()
+        self._write_entry(entry)
+        return entry.iso_path
+
+    def store(self, hostname: str, digest: str, iso_path: str) -> None:
+        now = time.time()
+        self._write_entry(
+            SeedCacheEntry(
+                hostname=hostname,
+                digest=digest,
+                iso_path=os.path.abspath(iso_path),
+                size=os.path.getsize(iso_path),
+                created=now,
+                last_used=now,
+                iso_sha256=file_digest(iso_path),
+            )
+        )
+
+    def entries(self) -> list[SeedCacheEntry]:
+        if not os.path.isdir(self.base_output_dir):
+            return []
+        entries = []
+        for hostname in sorted(os.listdir(self.base_output_dir)):
+            entry = self._read_entry(hostname)
+            if entry is not None:
+                entries.append(entry)
+        return entries
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        now = time.time()
+        return {
+            "entries": len(entries),
+            "size_bytes": sum(entry.size for entry in entries),
+            "oldest_age_days": (
+                max((now - entry.last_used) / 86400 for entry in entries)
+                if entries
+                else 0.0
+            ),
+        }
+
+    def select_evictions(self, in_use: set = frozenset()) -> list[SeedCacheEntry]:
+        now = time.time()
+        entries = self.entries()
+        candidates = sorted(
+            (entry for entry in entries if entry.hostname not in in_use),
+            key=lambda entry: entry.last_used,
+        )
+        evict = []
+        if self.max_age_days is not None:
+            max_age_seconds = self.max_age_days * 86400
+            evict = [e for e in candidates if now - e.last_used > max_age_seconds]
+
+        if self.max_size_mb is not None:
+            budget = self.max_size_mb * 1024 * 1024
+            total = sum(entry.size for entry in entries if entry not in evict)
+            for entry in candidates:
+                if total <= budget:
+                    break
+                if entry not in evict:
+                    evict.append(entry)
+                    total -= entry.size
+        return evict
+
+    def evict(self, entry: SeedCacheEntry) -> None:
+        vm_output_dir = os.path.join(self.base_output_dir, entry.hostname)
+        shutil.rmtree(vm_output_dir, ignore_errors=True)
+
+    def prune(
+        self, in_use: set = frozenset(), dry_run: bool = False
+    ) -> list[SeedCacheEntry]:
+        evicted = self.select_evictions(in_use)
+        if not dry_run:
+            for entry in evicted:
+                self.evict(entry)
+        return evicted
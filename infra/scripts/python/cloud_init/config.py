@@ -23,7 +23,7 @@ class UserData:
         self.packages = packages if packages is not None else []
         self.runcmd = runcmd if runcmd is not None else []
 
-    def to_yaml(self) -> str:
+    def to_dict(self) -> dict:
         user_data_content = {
             "hostname": self.hostname,
             "manage_etc_hosts": True,
@@ -46,11 +46,14 @@ class UserData:
         if self.runcmd:
             user_data_content["runcmd"] = self.runcmd
 
+        return user_data_content
+
+    def to_yaml(self) -> str:
         return (
             "#cloud-config"
             + "\n"
             + yaml.dump(
-                user_data_content, indent=2, default_flow_style=False, sort_keys=False
+                self.to_dict(), indent=2, default_flow_style=False, sort_keys=False
             )
         )
 
@@ -66,7 +69,7 @@ class NetworkConfig:
         self.nameservers = nameservers
         self.gateway = gateway
 
-    def to_yaml(self) -> str:
+    def to_dict(self) -> dict:
         network_config = {
             "network": {
                 "version": 2,
@@ -83,15 +86,18 @@ class NetworkConfig:
             },
         }
 
+        return network_config
+
+    def to_yaml(self) -> str:
         return yaml.dump(
-            network_config, indent=2, default_flow_style=False, sort_keys=False
+            self.to_dict(), indent=2, default_flow_style=False, sort_keys=False
         )
 
 
 class MetaData:
-    def __init__(self, hostname: str):
+    def __init__(self, hostname: str, instance_id: str = None):
         self.hostname = hostname
-        self.instance_id = f"k8s-{self.hostname}-{uuid.uuid4().hex[:8]}"
+        self.instance_id = instance_id or f"k8s-{self.hostname}-{uuid.uuid4().hex[:8]}"
 
     def to_json(self) -> str:
         meta_data = {
@@ -115,6 +121,7 @@ class CloudInit:
         packages: list[str] = None,
         runcmd: list[str] = None,
     ):
+        self.hostname = hostname
         self.user_data_config = UserData(
             hostname=hostname,
             ssh_user=ssh_user,
@@ -0,0 +1,221 @@
+import os
+import struct
+import tempfile
+import time
+
+SECTOR_SIZE = 2048
+SYSTEM_AREA_SECTORS = 16
+
+# Fixed layout: system area, PVD, Joliet SVD, terminator, four path tables,
+# one root directory per hierarchy, then file extents.
+PVD_SECTOR = 16
+JOLIET_SVD_SECTOR = 17
+TERMINATOR_SECTOR = 18
+PRIMARY_L_PATH_SECTOR = 19
+PRIMARY_M_PATH_SECTOR = 20
+JOLIET_L_PATH_SECTOR = 21
+JOLIET_M_PATH_SECTOR = 22
+PRIMARY_ROOT_SECTOR = 23
+JOLIET_ROOT_SECTOR = 24
+FIRST_FILE_SECTOR = 25
+
+PATH_TABLE_SIZE = 10
+JOLIET_ESCAPE = b"%/E"
+D_CHARS = set("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789_")
+
+
+def _both16(value: int) -> bytes:
+    return struct.pack("<H", value) + struct.pack(">H", value)
+
+
+def _both32(value: int) -> bytes:
+    return struct.pack("<I", value) + struct.pack(">I", value)
+
+
+def _sectors(size: int) -> int:
+    return (size + SECTOR_SIZE - 1) // SECTOR_SIZE
+
+
+def _pad_sector(data: bytes) -> bytes:
+    return data + b"\x00" * (_sectors(len(data)) * SECTOR_SIZE - len(data))
+
+
+def _a_string(value: str, length: int, joliet: bool) -> bytes:
+    if joliet:
+        encoded = value.encode("utf-16-be")[: length - length % 2]
+        return encoded + " ".encode("utf-16-be") * ((length - len(encoded)) // 2) + (
+            b" " * (length % 2)
+        )
+    return value.encode("ascii")[:length].ljust(length, b" ")
+
+
+def _dir_datetime(timestamp: float) -> bytes:
+    t = time.gmtime(timestamp)
+    return bytes(
+        [t.tm_year - 1900, t.tm_mon, t.tm_mday, t.tm_hour, t.tm_min, t.tm_sec, 0]
+    )
+
+
+def _volume_datetime(timestamp: float) -> bytes:
+    return time.strftime("%Y%m%d%H%M%S00", time.gmtime(timestamp)).encode() + b"\x00"
+
+
+def _primary_identifier(name: str) -> str:
+    base, _, ext = name.upper().partition(".")
+    base = "".join(c if c in D_CHARS else "_" for c in base)[:8]
+    ext = "".join(c if c in D_CHARS else "_" for c in ext)[:3]
+    return f"{base}.{ext};1"
+
+
+class NoCloudISOWriter:
+    def __init__(self, volume_id: str = "cidata", timestamp: float = None):
+        self.volume_id = volume_id
+        self.timestamp = time.time() if timestamp is None else timestamp
+        self.files = {}
+
+    def add_file(self, name: str, data) -> None:
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        self.files[name] = data
+
+    def _directory_record(
+        self, identifier: bytes, extent: int, size: int, is_dir: bool
+    ) -> bytes:
+        length = 33 + len(identifier) + (1 - len(identifier) % 2)
+        record = (
+            bytes([length, 0])
+            + _both32(extent)
+            + _both32(size)
+            + _dir_datetime(self.timestamp)
+            + bytes([0x02 if is_dir else 0x00, 0, 0])
+            + _both16(1)
+            + bytes([len(identifier)])
+            + identifier
+        )
+        return record.ljust(length, b"\x00")
+
+    def _root_directory(
+        self, root_sector: int, entries: list[tuple[bytes, int, int]]
+    ) -> bytes:
+        data = self._directory_record(b"\x00", root_sector, SECTOR_SIZE, True)
+        data += self._directory_record(b"\x01", root_sector, SECTOR_SIZE, True)
+        for identifier, extent, size in sorted(entries):
+            data += self._directory_record(identifier, extent, size, False)
+        if len(data) > SECTOR_SIZE:
+            raise ValueError("Too many files for a single-sector root directory")
+        return _pad_sector(data)
+
+    def _path_table(self, root_sector: int, big_endian: bool) -> bytes:
+        fmt = ">" if big_endian else "<"
+        record = (
+            bytes([1, 0])
+            + struct.pack(fmt + "I", root_sector)
+            + struct.pack(fmt + "H", 1)
+            + b"\x00\x00"
+        )
+        return _pad_sector(record)
+
+    def _volume_descriptor(
+        self, joliet: bool, total_sectors: int, root_sector: int, path_sectors
+    ) -> bytes:
+        l_path_sector, m_path_sector = path_sectors
+        creation = _volume_datetime(self.timestamp)
+        unset = b"0" * 16 + b"\x00"
+
+        descriptor = (
+            bytes([2 if joliet else 1])
+            + b"CD001"
+            + bytes([1, 0])
+            + _a_string("LINUX", 32, joliet)
+            + _a_string(self.volume_id, 32, joliet)
+            + b"\x00" * 8
+            + _both32(total_sectors)
+            + (JOLIET_ESCAPE.ljust(32, b"\x00") if joliet else b"\x00" * 32)
+            + _both16(1)
+            + _both16(1)
+            + _both16(SECTOR_SIZE)
+            + _both32(PATH_TABLE_SIZE)
+            + struct.pack("<I", l_path_sector)
+            + b"\x00" * 4
+            + struct.pack(">I", m_path_sector)
+            + b"\x00" * 4
+            + self._directory_record(b"\x00", root_sector, SECTOR_SIZE, True)
+            + _a_string("", 128, joliet) * 4
+            + _a_string("", 37, joliet) * 3
+            + creation
+            + creation
+            + unset
+            + creation
+            + bytes([1, 0])
+        )
+        return _pad_sector(descriptor)
+
+    def _terminator(self) -> bytes:
+        return _pad_sector(b"\xffCD001\x01")
+
+    def _layout(self) -> list[tuple[str, bytes, int]]:
+        layout = []
+        sector = FIRST_FILE_SECTOR
+        for name in sorted(self.files):
+            data = self.files[name]
+            layout.append((name, data, sector))
+            sector += _sectors(len(data))
+        return layout
+
+    def iter_chunks(self):
+        layout = self._layout()
+        total_sectors = FIRST_FILE_SECTOR + sum(
+            _sectors(len(data)) for _, data, _ in layout
+        )
+
+        primary_entries = [
+            (_primary_identifier(name).encode("ascii"), sector, len(data))
+            for name, data, sector in layout
+        ]
+        if len({identifier for identifier, _, _ in primary_entries}) != len(layout):
+            raise ValueError("File names collide in the ISO9660 primary hierarchy")
+        joliet_entries = [
+            (name.encode("utf-16-be"), sector, len(data))
+            for name, data, sector in layout
+        ]
+
+        yield b"\x00" * SECTOR_SIZE * SYSTEM_AREA_SECTORS
+        yield self._volume_descriptor(
+            False,
+            total_sectors,
+            PRIMARY_ROOT_SECTOR,
+            (PRIMARY_L_PATH_SECTOR, PRIMARY_M_PATH_SECTOR),
+        )
+        yield self._volume_descriptor(
+            True,
+            total_sectors,
+            JOLIET_ROOT_SECTOR,
+            (JOLIET_L_PATH_SECTOR, JOLIET_M_PATH_SECTOR),
+        )
+        yield self._terminator()
+        yield self._path_table(PRIMARY_ROOT_SECTOR, big_endian=False)
+        yield self._path_table(PRIMARY_ROOT_SECTOR, big_endian=True)
+        yield self._path_table(JOLIET_ROOT_SECTOR, big_endian=False)
+        yield self._path_table(JOLIET_ROOT_SECTOR, big_endian=True)
+        yield self._root_directory(PRIMARY_ROOT_SECTOR, primary_entries)
+        yield self._root_directory(JOLIET_ROOT_SECTOR, joliet_entries)
+        for _, data, _ in layout:
+            yield _pad_sector(data)
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.iter_chunks())
+
+    def write(self, iso_path: str) -> None:
+        output_dir = os.path.dirname(os.path.abspath(iso_path))
+        os.makedirs(output_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=output_dir, suffix=".iso.tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                for chunk in self.iter_chunks():
+                    f.write(chunk)
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, iso_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
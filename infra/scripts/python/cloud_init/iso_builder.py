@@ -1,41 +1,82 @@
+import asyncio
 import os
 from cloud_init.config import CloudInit
-from utils import OSUtils
+from cloud_init.iso9660 import NoCloudISOWriter
+from utils import AsyncCommandRunner, OSUtils
+
+ISO_METHODS = ("native", "mkisofs")
 
 
 class CloudInitISOBuilder:
-    def __init__(self, config: CloudInit, base_output_dir: str = "cloud-init-data"):
+    def __init__(
+        self,
+        config: CloudInit,
+        base_output_dir: str = "cloud-init-data",
+        method: str = "native",
+    ):
+        if method not in ISO_METHODS:
+            raise ValueError(f"Unknown ISO build method: {method}")
         self.config = config
+        self.method = method
         self.vm_output_dir = os.path.join(
-            base_output_dir, config.user_data_config.hostname
+            base_output_dir, config.hostname
         )
         self.iso_path = os.path.join(
-            self.vm_output_dir, f"{config.user_data_config.hostname}-cidata.iso"
+            self.vm_output_dir, f"{config.hostname}-cidata.iso"
         )
         self.vm_output_dir = os.path.abspath(self.vm_output_dir)
         self.iso_path = os.path.abspath(self.iso_path)
 
     def build_iso(self) -> str:
+        if self.method == "mkisofs":
+            return self._build_iso_mkisofs()
+        return self._build_iso_native()
+
+    async def build_iso_async(self, runner: AsyncCommandRunner) -> str:
+        if self.method == "mkisofs":
+            await asyncio.to_thread(self.config.save_configs, self.vm_output_dir)
+            try:
+                await runner.run_command(self._mkisofs_command())
+            except FileNotFoundError as e:
+                raise RuntimeError(
+                    f"Required command utility not found: {e}. Please ensure "
+                    "'mkisofs' is installed or use the native ISO builder."
+                )
+            return self.iso_path
+        return await asyncio.to_thread(self._build_iso_native)
+
+    def _build_iso_native(self) -> str:
+        writer = NoCloudISOWriter(volume_id="cidata")
+        writer.add_file("user-data", self.config.generate_user_data())
+        writer.add_file("meta-data", self.config.generate_meta_data())
+        writer.add_file("network-config", self.config.generate_network_config())
+        writer.write(self.iso_path)
+        return self.iso_path
+
+    def _mkisofs_command(self) -> list[str]:
+        return [
+            "mkisofs",
+            "-output",
+            self.iso_path,
+            "-volid",
+            "cidata",
+            "-joliet",
+            "-r",
+            os.path.join(self.vm_output_dir, "user-data"),
+            os.path.join(self.vm_output_dir, "meta-data"),
+            os.path.join(self.vm_output_dir, "network-config"),
+        ]
+
+    def _build_iso_mkisofs(self) -> str:
         self.config.save_configs(self.vm_output_dir)
 
         try:
-            mkisofs_cmd = [
-                "mkisofs",
-                "-output",
-                self.iso_path,
-                "-volid",
-                "cidata",
-                "-joliet",
-                "-r",
-                os.path.join(self.vm_output_dir, "user-data"),
-                os.path.join(self.vm_output_dir, "meta-data"),
-                os.path.join(self.vm_output_dir, "network-config"),
-            ]
-            
+            mkisofs_cmd = self._mkisofs_command()
+
             OSUtils.run_command(mkisofs_cmd)
         except FileNotFoundError as e:
             raise RuntimeError(
-                f"Required command utility not found: {e}. Please ensure 'mkisofs' or 'cloud-localds' is installed."
+                f"Required command utility not found: {e}. Please ensure 'mkisofs' is installed or use the native ISO builder."
             )
 
         return self.iso_path
@@ -0,0 +1,140 @@
+import io
+
+import yaml
+
+from cloud_init.config import CloudInit, NetworkConfig, UserData
+
+YAML_DUMP_OPTIONS = {"indent": 2, "default_flow_style": False, "sort_keys": False}
+
+ADDRESS_SENTINEL = "cloudinitaddresssentinel"
+GATEWAY_SENTINEL = "cloudinitgatewaysentinel"
+
+_resolver = yaml.resolver.Resolver()
+_emitter = yaml.emitter.Emitter(io.StringIO())
+
+
+def _is_plain_scalar(value) -> bool:
+    # True when yaml.dump would emit the string bare, so it can be spliced
+    # into a precompiled document verbatim.
+    if not isinstance(value, str) or not value or " " in value:
+        return False
+    tag = _resolver.resolve(yaml.nodes.ScalarNode, value, (True, False))
+    if tag != "tag:yaml.org,2002:str":
+        return False
+    analysis = _emitter.analyze_scalar(value)
+    return analysis.allow_block_plain and not analysis.multiline
+
+
+class RenderedCloudInit(CloudInit):
+    # A full CloudInit whose user-data and network-config were spliced from
+    # the renderer's precompiled documents rather than serialised again.
+    def __init__(self, user_data: str, network_config: str, **config):
+        super().__init__(**config)
+        self._user_data = user_data
+        self._network_config = network_config
+
+    def generate_user_data(self) -> str:
+        return self._user_data
+
+    def generate_network_config(self) -> str:
+        return self._network_config
+
+
+class CloudInitRenderer:
+    def __init__(
+        self,
+        ssh_user: str,
+        ssh_public_keys_content: list[str],
+        nameservers: list[str],
+        timezone: str = None,
+        package_update: bool = False,
+        packages: list[str] = None,
+        runcmd: list[str] = None,
+    ):
+        self.ssh_user = ssh_user
+        self.ssh_public_keys_content = ssh_public_keys_content
+        self.nameservers = nameservers
+        self.timezone = timezone
+        self.package_update = package_update
+        self.packages = packages
+        self.runcmd = runcmd
+
+        self._user_data_tail = self._compile_user_data()
+        self._network_config_parts = self._compile_network_config()
+
+    @classmethod
+    def from_global_config(
+        cls, ssh_user: str, ssh_public_keys_content: list[str], global_config: dict
+    ) -> "CloudInitRenderer":
+        return cls(
+            ssh_user=ssh_user,
+            ssh_public_keys_content=ssh_public_keys_content,
+            nameservers=global_config.get("nameservers"),
+            timezone=global_config.get("timezone"),
+            package_update=global_config.get("package_update"),
+            packages=global_config.get("packages"),
+            runcmd=global_config.get("runcmd"),
+        )
+
+    def _user_data(self, hostname: str) -> UserData:
+        return UserData(
+            hostname=hostname,
+            ssh_user=self.ssh_user,
+            ssh_public_keys_content=self.ssh_public_keys_content,
+            timezone=self.timezone,
+            package_update=self.package_update,
+            packages=self.packages,
+            runcmd=self.runcmd,
+        )
+
+    def _compile_user_data(self) -> str:
+        # hostname is the first key of the top-level block mapping, so every
+        # following key serializes identically on its own.
+        content = self._user_data("").to_dict()
+        del content["hostname"]
+        return yaml.dump(content, **YAML_DUMP_OPTIONS)
+
+    def _compile_network_config(self) -> list[str]:
+        template = NetworkConfig(
+            ip_address=ADDRESS_SENTINEL,
+            nameservers=self.nameservers,
+            gateway=GATEWAY_SENTINEL,
+        ).to_yaml()
+        head, rest = template.split(ADDRESS_SENTINEL)
+        middle, tail = rest.split(GATEWAY_SENTINEL)
+        return [head, middle, tail]
+
+    def render_user_data(self, hostname: str) -> str:
+        if not _is_plain_scalar(hostname):
+            return self._user_data(hostname).to_yaml()
+        return f"#cloud-config\nhostname: {hostname}\n{self._user_data_tail}"
+
+    def render_network_config(self, ip_address: str, gateway: str) -> str:
+        if not (_is_plain_scalar(f"{ip_address}/24") and _is_plain_scalar(gateway)):
+            return NetworkConfig(
+                ip_address=ip_address, nameservers=self.nameservers, gateway=gateway
+            ).to_yaml()
+        head, middle, tail = self._network_config_parts
+        return f"{head}{ip_address}{middle}{gateway}{tail}"
+
+    def render(self, node_config: dict) -> RenderedCloudInit:
+        hostname = node_config["name"]
+        ip_address = node_config["ip_address"]
+        gateway = node_config["gateway_address"]
+        return RenderedCloudInit(
+            user_data=self.render_user_data(hostname),
+            network_config=self.render_network_config(ip_address, gateway),
+            hostname=hostname,
+            ip_address=ip_address,
+            ssh_user=self.ssh_user,
+            ssh_public_keys_content=self.ssh_public_keys_content,
+            nameservers=self.nameservers,
+            gateway=gateway,
+            timezone=self.timezone,
+            package_update=self.package_update,
+            packages=self.packages,
+            runcmd=self.runcmd,
+        )
+
+    def render_all(self, nodes: list[dict]) -> list[RenderedCloudInit]:
+        return [self.render(node_config) for node_config in nodes]
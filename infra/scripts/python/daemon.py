@@ -0,0 +1,610 @@
+import argparse
+import http.server
+import itertools
+import json
+import os
+import queue
+import signal
+import socketserver
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from urllib.parse import parse_qs, urlsplit
+
+from cli import CLI, build_cli, run_command
+from cloud_init.cache import SeedISOCache
+from daemon_client import DaemonClient, socket_path
+from tracing import get_tracer
+from utils import OSUtils
+from vms.parser import VMConfigParser
+
+# Commands the thin client hands to the daemon; everything else runs locally.
+SERVED_COMMANDS = ("list", "status", "create", "delete")
+# These change the hypervisor, so they queue for the job worker.
+JOB_COMMANDS = ("create", "delete")
+# Global options fixed when the daemon started. A command giving another value
+# needs a CLI built differently and runs locally.
+FIXED_OPTIONS = ("backend", "uri", "iso_builder", "trace_file", "metrics_file")
+# Finished jobs kept for GET /v1/jobs; running and queued ones always are.
+MAX_FINISHED_JOBS = 100
+
+
+@dataclass
+class Job:
+    id: int
+    argv: list[str]
+    args: argparse.Namespace = field(repr=False)
+    status: str = "queued"
+    exit_code: int = None
+    submitted: float = field(default_factory=time.time)
+    started: float = None
+    finished: float = None
+    chunks: list[str] = field(default_factory=list, repr=False)
+    changed: threading.Condition = field(
+        default_factory=threading.Condition, repr=False
+    )
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed")
+
+    def start(self) -> None:
+        with self.changed:
+            self.status = "running"
+            self.started = time.time()
+            self.changed.notify_all()
+
+    def write(self, text: str) -> None:
+        with self.changed:
+            self.chunks.append(text)
+            self.changed.notify_all()
+
+    def finish(self, exit_code: int) -> None:
+        with self.changed:
+            self.exit_code = exit_code
+            self.status = "done" if exit_code == 0 else "failed"
+            self.finished = time.time()
+            self.changed.notify_all()
+
+    def follow(self):
+        # Output so far, then more as it is printed, until the job ends.
+        index = 0
+        while True:
+            with self.changed:
+                while index == len(self.chunks) and not self.done:
+                    self.changed.wait()
+                chunks, index = self.chunks[index:], len(self.chunks)
+                done = self.done
+            yield from chunks
+            if done:
+                return
+
+    def document(self, output: bool = True) -> dict:
+        document = {
+            "id": self.id,
+            "argv": self.argv,
+            "status": self.status,
+            "exit_code": self.exit_code,
+            "submitted": self.submitted,
+            "started": self.started,
+            "finished": self.finished,
+        }
+        if output:
+            document["output"] = "".join(self.chunks)
+        return document
+
+
+def job_argv(body: dict) -> list[str]:
+    # POST /v1/jobs takes {"command": "create", "node": "..."} or {"all": true}
+    # plus the create flags, and runs what the same command line would.
+    command = body.get("command")
+    if command not in JOB_COMMANDS:
+        raise ValueError(f"command must be one of {list(JOB_COMMANDS)}")
+    if body.get("all"):
+        argv = [command, "--all"]
+    elif body.get("node"):
+        argv = [command, str(body["node"])]
+    else:
+        raise ValueError("either 'node' or 'all' is required")
+    if command == "create":
+        for flag in ("resume", "wait", "seed_cache"):
+            if body.get(flag):
+                argv.append("--" + flag.replace("_", "-"))
+        for option in ("parallel", "executor", "timeout"):
+            if body.get(option) is not None:
+                argv += [f"--{option}", str(body[option])]
+    if body.get("no_trace_summary"):
+        argv.insert(0, "--no-trace-summary")
+    return argv
+
+
+class _OutputRouter:
+    # Installed as sys.stdout and sys.stderr. The CLI reports through print():
+    # output of a request thread goes back to its client; anything else (the
+    # job worker and the provisioning pools it fans out to) to the running
+    # job; and with no job running, to the daemon's log.
+    def __init__(self, log):
+        self.log = log
+        self.job = None
+        self._local = threading.local()
+
+    def write(self, text: str) -> int:
+        sink = getattr(self._local, "sink", None) or self.job
+        if sink is not None:
+            sink(text)
+        else:
+            self.log.write(text)
+        return len(text)
+
+    def flush(self) -> None:
+        self.log.flush()
+
+    def __getattr__(self, name: str):
+        return getattr(self.log, name)
+
+    @contextmanager
+    def to(self, sink):
+        previous = getattr(self._local, "sink", None)
+        self._local.sink = sink
+        try:
+            yield
+        finally:
+            self._local.sink = previous
+
+
+class _Server(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    server_version = "vm-provisioner"
+    daemon: "ProvisioningDaemon" = None
+
+    def address_string(self) -> str:
+        return "local"  # Unix socket peers have no address.
+
+    def log_request(self, code="-", size="-") -> None:
+        pass  # Jobs are logged by the daemon; requests would drown them.
+
+    def log_message(self, format: str, *args) -> None:
+        self.daemon.log(format % args)
+
+    def _body(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if not isinstance(body, dict):
+            raise ValueError("request body must be a JSON object")
+        return body
+
+    def send_json(self, status: int, document: dict) -> None:
+        payload = json.dumps(document).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        except OSError:
+            pass  # The client went away; nobody is left to tell.
+
+    def start_stream(self) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.end_headers()
+        self.disconnected = False
+
+    def send_line(self, message: dict) -> None:
+        # A client that went away must not fail the command it started.
+        if self.disconnected:
+            return
+        try:
+            self.wfile.write(json.dumps(message).encode("utf-8") + b"\n")
+            self.wfile.flush()
+        except OSError:
+            self.disconnected = True
+
+    def _job(self, path: str) -> Job:
+        try:
+            return self.daemon.jobs[int(path.rsplit("/", 1)[1])]
+        except (KeyError, ValueError):
+            raise LookupError(f"no job {path.rsplit('/', 1)[1]}") from None
+
+    def do_GET(self) -> None:
+        url = urlsplit(self.path)
+        query = parse_qs(url.query, keep_blank_values=True)
+        try:
+            if url.path == "/v1/health":
+                self.send_json(200, self.daemon.health())
+            elif url.path == "/v1/vms":
+                self.send_json(200, self.daemon.vms())
+            elif url.path == "/v1/status":
+                interval = query.get("interval", [None])[0]
+                self.send_json(
+                    200,
+                    self.daemon.status(
+                        query.get("node", []), float(interval) if interval else None
+                    ),
+                )
+            elif url.path == "/v1/jobs":
+                jobs = self.daemon.jobs_list()
+                self.send_json(
+                    200, {"jobs": [job.document(output=False) for job in jobs]}
+                )
+            elif url.path.startswith("/v1/jobs/"):
+                job = self._job(url.path)
+                if "follow" in query:
+                    self.start_stream()
+                    self.daemon.stream_job(job, self)
+                else:
+                    self.send_json(200, job.document())
+            else:
+                self.send_json(404, {"error": f"no such endpoint: {url.path}"})
+        except LookupError as e:
+            self.send_json(404, {"error": str(e)})
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e) or type(e).__name__})
+
+    def do_POST(self) -> None:
+        url = urlsplit(self.path)
+        try:
+            body = self._body()
+            if url.path == "/v1/jobs":
+                job = self.daemon.submit(job_argv(body))
+                self.send_json(202, job.document())
+            elif url.path == "/v1/cli":
+                self.daemon.serve_cli(body, self)
+            else:
+                self.send_json(404, {"error": f"no such endpoint: {url.path}"})
+        except ValueError as e:
+            self.send_json(400, {"error": str(e)})
+        except Exception as e:
+            self.send_json(500, {"error": str(e) or type(e).__name__})
+
+
+class ProvisioningDaemon:
+    # Keeps one CLI alive between commands: the parsed configuration, SSH
+    # key, cloud-init renderers, journal, hypervisor connection and domain
+    # templates. Reads (list, status) are answered on the request's own
+    # thread; creates and deletes queue for a single worker, one job at a
+    # time, as they would if run one after another from a shell.
+    def __init__(
+        self,
+        parser: argparse.ArgumentParser,
+        args: argparse.Namespace,
+        vm_config_parser: VMConfigParser,
+    ):
+        self.parser = parser
+        self.args = args
+        self.socket_path = args.socket or socket_path()
+        self.config_path = os.path.realpath(vm_config_parser.config_file_path)
+        # Relative paths in the config (cloud-init-data, the journal) resolve
+        # against this, so only clients started here are served.
+        self.cwd = os.path.realpath(os.getcwd())
+        self.tracer = get_tracer()
+        self.started = time.time()
+        self._log_stream = sys.stderr
+        self.output = _OutputRouter(self._log_stream)
+        self._state_lock = threading.Lock()
+        self._stamp = self._config_stamp()
+        self._cli, self._seed_cache = build_cli(args, vm_config_parser)
+        self.generation = 1
+        # Commands using each CLI (by id), and replaced CLIs not yet closed.
+        self._users = {}
+        self._retired = []
+        self.jobs = {}
+        self._jobs_lock = threading.Lock()
+        self._job_ids = itertools.count(1)
+        self._queue = queue.Queue()
+        self._running = None
+        self._running_lock = threading.Lock()
+
+    def log(self, message: str) -> None:
+        print(
+            f"{time.strftime('%Y-%m-%d %H:%M:%S')} {message}",
+            file=self._log_stream,
+            flush=True,
+        )
+
+    def _config_stamp(self) -> tuple:
+        try:
+            stat = os.stat(self.config_path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size, stat.st_ino)
+
+    def current(self) -> tuple[CLI, SeedISOCache]:
+        # A stat per command is enough to notice edits. A config that fails
+        # to load leaves the previous one in service until it changes again.
+        with self._state_lock:
+            stamp = self._config_stamp()
+            if stamp is not None and stamp != self._stamp:
+                self._stamp = stamp
+                try:
+                    self._reload()
+                except Exception as e:
+                    self.log(f"Keeping the previous configuration: {e}")
+            return self._cli, self._seed_cache
+
+    @contextmanager
+    def _using(self):
+        # The current CLI, kept open until the command using it is done even
+        # if a reload replaces it meanwhile.
+        cli_app, seed_cache = self.current()
+        with self._state_lock:
+            self._users[id(cli_app)] = self._users.get(id(cli_app), 0) + 1
+        try:
+            yield cli_app, seed_cache
+        finally:
+            with self._state_lock:
+                self._users[id(cli_app)] -= 1
+                if not self._users[id(cli_app)]:
+                    del self._users[id(cli_app)]
+                self._close_retired()
+
+    def _reload(self) -> None:
+        vm_config_parser = VMConfigParser(self.config_path)
+        previous = self._cli
+        # Jobs already running keep the CLI they started with.
+        same_hypervisor = all(
+            vm_config_parser.hypervisor_config.get(key)
+            == previous.config_parser.hypervisor_config.get(key)
+            for key in ("backend", "uri")
+        )
+        self._cli, self._seed_cache = build_cli(
+            self.args,
+            vm_config_parser,
+            backend=previous.backend if same_hypervisor else None,
+        )
+        self._retired.append(previous)
+        self._close_retired()
+        self.generation += 1
+        self.log(f"Reloaded {self.config_path} (generation {self.generation}).")
+
+    def _close_retired(self) -> None:
+        # Call with the state lock held. The journal's SQLite connection and
+        # the hypervisor connections of replaced CLIs nobody uses any more;
+        # a local backend the current CLI took over stays open.
+        in_use = [cli_app for cli_app in self._retired if id(cli_app) in self._users]
+        live = {id(self._cli.backend)} | {id(cli_app.backend) for cli_app in in_use}
+        for cli_app in self._retired:
+            if cli_app in in_use:
+                continue
+            if cli_app.journal is not None:
+                cli_app.journal.close()
+            if id(cli_app.backend) not in live:
+                cli_app.backend.close()
+            if cli_app.fleet is not None:
+                for host_cli in cli_app.fleet.hosts.values():
+                    host_cli.backend.close()
+        self._retired = in_use
+
+    @staticmethod
+    def _forget_domains(cli_app: CLI) -> None:
+        cli_app.inventory.forget_domains()
+        if cli_app.fleet is not None:
+            for host_cli in cli_app.fleet.hosts.values():
+                host_cli.inventory.forget_domains()
+
+    def _parse(self, argv: list[str]) -> argparse.Namespace:
+        if not isinstance(argv, list) or not all(isinstance(a, str) for a in argv):
+            raise ValueError("argv must be a list of strings")
+        # Usage errors are the client's to print, not the daemon's log's.
+        with self.output.to(lambda text: None):
+            try:
+                return self.parser.parse_args(argv)
+            except SystemExit:
+                raise ValueError(f"invalid arguments: {' '.join(argv)}") from None
+
+    def _forget_unless_busy(self, cli_app: CLI) -> None:
+        # Reads re-list domains to see changes made elsewhere, but not under
+        # a running job, whose inventory is current and in use.
+        with self._running_lock:
+            if self._running is None:
+                self._forget_domains(cli_app)
+
+    def _execute(
+        self, args: argparse.Namespace, cli_app: CLI, seed_cache: SeedISOCache
+    ) -> int:
+        try:
+            return run_command(args, self.parser, cli_app, seed_cache)
+        except SystemExit as e:
+            return e.code if isinstance(e.code, int) else 1
+        except Exception as e:
+            print(f"An unexpected error occurred: {e}")
+            return 1
+
+    def submit(self, argv: list[str], args: argparse.Namespace = None) -> Job:
+        args = args or self._parse(argv)
+        if args.command not in JOB_COMMANDS:
+            raise ValueError(f"'{args.command}' is not a job")
+        job = Job(next(self._job_ids), argv, args)
+        with self._jobs_lock:
+            self.jobs[job.id] = job
+            finished = [old.id for old in self.jobs.values() if old.done]
+            for job_id in finished[: max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+                del self.jobs[job_id]
+        self._queue.put(job)
+        return job
+
+    def jobs_list(self) -> list[Job]:
+        with self._jobs_lock:
+            return list(self.jobs.values())
+
+    def _work(self) -> None:
+        # The only worker: whatever a job raises, it finishes and the next
+        # one runs, or every later job would queue forever.
+        while True:
+            job = self._queue.get()
+            with self._running_lock:
+                self._running = job
+            exit_code = 1
+            try:
+                job.start()
+                self.log(f"Job {job.id} started: {' '.join(job.argv)}")
+                self.tracer.reset()
+                self.output.job = job.write
+                with self._using() as (cli_app, seed_cache):
+                    self._forget_domains(cli_app)
+                    exit_code = self._execute(job.args, cli_app, seed_cache)
+                    tracing_config = cli_app.config_parser.tracing_config
+                self.tracer.finish(
+                    summary=tracing_config.get("summary", True)
+                    and not job.args.no_trace_summary,
+                    trace_file=self.args.trace_file or tracing_config.get("trace_file"),
+                    metrics_file=self.args.metrics_file
+                    or tracing_config.get("metrics_file"),
+                )
+            except Exception as e:
+                print(f"An unexpected error occurred: {e}")
+                exit_code = 1
+            finally:
+                self.output.job = None
+                with self._running_lock:
+                    self._running = None
+                job.finish(exit_code)
+            self.log(f"Job {job.id} {job.status} (exit {exit_code}).")
+
+    def _read(self, args: argparse.Namespace) -> int:
+        # Only jobs report their spans; a read's go to a scope of its own.
+        with self.tracer.scope(), self._using() as (cli_app, seed_cache):
+            self._forget_unless_busy(cli_app)
+            return self._execute(args, cli_app, seed_cache)
+
+    def stream_job(self, job: Job, handler: _Handler) -> None:
+        handler.send_line({"job": job.id})
+        for chunk in job.follow():
+            handler.send_line({"output": chunk})
+        handler.send_line({"exit_code": job.exit_code})
+
+    def _decline(self, args: argparse.Namespace, cwd: str) -> str:
+        if args.command not in SERVED_COMMANDS:
+            return f"'{args.command}' runs locally"
+        if args.command == "status" and args.watch:
+            return "status --watch runs locally"
+        if os.path.realpath(cwd or "") != self.cwd:
+            return f"the daemon serves clients in {self.cwd}"
+        config = os.path.realpath(os.path.join(cwd, os.path.expanduser(args.config)))
+        if config != self.config_path:
+            return f"the daemon serves {self.config_path}"
+        for option in FIXED_OPTIONS:
+            value = getattr(args, option)
+            if value is not None and value != getattr(self.args, option):
+                return f"--{option.replace('_', '-')} differs from the daemon's"
+        return None
+
+    def serve_cli(self, body: dict, handler: _Handler) -> None:
+        # The thin client sends its command line as is; the daemon parses it
+        # with the same parser and runs it through the same dispatch, so a
+        # served command prints exactly what it would have printed locally.
+        argv = body.get("argv") or []
+        try:
+            args = self._parse(argv)
+        except ValueError as e:
+            handler.send_json(409, {"local": True, "reason": str(e)})
+            return
+        reason = self._decline(args, body.get("cwd"))
+        if reason is not None:
+            handler.send_json(409, {"local": True, "reason": reason})
+            return
+
+        handler.start_stream()
+        if args.command in JOB_COMMANDS:
+            self.stream_job(self.submit(argv, args), handler)
+            return
+        with self.output.to(lambda text: handler.send_line({"output": text})):
+            exit_code = self._read(args)
+        handler.send_line({"exit_code": exit_code})
+
+    def health(self) -> dict:
+        with self._running_lock:
+            running = self._running
+        return {
+            "pid": os.getpid(),
+            "config": self.config_path,
+            "cwd": self.cwd,
+            "generation": self.generation,
+            "uptime": time.time() - self.started,
+            "queued": self._queue.qsize(),
+            "running": running.id if running is not None else None,
+        }
+
+    def vms(self) -> dict:
+        with self.tracer.scope(), self._using() as (cli_app, _):
+            self._forget_unless_busy(cli_app)
+            if cli_app.fleet is not None:
+                by_host = cli_app.fleet.domains()
+            else:
+                by_host = {None: cli_app.inventory.domains()}
+        return {
+            "vms": [
+                {"name": name, "host": host}
+                for host, names in by_host.items()
+                for name in names
+            ]
+        }
+
+    def status(self, node_names: list[str], interval: float = None) -> dict:
+        # Same as `status --json`, including the baseline sample the CLI
+        # keeps, so polling no more often than the interval never waits.
+        argv = ["status", "--json", *node_names]
+        if interval is not None:
+            argv += ["--interval", str(interval)]
+        chunks = []
+        with self.output.to(chunks.append):
+            self._read(self._parse(argv))
+        output = "".join(chunks)
+        try:
+            return json.loads(output)
+        except ValueError:
+            raise LookupError(output.strip())
+
+    def _claim_socket(self) -> None:
+        if not os.path.exists(self.socket_path):
+            return
+        try:
+            _, stream = DaemonClient(self.socket_path).request("GET", "/v1/health")
+        except OSError:
+            os.unlink(self.socket_path)  # Left behind by a daemon that died.
+            return
+        stream.close()
+        raise RuntimeError(f"A daemon is already listening on {self.socket_path}")
+
+    def serve(self) -> int:
+        self._claim_socket()
+        handler = type("Handler", (_Handler,), {"daemon": self})
+        # Jobs run sudo on the caller's behalf; only its user may connect.
+        umask = os.umask(0o177)
+        try:
+            server = _Server(self.socket_path, handler)
+        finally:
+            os.umask(umask)
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        threading.Thread(target=self._work, name="jobs", daemon=True).start()
+        sys.stdout = sys.stderr = self.output
+        OSUtils.relay_output = True
+        self.log(
+            f"Serving {self.config_path} on {self.socket_path} (pid {os.getpid()})."
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            os.unlink(self.socket_path)
+            sys.stdout, sys.stderr = sys.__stdout__, sys.__stderr__
+            OSUtils.relay_output = False
+            with self._running_lock:
+                pending = self._queue.qsize() + (self._running is not None)
+            if pending:
+                self.log(
+                    f"Stopped with {pending} job(s) unfinished; "
+                    "`create --resume` continues interrupted nodes."
+                )
+            else:
+                self.log("Stopped.")
+        return 0
@@ -0,0 +1,82 @@
+import json
+import os
+import socket
+import sys
+
+SOCKET_ENV = "VM_PROVISIONER_SOCKET"
+
+
+def default_socket_path() -> str:
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR") or "/tmp"
+    return os.path.join(runtime_dir, f"vm-provisioner-{os.getuid()}.sock")
+
+
+def socket_path() -> str:
+    return os.environ.get(SOCKET_ENV) or default_socket_path()
+
+
+class DaemonClient:
+    # Plain HTTP/1.0 over the daemon's Unix socket. This module is all a
+    # command served by the daemon imports, and http.client alone takes
+    # longer to load than the daemon takes to answer a list.
+    def __init__(self, path: str = None):
+        self.path = path or socket_path()
+
+    def request(self, method: str, path: str, body: dict = None):
+        payload = json.dumps(body).encode("utf-8") if body is not None else b""
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.path)
+            sock.sendall(
+                (
+                    f"{method} {path} HTTP/1.0\r\n"
+                    "Host: localhost\r\n"
+                    "Content-Type: application/json\r\n"
+                    f"Content-Length: {len(payload)}\r\n\r\n"
+                ).encode("ascii")
+                + payload
+            )
+            stream = sock.makefile("rb")
+        finally:
+            sock.close()  # The stream holds the connection open until closed.
+        status_line = stream.readline().split()
+        if len(status_line) < 2:
+            stream.close()
+            raise ConnectionError("Malformed response from the daemon")
+        while stream.readline() not in (b"\r\n", b"\n", b""):
+            pass  # Headers; the body is newline-delimited JSON either way.
+        return int(status_line[1]), stream
+
+
+def run_via_daemon(argv: list[str]) -> int:
+    # Returns the command's exit code, or None when it should run in this
+    # process: no daemon is listening, or the daemon declined the command.
+    if "--no-daemon" in argv:
+        return None
+    try:
+        status, stream = DaemonClient().request(
+            "POST", "/v1/cli", {"argv": argv, "cwd": os.getcwd()}
+        )
+    except OSError:
+        return None
+    job_id = None
+    with stream:
+        if status != 200:
+            stream.read()  # The reason; read so the daemon can finish its reply.
+            return None
+        try:
+            for line in stream:
+                message = json.loads(line)
+                if "output" in message:
+                    sys.stdout.write(message["output"])
+                    sys.stdout.flush()
+                elif "job" in message:
+                    job_id = message["job"]
+                elif "exit_code" in message:
+                    return message["exit_code"]
+        except KeyboardInterrupt:
+            if job_id is not None:
+                print(f"\nJob {job_id} keeps running in the daemon.")
+            return 130
+    print("Error: The daemon closed the connection before the command finished.")
+    return 1
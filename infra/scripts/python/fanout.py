@@ -0,0 +1,147 @@
+import asyncio
+import sys
+import time
+from dataclasses import dataclass
+
+from ssh_pool import SSHSessionPool
+from tables import format_table
+from tracing import get_tracer
+
+DEFAULT_PARALLEL = 16
+# asyncio's default 64 KiB line limit is too small for some command output.
+_LINE_LIMIT = 1024 * 1024
+# ssh itself exits 255 when it cannot connect or authenticate.
+_SSH_FAILURE = 255
+
+
+@dataclass
+class ExecResult:
+    name: str
+    host: str
+    exit_code: int = None
+    duration: float = 0.0
+    error: str = None
+
+    @property
+    def ok(self) -> bool:
+        return self.exit_code == 0
+
+
+class FanOut:
+    def __init__(
+        self,
+        sessions: SSHSessionPool,
+        parallel: int = DEFAULT_PARALLEL,
+        timeout: float = None,
+    ):
+        self.sessions = sessions
+        self.parallel = max(1, int(parallel))
+        self.timeout = timeout
+        self.tracer = get_tracer()
+
+    async def _pump(
+        self, stream: asyncio.StreamReader, tag: str, sink, result: ExecResult
+    ) -> None:
+        # Line-buffered with a node prefix, so interleaved output stays readable.
+        while True:
+            try:
+                line = await stream.readuntil(b"\n")
+            except asyncio.IncompleteReadError as e:
+                line = e.partial  # The last line, unterminated, or EOF.
+                if not line:
+                    return
+            except asyncio.LimitOverrunError:
+                # Longer than the buffer: print it in buffer-sized pieces.
+                line = await stream.read(_LINE_LIMIT)
+                result.error = f"output line over {_LINE_LIMIT // 1024} KiB was split"
+            sink.write(f"{tag} {line.decode(errors='replace').rstrip()}\n")
+            sink.flush()
+
+    async def _run(self, result: ExecResult, command: list[str], tag: str) -> None:
+        if not await self.sessions.open(result.host):
+            # Still attempt the command: it will connect directly and report why.
+            sys.stderr.write(f"{tag} could not open a shared session\n")
+
+        process = await asyncio.create_subprocess_exec(
+            *self.sessions.ssh_command(result.host, *command),
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            limit=_LINE_LIMIT,
+        )
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(
+                    self._pump(process.stdout, tag, sys.stdout, result),
+                    self._pump(process.stderr, tag, sys.stderr, result),
+                    process.wait(),
+                ),
+                self.timeout,
+            )
+        except asyncio.TimeoutError:
+            result.error = f"timed out after {self.timeout:.0f}s"
+        finally:
+            # Whatever stopped the pumps, never leave the ssh behind.
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+        result.exit_code = process.returncode
+        if result.exit_code == _SSH_FAILURE and result.error is None:
+            result.error = "ssh connection failed"
+
+    async def run_node(
+        self,
+        node_config: dict,
+        command: list[str],
+        slots: asyncio.Semaphore,
+        tag_width: int,
+    ) -> ExecResult:
+        result = ExecResult(node_config["name"], node_config["ip_address"])
+        tag = f"[{result.name}]".ljust(tag_width + 2)
+        async with slots:
+            start = time.monotonic()
+            with self.tracer.span("exec", "exec", result.name, command) as span:
+                try:
+                    await self._run(result, command, tag)
+                except (OSError, ValueError) as e:
+                    result.error = str(e)
+                span.exit_code = result.exit_code
+                span.error = result.error
+            result.duration = time.monotonic() - start
+        return result
+
+    async def run_async(
+        self, nodes: list[dict], command: list[str], close: bool = False
+    ) -> list[ExecResult]:
+        slots = asyncio.Semaphore(self.parallel)
+        tag_width = max((len(node["name"]) for node in nodes), default=0)
+        try:
+            return await asyncio.gather(
+                *(self.run_node(node, command, slots, tag_width) for node in nodes)
+            )
+        finally:
+            if close:
+                await self.sessions.close([node["ip_address"] for node in nodes])
+
+    def run(
+        self, nodes: list[dict], command: list[str], close: bool = False
+    ) -> list[ExecResult]:
+        return asyncio.run(self.run_async(nodes, command, close))
+
+
+def format_exec_table(results: list[ExecResult]) -> str:
+    headers = ("NODE", "HOST", "EXIT", "TIME", "ERROR")
+    rows = [
+        (
+            r.name,
+            r.host,
+            str(r.exit_code) if r.exit_code is not None else "-",
+            f"{r.duration:.1f}s",
+            r.error or "",
+        )
+        for r in results
+    ]
+    lines = [format_table(headers, rows)]
+    failed = sum(1 for r in results if not r.ok)
+    lines.append(f"{len(results) - failed}/{len(results)} node(s) succeeded.")
+    return "\n".join(lines)
@@ -0,0 +1,176 @@
+import asyncio
+import os
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+from urllib.parse import urlparse
+
+
+@dataclass
+class HostCapacity:
+    cpus: int
+    memory_kib: int
+    free_memory_kib: int = None
+    storage_free_bytes: int = 0
+    # Domain name -> (vcpus, max memory KiB), running or not.
+    domains: dict = field(default_factory=dict)
+
+    def add_domain(self, name: str, vcpus: int, memory_kib: int) -> None:
+        self.domains[name] = (int(vcpus), int(memory_kib))
+
+    def allocated(self, exclude: tuple = ()) -> tuple[int, int]:
+        sizes = [size for name, size in self.domains.items() if name not in exclude]
+        return sum(v for v, _ in sizes), sum(m for _, m in sizes)
+
+
+def parse_pool_xml(xml: str) -> tuple[str, int]:
+    # libvirt always reports pool sizes in bytes.
+    root = ET.fromstring(xml)
+    return root.findtext("target/path"), int(root.findtext("available") or 0)
+
+
+def pick_storage_pool(pools: list[tuple[str, int]], storage_dir: str = None) -> int:
+    # The pool holding storage_dir if one does, else the roomiest pool.
+    if storage_dir:
+        matching = [
+            (len(path), available)
+            for path, available in pools
+            if path and os.path.commonpath([path, storage_dir]) == path
+        ]
+        if matching:
+            return max(matching)[1]
+    return max((available for _, available in pools), default=0)
+
+
+def volume_xml(
+    name: str, capacity_bytes: int, volume_format: str, backing_path: str = None
+) -> str:
+    volume = ET.Element("volume")
+    ET.SubElement(volume, "name").text = name
+    ET.SubElement(volume, "capacity", {"unit": "bytes"}).text = str(capacity_bytes)
+    target = ET.SubElement(volume, "target")
+    ET.SubElement(target, "format", {"type": volume_format})
+    if backing_path is not None:
+        backing = ET.SubElement(volume, "backingStore")
+        ET.SubElement(backing, "path").text = backing_path
+        ET.SubElement(backing, "format", {"type": "qcow2"})
+    return ET.tostring(volume, encoding="unicode")
+
+
+def snapshot_xml(name: str, disks: dict, memory_path: str = None) -> str:
+    # External snapshot: each disk target mapped to a file gets a new qcow2
+    # overlay there and the current image becomes its read-only backing file;
+    # targets mapped to None (seed ISOs) are left alone.
+    snapshot = ET.Element("domainsnapshot")
+    ET.SubElement(snapshot, "name").text = name
+    if memory_path is not None:
+        ET.SubElement(
+            snapshot, "memory", {"snapshot": "external", "file": memory_path}
+        )
+    else:
+        ET.SubElement(snapshot, "memory", {"snapshot": "no"})
+    disks_elem = ET.SubElement(snapshot, "disks")
+    for target, overlay_path in disks.items():
+        if overlay_path is None:
+            ET.SubElement(disks_elem, "disk", {"name": target, "snapshot": "no"})
+            continue
+        disk = ET.SubElement(
+            disks_elem,
+            "disk",
+            {"name": target, "snapshot": "external", "type": "file"},
+        )
+        ET.SubElement(disk, "driver", {"type": "qcow2"})
+        ET.SubElement(disk, "source", {"file": overlay_path})
+    return ET.tostring(snapshot, encoding="unicode")
+
+
+class HypervisorBackend:
+    name = "base"
+
+    def __init__(self, uri: str = None):
+        self.uri = uri or os.environ.get("LIBVIRT_DEFAULT_URI")
+
+    @property
+    def manages_storage(self) -> bool:
+        # A remote host cannot see files on this machine, so its disks and
+        # seed ISOs are created through libvirt storage pools instead.
+        parsed = urlparse(self.uri or "")
+        return bool(parsed.hostname) or parsed.scheme == "test"
+
+    def list_domains(self) -> list[str]:
+        raise NotImplementedError
+
+    def dump_xml(self, vm_name: str, inactive: bool = False) -> str:
+        raise NotImplementedError
+
+    def define_xml(self, xml: str) -> None:
+        raise NotImplementedError
+
+    def start(self, vm_name: str) -> None:
+        raise NotImplementedError
+
+    def destroy(self, vm_name: str) -> None:
+        raise NotImplementedError
+
+    def undefine(self, vm_name: str) -> None:
+        raise NotImplementedError
+
+    def is_active(self, vm_name: str) -> bool:
+        raise NotImplementedError
+
+    def domain_stats(self) -> dict[str, dict]:
+        # Every domain's state, CPU, balloon, vCPU, block and interface
+        # counters in one bulk query, keyed like `virsh domstats`.
+        raise NotImplementedError
+
+    def suspend(self, vm_name: str) -> None:
+        raise NotImplementedError
+
+    def resume(self, vm_name: str) -> None:
+        raise NotImplementedError
+
+    def create_snapshot(self, vm_name: str, xml: str, disk_only: bool = True) -> None:
+        # Untracked by libvirt (no metadata); callers keep their own record.
+        raise NotImplementedError
+
+    def restore(self, memory_path: str, xml: str) -> None:
+        raise NotImplementedError
+
+    def host_capacity(self, storage_dir: str = None) -> HostCapacity:
+        raise NotImplementedError
+
+    def capabilities(self) -> str:
+        # The host capabilities XML: NUMA cells, their CPUs and page sizes.
+        raise NotImplementedError
+
+    def free_pages(self, size_kib: int) -> dict[int, int]:
+        # Free pages of one hugepage size, per NUMA cell.
+        raise NotImplementedError
+
+    def storage_pool(self, name: str) -> tuple[str, int]:
+        # A storage pool's target directory and available bytes.
+        raise NotImplementedError
+
+    def create_volume(
+        self,
+        base_path: str,
+        new_path: str,
+        capacity_gb: int,
+        cow: bool = True,
+        pool_name: str = None,
+    ) -> str:
+        # In pool_name if given, else in the pool holding base_path.
+        raise NotImplementedError
+
+    def upload_volume(self, local_path: str, base_path: str) -> str:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+    # Async variants run the blocking call on a worker thread by default;
+    # backends that shell out override them to go through the command runner.
+    async def define_xml_async(self, xml: str, runner) -> None:
+        await asyncio.to_thread(self.define_xml, xml)
+
+    async def start_async(self, vm_name: str, runner) -> None:
+        await asyncio.to_thread(self.start, vm_name)
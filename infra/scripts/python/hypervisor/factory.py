@@ -0,0 +1,15 @@
+from hypervisor.base import HypervisorBackend
+from hypervisor.libvirt_api import LibvirtBackend, libvirt
+from hypervisor.virsh import VirshBackend
+
+BACKENDS = ("auto", "libvirt", "virsh")
+
+
+def create_backend(name: str = "auto", uri: str = None) -> HypervisorBackend:
+    if name == "auto":
+        name = "libvirt" if libvirt is not None else "virsh"
+    if name == "libvirt":
+        return LibvirtBackend(uri)
+    if name == "virsh":
+        return VirshBackend(uri)
+    raise ValueError(f"Unknown hypervisor backend: {name}")
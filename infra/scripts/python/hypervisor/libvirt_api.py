@@ -0,0 +1,284 @@
+import os
+import threading
+from contextlib import contextmanager
+
+from hypervisor.base import (
+    HostCapacity,
+    HypervisorBackend,
+    parse_pool_xml,
+    pick_storage_pool,
+    volume_xml,
+)
+from tracing import get_tracer
+
+try:
+    import libvirt
+except ImportError:
+    libvirt = None
+
+
+class LibvirtConnectionPool:
+    def __init__(self, uri: str = None, max_size: int = 4):
+        self.uri = uri
+        self.max_size = max(1, max_size)
+        self._idle = []  # Most recently returned last.
+        self._available = threading.Condition()
+        self._opened = 0
+
+    def _open(self):
+        conn = libvirt.open(self.uri)
+        if conn is None:
+            raise RuntimeError(f"Failed to open libvirt connection to {self.uri}")
+        return conn
+
+    def _get(self):
+        # Waiters are woken both by returned connections and by discarded
+        # ones, whose slot they may reopen (after a libvirtd restart every
+        # connection in use dies at once).
+        dead = []
+        try:
+            with self._available:
+                while True:
+                    while self._idle:
+                        conn = self._idle.pop()
+                        if conn.isAlive():
+                            return conn
+                        self._opened -= 1
+                        dead.append(conn)
+                    if self._opened < self.max_size:
+                        self._opened += 1
+                        break
+                    self._available.wait()
+        finally:
+            for conn in dead:
+                self._close(conn)
+        try:
+            return self._open()
+        except Exception:
+            with self._available:
+                self._opened -= 1
+                self._available.notify()
+            raise
+
+    def _put(self, conn) -> None:
+        with self._available:
+            self._idle.append(conn)
+            self._available.notify()
+
+    @staticmethod
+    def _close(conn) -> None:
+        try:
+            conn.close()
+        except libvirt.libvirtError:
+            pass
+
+    def _discard(self, conn) -> None:
+        with self._available:
+            self._opened -= 1
+            self._available.notify()
+        self._close(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self._get()
+        try:
+            yield conn
+        except libvirt.libvirtError:
+            if not conn.isAlive():
+                self._discard(conn)
+                conn = None
+            raise
+        finally:
+            if conn is not None:
+                self._put(conn)
+
+    def close(self) -> None:
+        with self._available:
+            idle, self._idle = self._idle, []
+            self._opened -= len(idle)
+            self._available.notify_all()
+        for conn in idle:
+            self._close(conn)
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_connection_pool(uri: str = None, max_size: int = 4) -> LibvirtConnectionPool:
+    with _pools_lock:
+        pool = _pools.get(uri)
+        if pool is None:
+            pool = LibvirtConnectionPool(uri, max_size)
+            _pools[uri] = pool
+        return pool
+
+
+class LibvirtBackend(HypervisorBackend):
+    name = "libvirt"
+
+    def __init__(self, uri: str = None, pool_size: int = 4):
+        if libvirt is None:
+            raise RuntimeError(
+                "The libvirt backend requires the 'libvirt-python' package."
+            )
+        super().__init__(uri)
+        self.pool = get_connection_pool(self.uri, pool_size)
+
+    @contextmanager
+    def _call(self, operation: str):
+        # Traced like the virsh commands they replace, for comparable timings.
+        with get_tracer().span(f"libvirt {operation}", category="command"):
+            with self.pool.connection() as conn:
+                yield conn
+
+    def list_domains(self) -> list[str]:
+        with self._call("list") as conn:
+            return [domain.name() for domain in conn.listAllDomains()]
+
+    def dump_xml(self, vm_name: str, inactive: bool = False) -> str:
+        flags = libvirt.VIR_DOMAIN_XML_INACTIVE if inactive else 0
+        with self._call("dumpxml") as conn:
+            return conn.lookupByName(vm_name).XMLDesc(flags)
+
+    def define_xml(self, xml: str) -> None:
+        with self._call("define") as conn:
+            conn.defineXML(xml)
+
+    def start(self, vm_name: str) -> None:
+        with self._call("start") as conn:
+            conn.lookupByName(vm_name).create()
+
+    def destroy(self, vm_name: str) -> None:
+        with self._call("destroy") as conn:
+            conn.lookupByName(vm_name).destroy()
+
+    def undefine(self, vm_name: str) -> None:
+        with self._call("undefine") as conn:
+            conn.lookupByName(vm_name).undefine()
+
+    def is_active(self, vm_name: str) -> bool:
+        with self._call("domstate") as conn:
+            return bool(conn.lookupByName(vm_name).isActive())
+
+    def domain_stats(self) -> dict[str, dict]:
+        groups = (
+            libvirt.VIR_DOMAIN_STATS_STATE
+            | libvirt.VIR_DOMAIN_STATS_CPU_TOTAL
+            | libvirt.VIR_DOMAIN_STATS_BALLOON
+            | libvirt.VIR_DOMAIN_STATS_VCPU
+            | libvirt.VIR_DOMAIN_STATS_INTERFACE
+            | libvirt.VIR_DOMAIN_STATS_BLOCK
+        )
+        with self._call("domstats") as conn:
+            return {
+                domain.name(): stats
+                for domain, stats in conn.getAllDomainStats(groups)
+            }
+
+    def suspend(self, vm_name: str) -> None:
+        with self._call("suspend") as conn:
+            conn.lookupByName(vm_name).suspend()
+
+    def resume(self, vm_name: str) -> None:
+        with self._call("resume") as conn:
+            conn.lookupByName(vm_name).resume()
+
+    def create_snapshot(self, vm_name: str, xml: str, disk_only: bool = True) -> None:
+        flags = (
+            libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_NO_METADATA
+            | libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_ATOMIC
+        )
+        if disk_only:
+            flags |= libvirt.VIR_DOMAIN_SNAPSHOT_CREATE_DISK_ONLY
+        with self._call("snapshot-create") as conn:
+            conn.lookupByName(vm_name).snapshotCreateXML(xml, flags)
+
+    def restore(self, memory_path: str, xml: str) -> None:
+        with self._call("restore") as conn:
+            conn.restoreFlags(memory_path, xml, libvirt.VIR_DOMAIN_SAVE_RUNNING)
+
+    def host_capacity(self, storage_dir: str = None) -> HostCapacity:
+        with self._call("capacity") as conn:
+            # getInfo: [model, memory MiB, cpus, mhz, nodes, sockets, cores, threads]
+            info = conn.getInfo()
+            capacity = HostCapacity(cpus=info[2], memory_kib=info[1] * 1024)
+            try:
+                capacity.free_memory_kib = conn.getFreeMemory() // 1024
+            except libvirt.libvirtError:
+                pass
+            for domain in conn.listAllDomains():
+                # info: [state, max memory KiB, memory KiB, vcpus, cpu time]
+                _, max_memory_kib, _, vcpus, _ = domain.info()
+                capacity.add_domain(domain.name(), vcpus, max_memory_kib)
+            pools = [
+                parse_pool_xml(pool.XMLDesc())
+                for pool in conn.listAllStoragePools()
+                if pool.isActive()
+            ]
+        capacity.storage_free_bytes = pick_storage_pool(pools, storage_dir)
+        return capacity
+
+    def capabilities(self) -> str:
+        with self._call("capabilities") as conn:
+            return conn.getCapabilities()
+
+    def free_pages(self, size_kib: int) -> dict[int, int]:
+        with self._call("freepages") as conn:
+            cells = conn.getInfo()[4]
+            pages = conn.getFreePages([size_kib], 0, cells)
+        return {int(cell): int(sizes.get(size_kib, 0)) for cell, sizes in pages.items()}
+
+    def _replace_volume(self, pool, name: str, xml: str, clone_from=None):
+        # Match qemu-img and mkisofs, which overwrite an existing file.
+        try:
+            pool.storageVolLookupByName(name).delete(0)
+        except libvirt.libvirtError:
+            pass
+        if clone_from is not None:
+            return pool.createXMLFrom(xml, clone_from, 0)
+        return pool.createXML(xml, 0)
+
+    def storage_pool(self, name: str) -> tuple[str, int]:
+        with self._call("pool-info") as conn:
+            return parse_pool_xml(conn.storagePoolLookupByName(name).XMLDesc())
+
+    def create_volume(
+        self,
+        base_path: str,
+        new_path: str,
+        capacity_gb: int,
+        cow: bool = True,
+        pool_name: str = None,
+    ) -> str:
+        name = os.path.basename(new_path)
+        capacity = capacity_gb * 1024**3
+        with self._call("vol-create") as conn:
+            base = conn.storageVolLookupByPath(base_path)
+            if pool_name is not None:
+                pool = conn.storagePoolLookupByName(pool_name)
+            else:
+                pool = base.storagePoolLookupByVolume()
+            if cow:
+                xml = volume_xml(name, capacity, "qcow2", backing_path=base_path)
+                volume = self._replace_volume(pool, name, xml)
+            else:
+                xml = volume_xml(name, capacity, "qcow2")
+                volume = self._replace_volume(pool, name, xml, clone_from=base)
+            return volume.path()
+
+    def upload_volume(self, local_path: str, base_path: str) -> str:
+        name = os.path.basename(local_path)
+        size = os.path.getsize(local_path)
+        with self._call("vol-upload") as conn:
+            pool = conn.storageVolLookupByPath(base_path).storagePoolLookupByVolume()
+            volume = self._replace_volume(pool, name, volume_xml(name, size, "raw"))
+            stream = conn.newStream(0)
+            volume.upload(stream, 0, size, 0)
+            with open(local_path, "rb") as f:
+                stream.sendAll(lambda _stream, nbytes, handle: handle.read(nbytes), f)
+            stream.finish()
+            return volume.path()
+
+    def close(self) -> None:
+        self.pool.close()
@@ -0,0 +1,271 @@
+import os
+import re
+import subprocess
+import uuid
+
+from hypervisor.base import (
+    HostCapacity,
+    HypervisorBackend,
+    parse_pool_xml,
+    pick_storage_pool,
+    volume_xml,
+)
+from utils import AsyncCommandRunner, OSUtils
+
+TMP_XML_PREFIX = "/tmp/vm-"
+
+_FIELD_RE = re.compile(r"^\s*([^:]+?)\s*:\s*(\d+)", re.MULTILINE)
+_DOMSTATS_GROUPS = (
+    "--state",
+    "--cpu-total",
+    "--balloon",
+    "--vcpu",
+    "--interface",
+    "--block",
+)
+
+
+def _fields(output: str) -> dict[str, int]:
+    # "CPU(s):  16" / "Memory size:  65536000 KiB" / "free  :  1234 KiB"
+    return {key: int(value) for key, value in _FIELD_RE.findall(output)}
+
+
+def _parse_freepages(output: str, size_kib: int) -> dict[int, int]:
+    # "Node 0:" headers, each followed by "2048KiB: 512" lines.
+    pages = {}
+    cell = None
+    for line in output.splitlines():
+        node = re.match(r"^Node (\d+):", line)
+        if node:
+            cell = int(node.group(1))
+            continue
+        size = re.match(r"^\s*(\d+)KiB:\s*(\d+)", line)
+        if size and cell is not None and int(size.group(1)) == size_kib:
+            pages[cell] = int(size.group(2))
+    return pages
+
+
+def _parse_domstats(output: str) -> dict[str, dict]:
+    # "Domain: 'name'" headers, each followed by indented "key=value" lines.
+    domains = {}
+    stats = None
+    for line in output.splitlines():
+        if line.startswith("Domain: "):
+            stats = domains.setdefault(line[len("Domain: ") :].strip().strip("'"), {})
+        elif stats is not None and "=" in line:
+            key, value = line.strip().split("=", 1)
+            try:
+                stats[key] = int(value)
+            except ValueError:
+                try:
+                    stats[key] = float(value)
+                except ValueError:
+                    stats[key] = value
+    return domains
+
+
+class VirshBackend(HypervisorBackend):
+    name = "virsh"
+
+    def _virsh(self, *args: str) -> list[str]:
+        # sudo drops LIBVIRT_DEFAULT_URI, so pass the URI explicitly.
+        command = ["virsh"]
+        if self.uri:
+            command += ["-c", self.uri]
+        return command + list(args)
+
+    def list_domains(self) -> list[str]:
+        output = OSUtils.run_command(
+            self._virsh("list", "--all", "--name"), check_output=True
+        )
+        return [name for name in output.splitlines() if name.strip()]
+
+    def dump_xml(self, vm_name: str, inactive: bool = False) -> str:
+        args = ["dumpxml", vm_name] + (["--inactive"] if inactive else [])
+        return OSUtils.run_command(self._virsh(*args), check_output=True)
+
+    def _write_xml(self, xml: str) -> str:
+        xml_path = f"{TMP_XML_PREFIX}{uuid.uuid4()}.xml"
+        with open(xml_path, "w") as file:
+            file.write(xml)
+        return xml_path
+
+    def define_xml(self, xml: str) -> None:
+        xml_path = self._write_xml(xml)
+
+        try:
+            OSUtils.run_command(self._virsh("define", "--file", xml_path), sudo=True)
+        finally:
+            os.remove(xml_path)
+
+    async def define_xml_async(self, xml: str, runner: AsyncCommandRunner) -> None:
+        xml_path = self._write_xml(xml)
+
+        try:
+            await runner.run_command(
+                self._virsh("define", "--file", xml_path), sudo=True
+            )
+        finally:
+            os.remove(xml_path)
+
+    def start(self, vm_name: str) -> None:
+        OSUtils.run_command(self._virsh("start", vm_name), sudo=True)
+
+    async def start_async(self, vm_name: str, runner: AsyncCommandRunner) -> None:
+        await runner.run_command(self._virsh("start", vm_name), sudo=True)
+
+    def destroy(self, vm_name: str) -> None:
+        OSUtils.run_command(
+            self._virsh("destroy", vm_name), sudo=True, capture_output=False
+        )
+
+    def undefine(self, vm_name: str) -> None:
+        OSUtils.run_command(self._virsh("undefine", vm_name), sudo=True)
+
+    def _output(self, *args: str) -> str:
+        return OSUtils.run_command(self._virsh(*args), check_output=True)
+
+    def is_active(self, vm_name: str) -> bool:
+        return self._output("domstate", vm_name).strip() not in ("shut off", "crashed")
+
+    def domain_stats(self) -> dict[str, dict]:
+        return _parse_domstats(self._output("domstats", *_DOMSTATS_GROUPS))
+
+    def suspend(self, vm_name: str) -> None:
+        OSUtils.run_command(self._virsh("suspend", vm_name), sudo=True)
+
+    def resume(self, vm_name: str) -> None:
+        OSUtils.run_command(self._virsh("resume", vm_name), sudo=True)
+
+    def create_snapshot(self, vm_name: str, xml: str, disk_only: bool = True) -> None:
+        xml_path = self._write_xml(xml)
+        args = ["snapshot-create", vm_name, "--xmlfile", xml_path]
+        args += ["--no-metadata", "--atomic"]
+        if disk_only:
+            args.append("--disk-only")
+        try:
+            OSUtils.run_command(self._virsh(*args), sudo=True)
+        finally:
+            os.remove(xml_path)
+
+    def restore(self, memory_path: str, xml: str) -> None:
+        xml_path = self._write_xml(xml)
+        try:
+            OSUtils.run_command(
+                self._virsh("restore", memory_path, "--xml", xml_path, "--running"),
+                sudo=True,
+            )
+        finally:
+            os.remove(xml_path)
+
+    def host_capacity(self, storage_dir: str = None) -> HostCapacity:
+        nodeinfo = _fields(self._output("nodeinfo"))
+        capacity = HostCapacity(
+            cpus=nodeinfo["CPU(s)"], memory_kib=nodeinfo["Memory size"]
+        )
+        try:
+            capacity.free_memory_kib = _fields(self._output("nodememstats")).get(
+                "free"
+            )
+        except subprocess.CalledProcessError:
+            pass
+        for name in self.list_domains():
+            dominfo = _fields(self._output("dominfo", name))
+            capacity.add_domain(name, dominfo["CPU(s)"], dominfo["Max memory"])
+        pools = [
+            parse_pool_xml(self._output("pool-dumpxml", pool))
+            for pool in self._output("pool-list", "--name").split()
+        ]
+        capacity.storage_free_bytes = pick_storage_pool(pools, storage_dir)
+        return capacity
+
+    def capabilities(self) -> str:
+        return self._output("capabilities")
+
+    def free_pages(self, size_kib: int) -> dict[int, int]:
+        output = self._output("freepages", "--pagesize", str(size_kib), "--all")
+        return _parse_freepages(output, size_kib)
+
+    def _volume_pool(self, path: str) -> str:
+        return OSUtils.run_command(
+            self._virsh("vol-pool", path), check_output=True, sudo=True
+        )
+
+    def _delete_volume(self, pool: str, name: str) -> None:
+        # Match qemu-img and mkisofs, which overwrite an existing file.
+        try:
+            OSUtils.run_command(
+                self._virsh("vol-delete", "--pool", pool, name),
+                check_output=True,
+                sudo=True,
+            )
+        except subprocess.CalledProcessError:
+            pass
+
+    def _volume_path(self, pool: str, name: str) -> str:
+        return OSUtils.run_command(
+            self._virsh("vol-path", "--pool", pool, name), check_output=True, sudo=True
+        )
+
+    def storage_pool(self, name: str) -> tuple[str, int]:
+        return parse_pool_xml(self._output("pool-dumpxml", name))
+
+    def create_volume(
+        self,
+        base_path: str,
+        new_path: str,
+        capacity_gb: int,
+        cow: bool = True,
+        pool_name: str = None,
+    ) -> str:
+        name = os.path.basename(new_path)
+        pool = pool_name or self._volume_pool(base_path)
+        self._delete_volume(pool, name)
+        if cow:
+            command = self._virsh(
+                "vol-create-as",
+                pool,
+                name,
+                f"{capacity_gb}G",
+                "--format",
+                "qcow2",
+                "--backing-vol",
+                base_path,
+                "--backing-vol-format",
+                "qcow2",
+            )
+        elif pool_name is None:
+            command = self._virsh("vol-clone", "--pool", pool, base_path, name)
+        else:
+            # vol-clone stays within the source's pool; copy across instead.
+            xml_path = self._write_xml(
+                volume_xml(name, capacity_gb * 1024**3, "qcow2")
+            )
+            try:
+                OSUtils.run_command(
+                    self._virsh("vol-create-from", pool, xml_path, base_path),
+                    check_output=True,
+                    sudo=True,
+                )
+            finally:
+                os.remove(xml_path)
+            return self._volume_path(pool, name)
+        OSUtils.run_command(command, check_output=True, sudo=True)
+        return self._volume_path(pool, name)
+
+    def upload_volume(self, local_path: str, base_path: str) -> str:
+        name = os.path.basename(local_path)
+        pool = self._volume_pool(base_path)
+        self._delete_volume(pool, name)
+        size = os.path.getsize(local_path)
+        OSUtils.run_command(
+            self._virsh("vol-create-as", pool, name, f"{size}b", "--format", "raw"),
+            check_output=True,
+            sudo=True,
+        )
+        OSUtils.run_command(
+            self._virsh("vol-upload", "--pool", pool, name, local_path),
+            check_output=True,
+            sudo=True,
+        )
+        return self._volume_path(pool, name)
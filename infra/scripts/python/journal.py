@@ -0,0 +1,250 @@
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+DEFAULT_JOURNAL_PATH = "provision-journal.db"
+STEPS = ("iso", "disk", "define", "start")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS steps (
+    node TEXT NOT NULL,
+    step TEXT NOT NULL,
+    status TEXT NOT NULL,
+    artifact TEXT,
+    pid INTEGER NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (node, step)
+);
+CREATE TABLE IF NOT EXISTS placements (
+    node TEXT PRIMARY KEY,
+    host TEXT NOT NULL,
+    uri TEXT,
+    updated REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    node TEXT NOT NULL,
+    name TEXT NOT NULL,
+    image TEXT NOT NULL,
+    overlay TEXT NOT NULL,
+    memory TEXT,
+    created REAL NOT NULL,
+    PRIMARY KEY (node, name)
+);
+"""
+
+
+def _pid_alive(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass
+class JournalStep:
+    node: str
+    step: str
+    status: str
+    artifact: str = None
+    pid: int = None
+    updated: float = None
+
+    @property
+    def done(self) -> bool:
+        return self.status == "done"
+
+    @property
+    def in_progress(self) -> bool:
+        # A step left "started" by a dead process was interrupted mid-way.
+        return self.status == "started" and _pid_alive(self.pid)
+
+
+@dataclass
+class ResumePoint:
+    iso_path: str = None
+    disk_path: str = None
+    defined: bool = False
+    started: bool = False
+
+    @property
+    def completed(self) -> list[str]:
+        done = (self.iso_path, self.disk_path, self.defined, self.started)
+        return [step for step, ok in zip(STEPS, done) if ok]
+
+
+@dataclass
+class SnapshotRecord:
+    node: str
+    name: str
+    # Frozen at snapshot time; `overlay` is the disk the domain wrote to after.
+    image: str
+    overlay: str
+    memory: str = None
+    created: float = None
+
+
+class ProvisionJournal:
+    # Write-ahead record of every provisioning step per node: a step is
+    # marked "started" before it runs and "done" or "failed" after, each in
+    # its own committed transaction, so an interrupted run can be resumed
+    # or cleaned up from what is on disk.
+    def __init__(self, path: str = DEFAULT_JOURNAL_PATH):
+        self.path = os.path.abspath(path)
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self, create: bool) -> sqlite3.Connection:
+        # Opened on first use, and created only by a write, so commands that
+        # never provision leave no database behind. Call with the lock held.
+        if self._db is None:
+            if not create and not os.path.exists(self.path):
+                return None
+            self._db = sqlite3.connect(
+                self.path, timeout=30, isolation_level=None, check_same_thread=False
+            )
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=FULL")
+            self._db.executescript(_SCHEMA)
+        return self._db
+
+    def _query(self, query: str, params: tuple = ()) -> list[tuple]:
+        with self._lock:
+            db = self._connect(create=False)
+            return db.execute(query, params).fetchall() if db is not None else []
+
+    def _record(self, entry: JournalStep) -> None:
+        entry.updated = time.time()
+        with self._lock:
+            self._connect(create=True).execute(
+                "INSERT OR REPLACE INTO steps VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    entry.node,
+                    entry.step,
+                    entry.status,
+                    entry.artifact,
+                    entry.pid,
+                    entry.updated,
+                ),
+            )
+
+    @contextmanager
+    def step(self, node: str, step: str):
+        entry = JournalStep(node, step, "started", pid=os.getpid())
+        self._record(entry)
+        try:
+            yield entry
+        except BaseException:
+            entry.status = "failed"
+            self._record(entry)
+            raise
+        entry.status = "done"
+        self._record(entry)
+
+    def entries(self, node: str = None) -> list[JournalStep]:
+        query = "SELECT * FROM steps"
+        params = ()
+        if node is not None:
+            query += " WHERE node = ?"
+            params = (node,)
+        rows = self._query(query, params)
+        return sorted(
+            (JournalStep(*row) for row in rows),
+            key=lambda entry: (entry.node, STEPS.index(entry.step)),
+        )
+
+    def reset(self, node: str) -> None:
+        with self._lock:
+            db = self._connect(create=False)
+            if db is not None:
+                db.execute("DELETE FROM steps WHERE node = ?", (node,))
+
+    def record_placement(self, node: str, host: str, uri: str) -> None:
+        with self._lock:
+            self._connect(create=True).execute(
+                "INSERT OR REPLACE INTO placements VALUES (?, ?, ?, ?)",
+                (node, host, uri, time.time()),
+            )
+
+    def placements(self) -> dict[str, str]:
+        rows = self._query("SELECT node, host FROM placements")
+        return dict(rows)
+
+    def forget_placement(self, node: str) -> None:
+        with self._lock:
+            db = self._connect(create=False)
+            if db is not None:
+                db.execute("DELETE FROM placements WHERE node = ?", (node,))
+
+    def record_snapshot(self, record: SnapshotRecord) -> None:
+        record.created = record.created or time.time()
+        with self._lock:
+            self._connect(create=True).execute(
+                "INSERT INTO snapshots VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    record.node,
+                    record.name,
+                    record.image,
+                    record.overlay,
+                    record.memory,
+                    record.created,
+                ),
+            )
+
+    def snapshots(self, node: str = None) -> list[SnapshotRecord]:
+        query = "SELECT * FROM snapshots"
+        params = ()
+        if node is not None:
+            query += " WHERE node = ?"
+            params = (node,)
+        rows = self._query(query + " ORDER BY created", params)
+        return [SnapshotRecord(*row) for row in rows]
+
+    def forget_snapshots(self, node: str, names: list[str] = None) -> None:
+        with self._lock:
+            db = self._connect(create=False)
+            if db is None:
+                return
+            if names is None:
+                db.execute("DELETE FROM snapshots WHERE node = ?", (node,))
+                return
+            db.executemany(
+                "DELETE FROM snapshots WHERE node = ? AND name = ?",
+                [(node, name) for name in names],
+            )
+
+    def resume_point(self, node: str, domain_exists: bool) -> ResumePoint:
+        steps = {entry.step: entry for entry in self.entries(node)}
+        if not steps:
+            # Never journaled: the domain predates the journal or was made by
+            # hand, so treat it as complete like a plain create would.
+            return ResumePoint(defined=domain_exists, started=domain_exists)
+
+        def artifact(step: str) -> str:
+            entry = steps.get(step)
+            if entry is None or not entry.done or not entry.artifact:
+                return None
+            return entry.artifact if os.path.exists(entry.artifact) else None
+
+        # libvirt's define is atomic, so an existing domain counts as defined
+        # even if the run died before the journal recorded it.
+        start = steps.get("start")
+        return ResumePoint(
+            iso_path=artifact("iso"),
+            disk_path=artifact("disk"),
+            defined=domain_exists,
+            started=domain_exists and start is not None and start.done,
+        )
+
+    def close(self) -> None:
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
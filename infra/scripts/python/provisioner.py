@@ -0,0 +1,277 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from tables import format_table
+from tracing import get_tracer
+from utils import AsyncCommandRunner
+
+PHASES = ("iso", "disk", "define")
+EXECUTORS = ("threads", "asyncio")
+
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_PHASE_LIMITS = {
+    "iso": 4,
+    "disk": 2,
+    "define": 4,
+}
+
+
+@dataclass
+class NodeResult:
+    name: str
+    role: str
+    status: str = "pending"
+    phase: str = None
+    error: str = None
+    duration: float = 0.0
+    host: str = None
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("created", "skipped")
+
+
+class Provisioner:
+    def __init__(
+        self,
+        cli,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        phase_limits: dict = None,
+        resume: bool = False,
+    ):
+        self.cli = cli
+        self.max_workers = max(1, int(max_workers))
+        self.resume = resume
+        limits = dict(DEFAULT_PHASE_LIMITS)
+        limits.update(phase_limits or {})
+        self.phase_limits = {phase: max(1, int(limits[phase])) for phase in PHASES}
+        self._phase_semaphores = {
+            phase: threading.BoundedSemaphore(limit)
+            for phase, limit in self.phase_limits.items()
+        }
+        self.tracer = get_tracer()
+
+    def _run_phase(
+        self, result: NodeResult, phase: str, func, *args, name: str = None
+    ):
+        result.phase = phase
+        queued = time.monotonic()
+        step = name or phase
+        with self._phase_semaphores[phase]:
+            with self.tracer.span(step) as span:
+                span.attrs["queued_seconds"] = round(time.monotonic() - queued, 6)
+                with self.cli.journal_step(result.name, step) as entry:
+                    value = func(*args)
+                    if isinstance(value, str):
+                        entry.artifact = value
+                    return value
+
+    def provision_node(self, node_config: dict, role: str) -> NodeResult:
+        result = NodeResult(name=node_config["name"], role=role)
+        with self.tracer.span("provision", category="node", node=result.name) as span:
+            self._provision_node(node_config, result)
+            span.attrs["status"] = result.status
+            if not result.ok:
+                span.error = result.error
+        return result
+
+    def _provision_node(self, node_config: dict, result: NodeResult) -> None:
+        start = time.monotonic()
+
+        try:
+            resume = self.cli.resume_point(node_config, self.resume)
+            if resume.started:
+                result.status = "skipped"
+                print(f"VM {result.name} already exists. Skipping creation.")
+                return
+            if resume.completed:
+                print(f"Resuming {result.name} after {resume.completed[-1]}.")
+
+            cloud_init_iso_path = resume.iso_path
+            if cloud_init_iso_path is None and not resume.defined:
+                cloud_init_iso_path = self._run_phase(
+                    result, "iso", self.cli.build_cloud_init_iso, node_config
+                )
+            vm_builder = self.cli.make_vm_builder(node_config, cloud_init_iso_path)
+            if not resume.defined:
+                new_disk_path = resume.disk_path or self._run_phase(
+                    result, "disk", vm_builder.prepare_disk
+                )
+                self._run_phase(result, "define", vm_builder.define_vm, new_disk_path)
+            self._run_phase(result, "define", vm_builder.start_vm, name="start")
+
+            result.status = "created"
+            result.phase = None
+            print(f"VM {result.name} created and started successfully.")
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e).strip() or type(e).__name__
+            print(f"Error creating VM {result.name} during {result.phase}: {e}")
+        finally:
+            result.duration = time.monotonic() - start
+
+    def provision(self, tiers: list[tuple[str, list[dict]]]) -> list[NodeResult]:
+        results = []
+        failed_role = None
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for role, nodes in tiers:
+                if failed_role is not None:
+                    results.extend(
+                        NodeResult(
+                            name=node["name"],
+                            role=role,
+                            status="blocked",
+                            error=f"{failed_role} tier did not come up",
+                        )
+                        for node in nodes
+                    )
+                    continue
+
+                tier_results = list(
+                    executor.map(lambda node: self.provision_node(node, role), nodes)
+                )
+                results.extend(tier_results)
+                if not all(r.ok for r in tier_results):
+                    failed_role = role
+
+        return results
+
+
+class AsyncProvisioner(Provisioner):
+    # Runs every node on a single event loop. Concurrency is bounded by the
+    # runner's per-tool limits and max_workers nodes in flight, not by threads.
+    def __init__(
+        self,
+        cli,
+        runner: AsyncCommandRunner = None,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        resume: bool = False,
+    ):
+        super().__init__(cli, max_workers=max_workers, resume=resume)
+        self.runner = runner if runner is not None else AsyncCommandRunner()
+
+    async def _run_phase_async(
+        self, result: NodeResult, phase: str, coro, name: str = None
+    ):
+        result.phase = phase
+        step = name or phase
+        with self.tracer.span(step):
+            with self.cli.journal_step(result.name, step) as entry:
+                value = await coro
+                if isinstance(value, str):
+                    entry.artifact = value
+                return value
+
+    async def _provision_node_async(
+        self, node_config: dict, result: NodeResult
+    ) -> None:
+        start = time.monotonic()
+
+        try:
+            resume = await asyncio.to_thread(
+                self.cli.resume_point, node_config, self.resume
+            )
+            if resume.started:
+                result.status = "skipped"
+                print(f"VM {result.name} already exists. Skipping creation.")
+                return
+            if resume.completed:
+                print(f"Resuming {result.name} after {resume.completed[-1]}.")
+
+            cloud_init_iso_path = resume.iso_path
+            if cloud_init_iso_path is None and not resume.defined:
+                cloud_init_iso_path = await self._run_phase_async(
+                    result,
+                    "iso",
+                    self.cli.build_cloud_init_iso_async(node_config, self.runner),
+                )
+            vm_builder = self.cli.make_vm_builder(node_config, cloud_init_iso_path)
+            if not resume.defined:
+                new_disk_path = resume.disk_path or await self._run_phase_async(
+                    result, "disk", vm_builder.prepare_disk_async(self.runner)
+                )
+                await self._run_phase_async(
+                    result,
+                    "define",
+                    vm_builder.define_vm_async(new_disk_path, self.runner),
+                )
+            await self._run_phase_async(
+                result, "define", vm_builder.start_vm_async(self.runner), name="start"
+            )
+
+            result.status = "created"
+            result.phase = None
+            print(f"VM {result.name} created and started successfully.")
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e).strip() or type(e).__name__
+            print(f"Error creating VM {result.name} during {result.phase}: {e}")
+        finally:
+            result.duration = time.monotonic() - start
+
+    async def provision_node_async(
+        self, node_config: dict, role: str, slots: asyncio.Semaphore
+    ) -> NodeResult:
+        result = NodeResult(name=node_config["name"], role=role)
+        async with slots:
+            with self.tracer.span("provision", "node", result.name) as span:
+                await self._provision_node_async(node_config, result)
+                span.attrs["status"] = result.status
+                if not result.ok:
+                    span.error = result.error
+        return result
+
+    async def provision_async(
+        self, tiers: list[tuple[str, list[dict]]]
+    ) -> list[NodeResult]:
+        results = []
+        failed_role = None
+        slots = asyncio.Semaphore(self.max_workers)
+
+        for role, nodes in tiers:
+            if failed_role is not None:
+                results.extend(
+                    NodeResult(
+                        name=node["name"],
+                        role=role,
+                        status="blocked",
+                        error=f"{failed_role} tier did not come up",
+                    )
+                    for node in nodes
+                )
+                continue
+
+            tier_results = await asyncio.gather(
+                *(self.provision_node_async(node, role, slots) for node in nodes)
+            )
+            results.extend(tier_results)
+            if not all(r.ok for r in tier_results):
+                failed_role = role
+
+        return results
+
+    def provision(self, tiers: list[tuple[str, list[dict]]]) -> list[NodeResult]:
+        return asyncio.run(self.provision_async(tiers))
+
+
+def format_results_table(results: list[NodeResult]) -> str:
+    headers = ("NODE", "ROLE", "STATUS", "PHASE", "TIME", "ERROR")
+    rows = [
+        (
+            r.name,
+            r.role,
+            r.status,
+            r.phase or "-",
+            f"{r.duration:.1f}s",
+            r.error.splitlines()[0] if r.error else "",
+        )
+        for r in results
+    ]
+    if any(r.host for r in results):
+        headers = headers[:2] + ("HOST",) + headers[2:]
+        rows = [row[:2] + (r.host or "-",) + row[2:] for row, r in zip(rows, results)]
+    return format_table(headers, rows)
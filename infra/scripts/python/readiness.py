@@ -0,0 +1,178 @@
+import asyncio
+import re
+import subprocess
+import time
+from dataclasses import dataclass
+
+from ssh_pool import SSHSessionPool
+from tables import format_table
+from tracing import get_tracer
+from utils import AsyncCommandRunner
+
+DEFAULT_DEADLINE = 600.0
+DEFAULT_POLL_INTERVAL = 2.0
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_SSH_TIMEOUT = 30.0
+
+_STATUS_RE = re.compile(r"^status:\s*(\S+)", re.MULTILINE)
+# ssh itself exits 255 when it cannot connect or authenticate.
+_SSH_FAILURE = 255
+
+
+@dataclass
+class NodeReadiness:
+    name: str
+    host: str
+    status: str = "pending"
+    tcp_seconds: float = None
+    ready_seconds: float = None
+    detail: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status == "ready"
+
+
+class ReadinessWaiter:
+    def __init__(
+        self,
+        ssh_user: str,
+        private_key_path: str,
+        port: int = 22,
+        deadline: float = DEFAULT_DEADLINE,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        connect_timeout: float = DEFAULT_CONNECT_TIMEOUT,
+        runner: AsyncCommandRunner = None,
+    ):
+        self.ssh_user = ssh_user
+        self.private_key_path = private_key_path
+        self.port = int(port)
+        self.deadline = float(deadline)
+        self.poll_interval = float(poll_interval)
+        self.connect_timeout = float(connect_timeout)
+        self.runner = runner if runner is not None else AsyncCommandRunner()
+        self.sessions = SSHSessionPool(
+            ssh_user, private_key_path, port=self.port, connect_timeout=connect_timeout
+        )
+        self.tracer = get_tracer()
+
+    @classmethod
+    def from_config(cls, config_parser, deadline: float = None) -> "ReadinessWaiter":
+        config = config_parser.readiness_config
+        return cls(
+            config_parser.ssh_user,
+            config_parser.ssh_private_key_path,
+            port=config.get("port", 22),
+            deadline=deadline or config.get("deadline_seconds", DEFAULT_DEADLINE),
+            poll_interval=config.get("poll_interval", DEFAULT_POLL_INTERVAL),
+            connect_timeout=config.get("connect_timeout", DEFAULT_CONNECT_TIMEOUT),
+            runner=AsyncCommandRunner(
+                {"ssh": config.get("max_ssh_sessions", 16)},
+                timeout=config.get("ssh_timeout_seconds", DEFAULT_SSH_TIMEOUT),
+                retries=0,
+            ),
+        )
+
+    def ssh_command(self, host: str, *remote: str) -> list[str]:
+        return self.sessions.ssh_command(host, *remote)
+
+    async def _ssh_banner(self, host: str, timeout: float) -> bool:
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, self.port), timeout
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False
+        try:
+            banner = await asyncio.wait_for(reader.readline(), timeout)
+            return banner.startswith(b"SSH-")
+        except (OSError, asyncio.TimeoutError):
+            return False
+        finally:
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except OSError:
+                pass
+
+    async def _cloud_init_status(self, host: str, remaining: float) -> str:
+        # A hung session must not carry the wait past the deadline.
+        timeout = min(self.runner.timeout or DEFAULT_SSH_TIMEOUT, max(remaining, 0.1))
+        try:
+            output = await self.runner.run_command(
+                self.ssh_command(host, "cloud-init", "status"),
+                check_output=True,
+                timeout=timeout,
+            )
+        except subprocess.CalledProcessError as e:
+            if e.returncode == _SSH_FAILURE:
+                return "unreachable"
+            # cloud-init status exits non-zero for error and degraded states.
+            output = e.output or ""
+        except subprocess.TimeoutExpired:
+            return "unreachable"
+        match = _STATUS_RE.search(output)
+        return match.group(1) if match else "unknown"
+
+    async def wait_node(self, node_config: dict, started: float) -> NodeReadiness:
+        result = NodeReadiness(node_config["name"], node_config["ip_address"])
+        deadline_at = started + self.deadline
+
+        with self.tracer.span("wait_ready", "readiness", result.name) as span:
+            while True:
+                if result.tcp_seconds is None:
+                    timeout = min(
+                        self.connect_timeout, max(deadline_at - time.monotonic(), 0.1)
+                    )
+                    if await self._ssh_banner(result.host, timeout):
+                        result.tcp_seconds = time.monotonic() - started
+                        result.status = "ssh"
+                    else:
+                        result.detail = f"no SSH banner on port {self.port}"
+                if result.tcp_seconds is not None:
+                    status = await self._cloud_init_status(
+                        result.host, deadline_at - time.monotonic()
+                    )
+                    result.detail = f"cloud-init {status}"
+                    if status == "done":
+                        result.status = "ready"
+                        result.ready_seconds = time.monotonic() - started
+                        break
+                    if status == "error":
+                        result.status = "failed"
+                        break
+                remaining = deadline_at - time.monotonic()
+                if remaining <= 0:
+                    result.status = "timeout"
+                    break
+                await asyncio.sleep(min(self.poll_interval, remaining))
+            span.attrs["status"] = result.status
+            if not result.ok:
+                span.error = result.detail or result.status
+
+        return result
+
+    async def wait_async(self, nodes: list[dict]) -> list[NodeReadiness]:
+        started = time.monotonic()
+        return await asyncio.gather(
+            *(self.wait_node(node_config, started) for node_config in nodes)
+        )
+
+    def wait(self, nodes: list[dict]) -> list[NodeReadiness]:
+        return asyncio.run(self.wait_async(nodes))
+
+
+def format_readiness_table(results: list[NodeReadiness]) -> str:
+    headers = ("NODE", "HOST", "STATUS", "SSH", "READY", "DETAIL")
+    rows = [
+        (
+            r.name,
+            r.host,
+            r.status,
+            f"{r.tcp_seconds:.1f}s" if r.tcp_seconds is not None else "-",
+            f"{r.ready_seconds:.1f}s" if r.ready_seconds is not None else "-",
+            r.detail,
+        )
+        for r in results
+    ]
+    return format_table(headers, rows)
@@ -0,0 +1,228 @@
+import os
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from provisioner import DEFAULT_MAX_WORKERS, NodeResult, Provisioner
+from vms.domain import DomainSpec, apply_resources, memory_gb_to_kib
+from vms.layers import is_bake_domain
+
+ACTIONS = ("create", "delete", "resize", "replace")
+
+
+@dataclass
+class PlannedChange:
+    action: str
+    name: str
+    role: str = "-"
+    changes: list[str] = field(default_factory=list)
+    node_config: dict = None
+    disks: list[str] = field(default_factory=list)  # Removed with the domain.
+
+
+class Reconciler:
+    def __init__(self, cli):
+        self.cli = cli
+        self.config_parser = cli.config_parser
+        self.inventory = cli.inventory
+
+    def _observe(self, vm_name: str) -> DomainSpec:
+        return DomainSpec.from_xml(self.inventory.domain_xml(vm_name))
+
+    def _accepted_disks(self, node_config: dict) -> tuple[list, set]:
+        vm_builder = self.cli.make_vm_builder(node_config, None)
+        expected_disks = vm_builder.expected_disk_paths()
+        # After a snapshot the node runs on that snapshot's overlay instead.
+        journal = self.cli.journal
+        snapshots = journal.snapshots(node_config["name"]) if journal else []
+        return expected_disks, set(expected_disks) | {
+            record.overlay for record in snapshots
+        }
+
+    def _stale_disks(self, node_config: dict, live: DomainSpec) -> tuple[list, list]:
+        # The overlays a replaced node ran on that its replacement will not
+        # reuse; once the journal is reset nothing else records their paths.
+        # Only our own go, and only where this machine can reach; the rest
+        # are listed in the plan to be removed by hand.
+        name = node_config["name"]
+        _, accepted = self._accepted_disks(node_config)
+        journal = self.cli.journal
+        recorded = {
+            entry.artifact
+            for entry in (journal.entries(name) if journal else [])
+            if entry.step == "disk"
+        }
+        stale, kept = [], []
+        for path in live.disk_paths:
+            if path in accepted:
+                continue
+            ours = path in recorded or os.path.basename(path) == f"{name}.qcow2"
+            if ours and not self.cli.backend.manages_storage:
+                stale.append(path)
+            else:
+                kept.append(f"keeps old disk {path}")
+        return stale, kept
+
+    def _drift(self, node_config: dict, live: DomainSpec) -> tuple[list, list]:
+        resize, replace = [], []
+        if live.vcpu != node_config["vcpu"]:
+            resize.append(f"vcpu {live.vcpu} -> {node_config['vcpu']}")
+        memory_kib = memory_gb_to_kib(node_config["memory_gb"])
+        if live.memory_kib != memory_kib:
+            resize.append(
+                f"memory {live.memory_kib // 1024}MiB -> {memory_kib // 1024}MiB"
+            )
+
+        mac_address = node_config["mac_address"].lower()
+        if mac_address not in live.mac_addresses:
+            live_macs = ",".join(live.mac_addresses) or "-"
+            replace.append(f"mac {live_macs} -> {mac_address}")
+
+        expected_disks, accepted = self._accepted_disks(node_config)
+        if not accepted & set(live.disk_paths):
+            live_disks = ",".join(live.disk_paths) or "-"
+            replace.append(f"disk {live_disks} -> {' or '.join(expected_disks)}")
+        # set_resources leaves the vcpupin and numatune of a placed domain
+        # sized for the old shape; it needs placing again from scratch.
+        if resize and live.pinned:
+            replace.append("pinned to host CPUs/NUMA cell")
+        return resize, replace
+
+    def plan(self) -> list[PlannedChange]:
+        domains = set(self.inventory.domains())
+        desired = {}
+        for role, nodes in (
+            ("master", self.config_parser.master_nodes),
+            ("worker", self.config_parser.worker_nodes),
+        ):
+            for node_config in nodes:
+                desired[node_config["name"]] = (role, node_config)
+
+        planned = []
+        for name, (role, node_config) in desired.items():
+            if name not in domains:
+                planned.append(PlannedChange("create", name, role, [], node_config))
+                continue
+            live = self._observe(name)
+            resize, replace = self._drift(node_config, live)
+            if replace:
+                stale, kept = self._stale_disks(node_config, live)
+                changes = replace + resize + kept
+                planned.append(
+                    PlannedChange("replace", name, role, changes, node_config, stale)
+                )
+            elif resize:
+                planned.append(PlannedChange("resize", name, role, resize, node_config))
+
+        # Only domains carrying our metadata marker are ever deleted.
+        base_vm_name = self.config_parser.base_vm_name
+        for name in sorted(domains - desired.keys()):
+            if name == base_vm_name or is_bake_domain(base_vm_name, name):
+                continue
+            if self._observe(name).managed:
+                planned.append(PlannedChange("delete", name, changes=["not in config"]))
+
+        return planned
+
+    def _resize(self, change: PlannedChange) -> None:
+        node_config = change.node_config
+        root = ET.fromstring(self.cli.backend.dump_xml(change.name, inactive=True))
+        apply_resources(root, node_config["vcpu"], node_config["memory_gb"])
+        self.cli.backend.define_xml(
+            ET.tostring(root, encoding="unicode", xml_declaration=True)
+        )
+        self.inventory.add_domain(change.name)
+
+    def _run(self, change: PlannedChange) -> NodeResult:
+        result = NodeResult(name=change.name, role=change.role, phase=change.action)
+        start = time.monotonic()
+        try:
+            if change.action == "resize":
+                self._resize(change)
+                result.status = "resized"
+            else:
+                self.cli.remove_domain(change.name, change.disks)
+                result.status = "deleted"
+            result.phase = None
+        except Exception as e:
+            result.status = "failed"
+            result.error = str(e).strip() or type(e).__name__
+        finally:
+            result.duration = time.monotonic() - start
+        return result
+
+    def apply(
+        self,
+        planned: list[PlannedChange],
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        phase_limits: dict = None,
+        allow_replace: bool = False,
+    ) -> list[NodeResult]:
+        results = []
+        replaced = []
+        in_place = []
+        for change in planned:
+            if change.action == "replace" and not allow_replace:
+                results.append(
+                    NodeResult(
+                        name=change.name,
+                        role=change.role,
+                        status="skipped",
+                        phase="replace",
+                        error="needs rebuilding; rerun with --replace",
+                    )
+                )
+            elif change.action == "replace":
+                replaced.append(change)
+            elif change.action in ("resize", "delete"):
+                in_place.append(change)
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+            results.extend(executor.map(self._run, in_place))
+            for result in executor.map(
+                lambda change: self._run(
+                    PlannedChange("delete", change.name, disks=change.disks)
+                ),
+                replaced,
+            ):
+                if result.status == "failed":
+                    results.append(result)
+
+        failed = {result.name for result in results if result.status == "failed"}
+        creates = [change for change in planned if change.action == "create"] + [
+            change for change in replaced if change.name not in failed
+        ]
+        provisioner = Provisioner(self.cli, max_workers, phase_limits)
+        results.extend(
+            provisioner.provision(
+                [
+                    (role, [c.node_config for c in creates if c.role == role])
+                    for role in ("master", "worker")
+                ]
+            )
+        )
+        return results
+
+
+def format_plan(planned: list[PlannedChange]) -> str:
+    if not planned:
+        return "No changes. Live state matches the configuration."
+    symbols = {"create": "+", "delete": "-", "resize": "~", "replace": "-/+"}
+    lines = []
+    for change in planned:
+        details = f" ({'; '.join(change.changes)})" if change.changes else ""
+        lines.append(
+            f"  {symbols[change.action]:>3} {change.action:<7} {change.name}{details}"
+        )
+    counts = {action: 0 for action in ACTIONS}
+    for change in planned:
+        counts[change.action] += 1
+    if counts["resize"]:
+        lines.append("Resized domains pick up new vCPU/memory on their next boot.")
+    lines.append(
+        "Plan: "
+        + ", ".join(f"{counts[action]} to {action}" for action in ACTIONS)
+        + "."
+    )
+    return "\n".join(lines)
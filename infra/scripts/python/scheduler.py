@@ -0,0 +1,347 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+from hypervisor.base import HostCapacity
+from hypervisor.factory import create_backend
+from provisioner import NodeResult
+from tables import format_table
+from tracing import get_tracer
+from vms.domain import memory_gb_to_kib
+
+GIB = 1024**3
+
+
+@dataclass
+class HostSpec:
+    name: str
+    uri: str
+    backend: str = None
+    cpu_overcommit: float = 1.0
+    memory_overcommit: float = 1.0
+    disk_overcommit: float = 1.0
+    reserved_memory_gb: float = 0.0
+
+    @classmethod
+    def from_config(cls, spec: dict) -> "HostSpec":
+        try:
+            return cls(
+                name=spec["name"],
+                uri=spec["uri"],
+                backend=spec.get("backend"),
+                cpu_overcommit=float(spec.get("cpu_overcommit", 1.0)),
+                memory_overcommit=float(spec.get("memory_overcommit", 1.0)),
+                disk_overcommit=float(spec.get("disk_overcommit", 1.0)),
+                reserved_memory_gb=float(spec.get("reserved_memory_gb", 0.0)),
+            )
+        except KeyError as e:
+            raise ValueError(f"Hypervisor host is missing required key: {e}")
+
+
+def node_demand(node_config: dict) -> tuple[int, int, int]:
+    return (
+        int(node_config["vcpu"]),
+        memory_gb_to_kib(node_config["memory_gb"]),
+        int(node_config["disk_gb"]) * GIB,
+    )
+
+
+@dataclass
+class HostState:
+    spec: HostSpec
+    capacity: HostCapacity = None
+    error: str = None
+    budget: tuple = (0, 0, 0)
+    free: list = field(default_factory=lambda: [0, 0, 0])
+    placed: list[str] = field(default_factory=list)
+
+    @classmethod
+    def from_capacity(
+        cls, spec: HostSpec, capacity: HostCapacity, exclude: tuple = ()
+    ) -> "HostState":
+        allocated_vcpus, allocated_kib = capacity.allocated(exclude)
+        vcpus = capacity.cpus * spec.cpu_overcommit - allocated_vcpus
+        memory_kib = capacity.memory_kib * spec.memory_overcommit - allocated_kib
+        # What is actually free caps the budget unless memory is overcommitted.
+        if capacity.free_memory_kib is not None and spec.memory_overcommit <= 1:
+            memory_kib = min(memory_kib, capacity.free_memory_kib)
+        memory_kib -= memory_gb_to_kib(spec.reserved_memory_gb)
+        disk_bytes = capacity.storage_free_bytes * spec.disk_overcommit
+        budget = (max(vcpus, 0), max(memory_kib, 0), max(disk_bytes, 0))
+        return cls(spec, capacity, budget=budget, free=list(budget))
+
+    @property
+    def up(self) -> bool:
+        return self.error is None
+
+    def fits(self, demand: tuple) -> bool:
+        return self.up and all(need <= free for need, free in zip(demand, self.free))
+
+    def take(self, name: str, demand: tuple) -> None:
+        self.free = [free - need for need, free in zip(demand, self.free)]
+        self.placed.append(name)
+
+
+@dataclass
+class Placement:
+    name: str
+    host: str = None
+    reason: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.host is not None
+
+
+class PlacementScheduler:
+    # Best-fit decreasing bin packing over vCPU, memory and disk. Nodes that
+    # already exist stay where they are, pinned nodes (`host:`) go where they
+    # are told, and nodes placed by an earlier run return to the same host if
+    # it still has room so their journaled artifacts can be reused.
+    def __init__(self, hosts: list[HostState], recorded: dict[str, str] = None):
+        self.hosts = {host.spec.name: host for host in hosts}
+        self.recorded = recorded or {}
+
+    def _existing_host(self, name: str) -> str:
+        for host in self.hosts.values():
+            if host.up and name in host.capacity.domains:
+                return host.spec.name
+        return None
+
+    def _pack(self, name: str, demand: tuple) -> Placement:
+        candidates = [host for host in self.hosts.values() if host.fits(demand)]
+        if not candidates:
+            vcpu, memory_kib, disk_bytes = demand
+            return Placement(
+                name,
+                reason=f"no host has room for {vcpu} vCPU, "
+                f"{memory_kib / 1024**2:.1f} GiB memory, "
+                f"{disk_bytes / GIB:.0f} GiB disk",
+            )
+        # Tightest fit first keeps large holes open for large nodes.
+        order = list(self.hosts)
+        best = min(
+            candidates,
+            key=lambda host: (
+                host.free[1] - demand[1],
+                host.free[0] - demand[0],
+                order.index(host.spec.name),
+            ),
+        )
+        best.take(name, demand)
+        return Placement(name, best.spec.name, "packed")
+
+    def _place(self, node_config: dict) -> Placement:
+        name = node_config["name"]
+        demand = node_demand(node_config)
+        pinned = node_config.get("host")
+        if pinned is not None:
+            host = self.hosts.get(pinned)
+            if host is None:
+                return Placement(name, reason=f"unknown host '{pinned}'")
+            if not host.up:
+                return Placement(name, reason=f"host {pinned} is down: {host.error}")
+            if not host.fits(demand):
+                return Placement(name, reason=f"does not fit on pinned host {pinned}")
+            host.take(name, demand)
+            return Placement(name, pinned, "pinned")
+
+        recorded = self.hosts.get(self.recorded.get(name))
+        if recorded is not None and recorded.fits(demand):
+            recorded.take(name, demand)
+            return Placement(name, recorded.spec.name, "recorded")
+        return self._pack(name, demand)
+
+    def place(self, nodes: list[dict]) -> list[Placement]:
+        placements = {}
+        pending = []
+        for node_config in nodes:
+            existing = self._existing_host(node_config["name"])
+            if existing is not None:
+                # Already running there and already counted in its allocation.
+                placements[node_config["name"]] = Placement(
+                    node_config["name"], existing, "existing"
+                )
+            else:
+                pending.append(node_config)
+
+        pending.sort(
+            key=lambda node: (
+                node.get("host") is None,
+                node["name"] not in self.recorded,
+                tuple(-value for value in node_demand(node)),
+            )
+        )
+        for node_config in pending:
+            placements[node_config["name"]] = self._place(node_config)
+        return [placements[node_config["name"]] for node_config in nodes]
+
+
+class HostFleet:
+    def __init__(self, cli, specs: list[HostSpec], default_backend: str = "auto"):
+        names = [spec.name for spec in specs]
+        if len(set(names)) != len(names):
+            raise ValueError("Duplicate hypervisor host names in config")
+        self.cli = cli
+        self.specs = specs
+        self.hosts = {
+            spec.name: cli.for_host(
+                create_backend(spec.backend or default_backend, spec.uri)
+            )
+            for spec in specs
+        }
+        self.tracer = get_tracer()
+
+    def _survey_host(self, spec: HostSpec) -> HostState:
+        host_cli = self.hosts[spec.name]
+        base_vm_name = host_cli.config_parser.base_vm_name
+        try:
+            with self.tracer.span("host_capacity", "schedule") as span:
+                span.attrs["host"] = spec.name
+                root = host_cli.inventory.domain_xml(base_vm_name)
+                source = root.find(".//disk[@device='disk']/source[@file]")
+                storage_dir = (
+                    os.path.dirname(source.get("file")) if source is not None else None
+                )
+                capacity = host_cli.backend.host_capacity(storage_dir)
+        except Exception as e:
+            reason = str(e).strip().splitlines()[0] if str(e).strip() else ""
+            return HostState(spec, error=reason or type(e).__name__)
+        # The base VM is a template that is never started.
+        return HostState.from_capacity(spec, capacity, exclude=(base_vm_name,))
+
+    def survey(self) -> list[HostState]:
+        with ThreadPoolExecutor(max_workers=len(self.specs)) as executor:
+            return list(executor.map(self._survey_host, self.specs))
+
+    def schedule(
+        self, nodes: list[dict], record: bool = True
+    ) -> tuple[list[HostState], list[Placement]]:
+        journal = self.cli.journal
+        with self.tracer.span("schedule", "schedule"):
+            states = self.survey()
+            recorded = journal.placements() if journal is not None else {}
+            placements = PlacementScheduler(states, recorded).place(nodes)
+        if record and journal is not None:
+            uris = {spec.name: spec.uri for spec in self.specs}
+            for placement in placements:
+                if placement.ok:
+                    journal.record_placement(
+                        placement.name, placement.host, uris[placement.host]
+                    )
+        return states, placements
+
+    def host_for(self, node_config: dict):
+        states, placements = self.schedule([node_config])
+        print(format_placements(placements))
+        placement = placements[0]
+        return self.hosts[placement.host] if placement.ok else None
+
+    def locate(self, vm_name: str):
+        journal = self.cli.journal
+        recorded = journal.placements().get(vm_name) if journal is not None else None
+        candidates = [recorded] if recorded in self.hosts else []
+        candidates += [name for name in self.hosts if name != recorded]
+        for name in candidates:
+            if self.hosts[name].vm_exists(vm_name):
+                return self.hosts[name]
+        return None
+
+    def domains(self) -> dict[str, list[str]]:
+        return {
+            name: host_cli.inventory.domains() for name, host_cli in self.hosts.items()
+        }
+
+    def _provision_host(
+        self, host: str, role: str, nodes: list[dict], make_provisioner
+    ) -> list[NodeResult]:
+        results = make_provisioner(self.hosts[host]).provision([(role, nodes)])
+        for result in results:
+            result.host = host
+        return results
+
+    def provision(
+        self, tiers: list[tuple[str, list[dict]]], make_provisioner
+    ) -> list[NodeResult]:
+        states, placements = self.schedule(
+            [node for _, nodes in tiers for node in nodes]
+        )
+        print(format_hosts(states))
+        print(format_placements(placements))
+        print()
+        placed = {placement.name: placement for placement in placements}
+
+        results = []
+        failed_role = None
+        # Hosts provision in parallel; each runs its own bounded provisioner.
+        with ThreadPoolExecutor(max_workers=len(self.hosts)) as executor:
+            for role, nodes in tiers:
+                if failed_role is not None:
+                    results.extend(
+                        NodeResult(
+                            name=node["name"],
+                            role=role,
+                            status="blocked",
+                            error=f"{failed_role} tier did not come up",
+                        )
+                        for node in nodes
+                    )
+                    continue
+
+                by_host = {}
+                tier_results = {}
+                for node in nodes:
+                    placement = placed[node["name"]]
+                    if placement.ok:
+                        by_host.setdefault(placement.host, []).append(node)
+                    else:
+                        tier_results[node["name"]] = NodeResult(
+                            name=node["name"],
+                            role=role,
+                            status="failed",
+                            phase="schedule",
+                            error=placement.reason,
+                        )
+                futures = [
+                    executor.submit(
+                        self._provision_host, host, role, host_nodes, make_provisioner
+                    )
+                    for host, host_nodes in by_host.items()
+                ]
+                for future in futures:
+                    tier_results.update({r.name: r for r in future.result()})
+                ordered = [tier_results[node["name"]] for node in nodes]
+                results.extend(ordered)
+                if not all(r.ok for r in ordered):
+                    failed_role = role
+
+        return results
+
+
+def format_hosts(states: list[HostState]) -> str:
+    rows = []
+    for state in states:
+        if not state.up:
+            rows.append(
+                (state.spec.name, state.spec.uri, "-", "-", "-", "-", state.error)
+            )
+            continue
+        used = [budget - free for budget, free in zip(state.budget, state.free)]
+        rows.append(
+            (
+                state.spec.name,
+                state.spec.uri,
+                f"{used[0]:.0f}/{state.budget[0]:.0f}",
+                f"{used[1] / 1024**2:.1f}/{state.budget[1] / 1024**2:.1f}G",
+                f"{used[2] / GIB:.0f}/{state.budget[2] / GIB:.0f}G",
+                str(len(state.placed)),
+                "up",
+            )
+        )
+    headers = ("HOST", "URI", "VCPU", "MEMORY", "DISK", "NEW", "STATUS")
+    return format_table(headers, rows)
+
+
+def format_placements(placements: list[Placement]) -> str:
+    rows = [(p.name, p.host or "-", p.reason) for p in placements]
+    return format_table(("NODE", "HOST", "PLACEMENT"), rows)
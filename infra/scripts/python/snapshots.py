@@ -0,0 +1,285 @@
+import os
+import re
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+
+from hypervisor.base import snapshot_xml
+from journal import SnapshotRecord
+from tables import format_table
+from tracing import get_tracer
+from utils import OSUtils
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9][A-Za-z0-9_.-]*$")
+
+
+@dataclass
+class SnapshotResult:
+    name: str
+    action: str
+    status: str = "pending"
+    seconds: float = None
+    detail: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return self.status in ("snapshotted", "reset")
+
+
+def _main_disk(root: ET.Element) -> tuple[str, str]:
+    for disk in root.findall(".//disk[@device='disk']"):
+        source = disk.find("source")
+        target = disk.find("target")
+        if source is not None and source.get("file") and target is not None:
+            return target.get("dev"), source.get("file")
+    raise ValueError(f"No file-backed disk in domain {root.findtext('name')}")
+
+
+class ClusterSnapshots:
+    # External qcow2 snapshots of every node at once. Taking snapshot S
+    # freezes each node's current disk as S's image and continues on a fresh
+    # overlay; resetting to S throws away everything written since (including
+    # later snapshots, which sit above S in the chain) and boots, or restores
+    # the saved memory of, a new empty overlay on S's image.
+    def __init__(self, cli, max_workers: int = 8):
+        if cli.journal is None:
+            raise ValueError("Snapshots are recorded in provisioning.journal")
+        if cli.fleet is not None or cli.backend.manages_storage:
+            raise ValueError("Snapshots need the nodes' disks on this machine")
+        self.cli = cli
+        self.backend = cli.backend
+        self.journal = cli.journal
+        self.max_workers = max(1, int(max_workers))
+        self.tracer = get_tracer()
+
+    def _map(self, func, items: list) -> list:
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(func, items))
+
+    def _timed(self, result: SnapshotResult, func, *args) -> SnapshotResult:
+        started = time.monotonic()
+        with self.tracer.span(result.action, "snapshot", result.name) as span:
+            try:
+                func(*args)
+            except Exception as e:
+                result.status = "failed"
+                result.detail = str(e).strip() or type(e).__name__
+                span.error = result.detail
+            span.attrs["status"] = result.status
+        result.seconds = time.monotonic() - started
+        return result
+
+    @staticmethod
+    def check_name(name: str) -> None:
+        if not _NAME_RE.match(name):
+            raise ValueError(
+                f"Invalid snapshot name '{name}': use letters, digits, '.', '_', '-'"
+            )
+
+    def _snapshot_node(
+        self, vm_name: str, name: str, memory: bool, result: SnapshotResult
+    ) -> None:
+        if any(record.name == name for record in self.journal.snapshots(vm_name)):
+            raise ValueError(f"snapshot '{name}' already exists")
+        root = ET.fromstring(self.backend.dump_xml(vm_name))
+        target, image = _main_disk(root)
+        disk_dir = os.path.dirname(image)
+        overlay = os.path.join(disk_dir, f"{vm_name}.{name}.qcow2")
+        memory_path = (
+            os.path.join(disk_dir, f"{vm_name}.{name}.mem")
+            if memory and self.backend.is_active(vm_name)
+            else None
+        )
+        disks = {target: overlay}
+        for disk in root.findall(".//devices/disk"):
+            dev = disk.find("target")
+            if dev is not None and dev.get("dev") != target:
+                disks[dev.get("dev")] = None
+        self.backend.create_snapshot(
+            vm_name,
+            snapshot_xml(name, disks, memory_path),
+            disk_only=memory_path is None,
+        )
+        self.cli.inventory.add_domain(vm_name)
+        self.journal.record_snapshot(
+            SnapshotRecord(vm_name, name, image, overlay, memory_path)
+        )
+        result.status = "snapshotted"
+        result.detail = "disk and memory" if memory_path else "disk"
+
+    def take(
+        self, name: str, nodes: list[dict], memory: bool = False
+    ) -> list[SnapshotResult]:
+        self.check_name(name)
+        names = [node_config["name"] for node_config in nodes]
+        # A name some nodes already hold is an earlier take that partly
+        # failed: finish it on the rest rather than leave it half recorded.
+        taken = {
+            record.node for record in self.journal.snapshots() if record.name == name
+        }
+        if taken and taken.issuperset(names):
+            raise ValueError(f"Snapshot '{name}' already exists; reset to it instead")
+        results = {vm_name: SnapshotResult(vm_name, "snapshot") for vm_name in names}
+        for vm_name in taken.intersection(names):
+            results[vm_name].status = "snapshotted"
+            results[vm_name].detail = "taken earlier"
+        present = [
+            vm_name
+            for vm_name in names
+            if vm_name not in taken and self.cli.vm_exists(vm_name)
+        ]
+        for vm_name in set(names) - set(present) - taken:
+            results[vm_name].status = "failed"
+            results[vm_name].detail = "not defined"
+
+        # Pause the whole cluster first so every disk is captured at the same
+        # moment, not staggered by however long the slowest node takes.
+        active = self._map(self.backend.is_active, present)
+        running = [vm_name for vm_name, up in zip(present, active) if up]
+        paused = []
+        try:
+            for vm_name, error in zip(running, self._map(self._try_suspend, running)):
+                if error is None:
+                    paused.append(vm_name)
+            self._map(
+                lambda vm_name: self._timed(
+                    results[vm_name],
+                    self._snapshot_node,
+                    vm_name,
+                    name,
+                    memory,
+                    results[vm_name],
+                ),
+                present,
+            )
+        finally:
+            self._map(self.backend.resume, paused)
+        return [results[vm_name] for vm_name in names]
+
+    def _try_suspend(self, vm_name: str) -> str:
+        try:
+            self.backend.suspend(vm_name)
+        except Exception as e:
+            return str(e)
+        return None
+
+    def _reset_node(self, vm_name: str, name: str, result: SnapshotResult) -> None:
+        records = self.journal.snapshots(vm_name)
+        index = next((i for i, r in enumerate(records) if r.name == name), None)
+        if index is None:
+            raise ValueError(f"no snapshot '{name}'")
+        record, later = records[index], records[index + 1 :]
+
+        if self.backend.is_active(vm_name):
+            self.backend.destroy(vm_name)
+        root = ET.fromstring(self.backend.dump_xml(vm_name, inactive=True))
+        _, current = _main_disk(root)
+        discard = {current, record.overlay}
+        for newer in later:
+            discard.update((newer.image, newer.overlay, newer.memory))
+        discard -= {None, record.image, record.memory}
+        if discard:
+            OSUtils.run_command(["rm", "-f", *sorted(discard)], sudo=True)
+        if later:
+            self.journal.forget_snapshots(vm_name, [newer.name for newer in later])
+
+        OSUtils.run_command(
+            [
+                "qemu-img",
+                "create",
+                "-f",
+                "qcow2",
+                "-b",
+                record.image,
+                "-F",
+                "qcow2",
+                record.overlay,
+            ],
+            sudo=True,
+        )
+        for disk in root.findall(".//disk[@device='disk']"):
+            source = disk.find("source")
+            if source is not None and source.get("file") == current:
+                source.set("file", record.overlay)
+                backing = disk.find("backingStore")
+                if backing is not None:
+                    disk.remove(backing)
+        xml = ET.tostring(root, encoding="unicode")
+        self.backend.define_xml(xml)
+        self.cli.inventory.add_domain(vm_name)
+
+        if record.memory and os.path.exists(record.memory):
+            self.backend.restore(record.memory, xml)
+            result.detail = "memory restored"
+        else:
+            self.backend.start(vm_name)
+            result.detail = "booted from disk"
+        result.status = "reset"
+
+    def reset(self, name: str, nodes: list[dict]) -> list[SnapshotResult]:
+        self.check_name(name)
+        results = [SnapshotResult(node["name"], "reset") for node in nodes]
+        present = []
+        for result in results:
+            if self.cli.vm_exists(result.name):
+                present.append(result)
+            else:
+                result.status = "failed"
+                result.detail = "not defined"
+        self._map(
+            lambda result: self._timed(
+                result, self._reset_node, result.name, name, result
+            ),
+            present,
+        )
+        return results
+
+    def discard(self, vm_name: str) -> None:
+        # Called once the domain is gone. Its first image is the node's own
+        # disk, which gc already knows how to find; the rest only we know of.
+        records = self.journal.snapshots(vm_name)
+        paths = set()
+        for i, record in enumerate(records):
+            paths.update((record.overlay, record.memory))
+            if i > 0:
+                paths.add(record.image)
+        paths.discard(None)
+        if paths:
+            OSUtils.run_command(["rm", "-f", *sorted(paths)], sudo=True)
+        self.journal.forget_snapshots(vm_name)
+
+
+def format_snapshot_table(results: list[SnapshotResult]) -> str:
+    headers = ("NODE", "ACTION", "STATUS", "TIME", "DETAIL")
+    rows = [
+        (
+            r.name,
+            r.action,
+            r.status,
+            f"{r.seconds:.1f}s" if r.seconds is not None else "-",
+            r.detail,
+        )
+        for r in results
+    ]
+    return format_table(headers, rows)
+
+
+def format_snapshot_list(records: list[SnapshotRecord]) -> str:
+    by_name = {}
+    for record in records:
+        entry = by_name.setdefault(record.name, [record.created, 0, 0])
+        entry[0] = min(entry[0], record.created)
+        entry[1] += 1
+        entry[2] += record.memory is not None
+    rows = [
+        (
+            name,
+            time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(created)),
+            str(nodes),
+            "yes" if with_memory == nodes else "no" if not with_memory else "partial",
+        )
+        for name, (created, nodes, with_memory) in by_name.items()
+    ]
+    headers = ("SNAPSHOT", "CREATED", "NODES", "MEMORY")
+    return format_table(headers, rows)
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import subprocess
+import tempfile
+
+DEFAULT_CONTROL_PERSIST = 300
+# A master whose guest vanished (powered off, destroyed) notices within ~45s
+# instead of hanging every command multiplexed over it until TCP gives up.
+SERVER_ALIVE_INTERVAL = 15
+SERVER_ALIVE_COUNT_MAX = 3
+
+
+class SSHSessionPool:
+    # One OpenSSH ControlMaster per host: the first command pays for the TCP
+    # and key exchange, every later ssh to that host multiplexes over it.
+    def __init__(
+        self,
+        ssh_user: str,
+        private_key_path: str,
+        port: int = 22,
+        connect_timeout: float = 5.0,
+        control_persist: int = DEFAULT_CONTROL_PERSIST,
+        control_dir: str = None,
+    ):
+        self.ssh_user = ssh_user
+        self.private_key_path = private_key_path
+        self.port = int(port)
+        self.connect_timeout = connect_timeout
+        self.control_persist = int(control_persist)
+        # Unix socket paths are limited to ~108 bytes, so keep this short.
+        self.control_dir = control_dir or os.path.join(
+            tempfile.gettempdir(), f"softlabor-ssh-{os.getuid()}"
+        )
+
+    @classmethod
+    def from_config(cls, config_parser) -> "SSHSessionPool":
+        readiness_config = config_parser.readiness_config
+        exec_config = config_parser.exec_config
+        return cls(
+            config_parser.ssh_user,
+            config_parser.ssh_private_key_path,
+            port=readiness_config.get("port", 22),
+            connect_timeout=readiness_config.get("connect_timeout", 5.0),
+            control_persist=exec_config.get(
+                "control_persist", DEFAULT_CONTROL_PERSIST
+            ),
+        )
+
+    def _options(self, control_master: str) -> list[str]:
+        # Freshly booted VMs have new host keys; never prompt or record them.
+        return [
+            "-i",
+            self.private_key_path,
+            "-p",
+            str(self.port),
+            "-o",
+            "BatchMode=yes",
+            "-o",
+            "StrictHostKeyChecking=no",
+            "-o",
+            "UserKnownHostsFile=/dev/null",
+            "-o",
+            "LogLevel=ERROR",
+            "-o",
+            f"ConnectTimeout={int(self.connect_timeout)}",
+            "-o",
+            f"ServerAliveInterval={SERVER_ALIVE_INTERVAL}",
+            "-o",
+            f"ServerAliveCountMax={SERVER_ALIVE_COUNT_MAX}",
+            "-o",
+            f"ControlMaster={control_master}",
+            "-o",
+            f"ControlPath={os.path.join(self.control_dir, '%C')}",
+        ]
+
+    def target(self, host: str) -> str:
+        return f"{self.ssh_user}@{host}"
+
+    def ssh_command(self, host: str, *remote: str) -> list[str]:
+        # Rides an open master when there is one, connects directly otherwise.
+        return ["ssh", *self._options("no"), self.target(host), *remote]
+
+    async def open(self, host: str) -> bool:
+        os.makedirs(self.control_dir, mode=0o700, exist_ok=True)
+        if await self._control(host, "check") == 0:
+            return True
+        # -f backgrounds the master after authentication; its stdio must not
+        # be a pipe, or readers would wait for it until ControlPersist expires.
+        process = await asyncio.create_subprocess_exec(
+            "ssh",
+            *self._options("yes"),
+            "-o",
+            f"ControlPersist={self.control_persist}",
+            "-N",
+            "-f",
+            self.target(host),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return await process.wait() == 0
+
+    async def _control(self, host: str, operation: str) -> int:
+        process = await asyncio.create_subprocess_exec(
+            "ssh",
+            *self._options("no"),
+            "-O",
+            operation,
+            self.target(host),
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        return await process.wait()
+
+    async def close(self, hosts: list[str]) -> None:
+        await asyncio.gather(*(self._control(host, "exit") for host in hosts))
+
+    def discard(self, hosts: list[str]) -> None:
+        # For callers outside an event loop: once the guest behind an IP is
+        # deleted, reset or replaced, its master must not carry the next
+        # command to whatever boots there next.
+        if not os.path.isdir(self.control_dir) or not os.listdir(self.control_dir):
+            return
+        for host in hosts:
+            subprocess.run(
+                ["ssh", *self._options("no"), "-O", "exit", self.target(host)],
+                stdin=subprocess.DEVNULL,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+            )
@@ -0,0 +1,234 @@
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import asdict, dataclass, field
+
+from tables import format_table
+from tracing import get_tracer
+from vms.domain import memory_gb_to_kib
+
+DEFAULT_INTERVAL = 2.0
+# An older sample is not used as the baseline for rates; they would average
+# over minutes and hide what the nodes are doing now.
+BASELINE_MAX_AGE = 30.0
+
+# virDomainState
+STATE_NAMES = {
+    0: "nostate",
+    1: "running",
+    2: "blocked",
+    3: "paused",
+    4: "shutdown",
+    5: "shut off",
+    6: "crashed",
+    7: "pmsuspended",
+}
+
+
+@dataclass
+class StatsSample:
+    taken: float
+    # Domain name -> (host, raw domstats fields).
+    domains: dict
+    # Host -> why its domstats could not be read.
+    errors: dict = field(default_factory=dict)
+
+
+@dataclass
+class NodeStatus:
+    name: str
+    role: str
+    host: str = None
+    state: str = "undefined"
+    vcpus: int = None
+    configured_vcpus: int = None
+    memory_kib: int = None
+    configured_memory_kib: int = None
+    rss_kib: int = None
+    cpu_percent: float = None
+    disk_read_bps: float = None
+    disk_write_bps: float = None
+    net_rx_bps: float = None
+    net_tx_bps: float = None
+    error: str = None
+
+
+def _summed(stats: dict, group: str, field: str) -> int:
+    count = stats.get(f"{group}.count")
+    if count is None:
+        return None
+    return sum(stats.get(f"{group}.{i}.{field}", 0) for i in range(count))
+
+
+def _rate(current: dict, previous: dict, elapsed: float, read) -> float:
+    now, before = read(current), read(previous)
+    if now is None or before is None or now < before:
+        return None  # The domain restarted and its counters with it.
+    return (now - before) / elapsed
+
+
+class StatusMonitor:
+    # One bulk domstats query per hypervisor per sample, whatever the number
+    # of nodes, joined with the configuration by domain name. `placements`
+    # (node -> host, from the journal) says whose nodes an unreachable host hid.
+    def __init__(
+        self,
+        backends: dict,
+        nodes: list[tuple[str, dict]],
+        placements: dict[str, str] = None,
+    ):
+        self.backends = backends
+        self.nodes = nodes
+        self.placements = placements or {}
+        self.tracer = get_tracer()
+
+    def _host_stats(self, host: str) -> tuple[dict, str]:
+        # One host down, or a virsh without domstats, must not hide the rest.
+        with self.tracer.span("domstats", "status") as span:
+            span.attrs["host"] = host
+            try:
+                return self.backends[host].domain_stats(), None
+            except Exception as e:
+                reason = str(e).strip().splitlines()[0] if str(e).strip() else ""
+                span.error = reason or type(e).__name__
+                return {}, span.error
+
+    def sample(self) -> StatsSample:
+        hosts = list(self.backends)
+        if len(hosts) == 1:
+            per_host = [self._host_stats(hosts[0])]
+        else:
+            # Each worker runs in a copy of this context, so its spans stay in
+            # the caller's trace scope.
+            contexts = [contextvars.copy_context() for _ in hosts]
+            with ThreadPoolExecutor(max_workers=len(hosts)) as executor:
+                per_host = list(
+                    executor.map(
+                        lambda context, host: context.run(self._host_stats, host),
+                        contexts,
+                        hosts,
+                    )
+                )
+        taken = time.monotonic()
+        domains, errors = {}, {}
+        for host, (stats, error) in zip(hosts, per_host):
+            if error is not None:
+                errors[host] = error
+            for name, fields in stats.items():
+                domains.setdefault(name, (host, fields))
+        return StatsSample(taken, domains, errors)
+
+    def _unreachable(self, name: str, errors: dict) -> tuple[str, str]:
+        # The failed host a missing node may be on, and why it failed.
+        recorded = self.placements.get(name)
+        if recorded in errors:
+            return recorded, errors[recorded]
+        if recorded is None and errors:
+            if len(errors) == 1:
+                return next(iter(errors.items()))
+            return None, "; ".join(f"{host}: {error}" for host, error in errors.items())
+        return None, None
+
+    def statuses(
+        self, current: StatsSample, previous: StatsSample = None
+    ) -> list[NodeStatus]:
+        elapsed = current.taken - previous.taken if previous is not None else 0
+        results = []
+        for role, node_config in self.nodes:
+            status = NodeStatus(
+                name=node_config["name"],
+                role=role,
+                configured_vcpus=int(node_config["vcpu"]),
+                configured_memory_kib=memory_gb_to_kib(node_config["memory_gb"]),
+            )
+            results.append(status)
+            host, stats = current.domains.get(status.name, (None, None))
+            if stats is None:
+                status.host, status.error = self._unreachable(
+                    status.name, current.errors
+                )
+                if status.error is not None:
+                    status.state = "unknown"
+                continue
+            status.host = host
+            status.state = STATE_NAMES.get(stats.get("state.state"), "unknown")
+            status.vcpus = stats.get("vcpu.current")
+            status.memory_kib = stats.get("balloon.current")
+            status.rss_kib = stats.get("balloon.rss")
+
+            _, before = (
+                previous.domains.get(status.name, (None, None))
+                if previous is not None
+                else (None, None)
+            )
+            if before is None or elapsed <= 0:
+                continue
+            cpu_ns = _rate(stats, before, elapsed, lambda s: s.get("cpu.time"))
+            if cpu_ns is not None and status.vcpus:
+                status.cpu_percent = cpu_ns / 1e9 / status.vcpus * 100
+            status.disk_read_bps = _rate(
+                stats, before, elapsed, lambda s: _summed(s, "block", "rd.bytes")
+            )
+            status.disk_write_bps = _rate(
+                stats, before, elapsed, lambda s: _summed(s, "block", "wr.bytes")
+            )
+            status.net_rx_bps = _rate(
+                stats, before, elapsed, lambda s: _summed(s, "net", "rx.bytes")
+            )
+            status.net_tx_bps = _rate(
+                stats, before, elapsed, lambda s: _summed(s, "net", "tx.bytes")
+            )
+        return results
+
+
+def _bytes(value: float, suffix: str = "") -> str:
+    if value is None:
+        return "-"
+    for unit in ("", "K", "M", "G"):
+        if abs(value) < 1024 or unit == "G":
+            break
+        value /= 1024
+    return f"{value:.1f}{unit}{suffix}" if unit else f"{value:.0f}{suffix}"
+
+
+def status_document(statuses: list[NodeStatus], interval: float = None) -> dict:
+    return {
+        "time": time.time(),
+        "interval": interval,
+        "nodes": [asdict(status) for status in statuses],
+    }
+
+
+def format_status_table(statuses: list[NodeStatus]) -> str:
+    show_host = any(status.host for status in statuses)
+    show_error = any(status.error for status in statuses)
+    headers = ("NODE", "ROLE") + (("HOST",) if show_host else ()) + (
+        "STATE",
+        "VCPU",
+        "CPU%",
+        "MEMORY",
+        "RSS",
+        "DISK RD",
+        "DISK WR",
+        "NET RX",
+        "NET TX",
+    ) + (("ERROR",) if show_error else ())
+    rows = []
+    for s in statuses:
+        rows.append(
+            (s.name, s.role)
+            + ((s.host or "-",) if show_host else ())
+            + (
+                s.state,
+                f"{s.vcpus if s.vcpus is not None else '-'}/{s.configured_vcpus}",
+                f"{s.cpu_percent:.1f}" if s.cpu_percent is not None else "-",
+                _bytes(s.memory_kib * 1024 if s.memory_kib is not None else None),
+                _bytes(s.rss_kib * 1024 if s.rss_kib is not None else None),
+                _bytes(s.disk_read_bps, "/s"),
+                _bytes(s.disk_write_bps, "/s"),
+                _bytes(s.net_rx_bps, "/s"),
+                _bytes(s.net_tx_bps, "/s"),
+            )
+            + ((s.error or "",) if show_error else ())
+        )
+    return format_table(headers, rows)
@@ -0,0 +1,10 @@
+def format_table(headers: tuple, rows: list[tuple]) -> str:
+    # Left-aligned columns two spaces apart, sized to their widest cell.
+    widths = [
+        max([len(header)] + [len(row[i]) for row in rows])
+        for i, header in enumerate(headers)
+    ]
+    lines = ["  ".join(h.ljust(w) for h, w in zip(headers, widths)).rstrip()]
+    for row in rows:
+        lines.append("  ".join(c.ljust(w) for c, w in zip(row, widths)).rstrip())
+    return "\n".join(lines)
@@ -0,0 +1,99 @@
+import asyncio
+import getpass
+import os
+import shutil
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# The tool's modules are imported top-level, as main.py runs them.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def ssh_server(tmp_path):
+    # A localhost SSH server (asyncssh) that runs each command in a shell,
+    # with the test's fake tools (cloud-init, ...) first on its PATH.
+    asyncssh = pytest.importorskip("asyncssh")
+    if shutil.which("ssh") is None:
+        pytest.skip("OpenSSH client not installed")
+
+    bin_dir = tmp_path / "remote-bin"
+    bin_dir.mkdir()
+    client_key = asyncssh.generate_private_key("ssh-ed25519")
+    key_path = tmp_path / "id_ed25519"
+    client_key.write_private_key(str(key_path))
+    key_path.chmod(0o600)
+    control_dir = tempfile.mkdtemp(prefix="ssh-")
+    environment = dict(os.environ, PATH=f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+    async def handle(process):
+        shell = await asyncio.create_subprocess_shell(
+            process.command or "true",
+            stdin=asyncio.subprocess.DEVNULL,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            env=environment,
+        )
+        stdout, stderr = await shell.communicate()
+        process.stdout.write(stdout)
+        process.stderr.write(stderr)
+        await process.stdout.drain()
+        process.exit(shell.returncode)
+
+    class Server(asyncssh.SSHServer):
+        def begin_auth(self, username):
+            return True
+
+        def public_key_auth_supported(self):
+            return True
+
+        def validate_public_key(self, username, key):
+            return key == client_key.convert_to_public()
+
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    state = {}
+
+    def serve():
+        asyncio.set_event_loop(loop)
+        state["server"] = loop.run_until_complete(
+            asyncssh.create_server(
+                Server,
+                "127.0.0.1",
+                0,
+                server_host_keys=[asyncssh.generate_private_key("ssh-ed25519")],
+                process_factory=handle,
+                encoding=None,
+            )
+        )
+        started.set()
+        loop.run_forever()
+
+    thread = threading.Thread(target=serve, daemon=True)
+    thread.start()
+    started.wait()
+    port = state["server"].sockets[0].getsockname()[1]
+    yield SimpleNamespace(
+        host="127.0.0.1",
+        port=port,
+        user=getpass.getuser(),
+        key_path=str(key_path),
+        bin_dir=bin_dir,
+        # Unix socket paths are short; tmp_path plus a %C hash is not.
+        control_dir=control_dir,
+        tool=lambda name, script: _write_tool(bin_dir, name, script),
+    )
+    loop.call_soon_threadsafe(state["server"].close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    shutil.rmtree(control_dir, ignore_errors=True)
+
+
+def _write_tool(bin_dir, name: str, script: str) -> None:
+    path = bin_dir / name
+    path.write_text("#!/bin/sh\n" + script + "\n")
+    path.chmod(0o755)
@@ -0,0 +1,76 @@
+import json
+import subprocess
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import baker
+from baker import LayerBaker
+from vms.layers import LayerStatus
+
+DISK_XML = (
+    "<domain><devices><disk device='disk'><source file='{path}'/></disk>"
+    "</devices></domain>"
+)
+
+
+class FakeInventory:
+    def __init__(self, disks: dict):
+        self.disks = disks
+
+    def domains(self) -> list[str]:
+        return list(self.disks)
+
+    def domain_xml(self, name: str) -> ET.Element:
+        return ET.fromstring(DISK_XML.format(path=self.disks[name]))
+
+
+class FakeCatalog:
+    def __init__(self, layers: list[LayerStatus]):
+        self._layers = layers
+
+    def layers(self, base_disk_path: str) -> list[LayerStatus]:
+        return self._layers
+
+
+def make_baker(disks: dict, layers: list[LayerStatus]) -> LayerBaker:
+    cli = SimpleNamespace(
+        config_parser=SimpleNamespace(bake_config={}),
+        backend=None,
+        inventory=FakeInventory(disks),
+        base_disk_path=lambda: "/images/base.qcow2",
+    )
+    return LayerBaker(cli, FakeCatalog(layers))
+
+
+def fake_qemu_img(chains: dict):
+    # qemu-img info --backing-chain, answered from `chains` by disk path.
+    def run_command(command, check_output=False, sudo=False, **kwargs):
+        if command[:2] != ["qemu-img", "info"]:
+            return None
+        chain = chains[command[-1]]
+        if chain is None:
+            raise subprocess.CalledProcessError(1, command, "", "Permission denied")
+        return json.dumps([{"full-backing-filename": path} for path in chain])
+
+    return run_command
+
+
+OLD = LayerStatus("worker", "/images/base-worker-old.qcow2", current=False)
+OLDER = LayerStatus("worker", "/images/base-worker-older.qcow2", current=False)
+
+
+def test_prune_keeps_layers_in_use(monkeypatch):
+    chains = {"/images/n1.qcow2": [OLD.path, "/images/base.qcow2"]}
+    monkeypatch.setattr(baker.OSUtils, "run_command", fake_qemu_img(chains))
+    pruner = make_baker({"n1": "/images/n1.qcow2"}, [OLD, OLDER])
+    assert pruner.prune(dry_run=True) == [OLDER]
+
+
+def test_prune_keeps_everything_when_a_chain_is_unreadable(monkeypatch, capsys):
+    chains = {"/images/n1.qcow2": [OLD.path], "/images/n2.qcow2": None}
+    monkeypatch.setattr(baker.OSUtils, "run_command", fake_qemu_img(chains))
+    disks = {"n1": "/images/n1.qcow2", "n2": "/images/n2.qcow2"}
+    assert make_baker(disks, [OLD, OLDER]).prune(dry_run=True) == []
+    assert "could not read the backing chain of /images/n2.qcow2" in (
+        capsys.readouterr().out
+    )
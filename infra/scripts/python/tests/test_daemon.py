@@ -0,0 +1,109 @@
+import sys
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+import daemon
+from cli import build_parser
+from daemon import ProvisioningDaemon
+
+
+class StreamHandler:
+    # Stands in for the HTTP handler: records what serve_cli streams back.
+    def __init__(self):
+        self.lines = []
+        self.refused = None
+
+    def start_stream(self) -> None:
+        pass
+
+    def send_line(self, message: dict) -> None:
+        self.lines.append(message)
+
+    def send_json(self, status: int, document: dict) -> None:
+        self.refused = (status, document)
+
+    @property
+    def output(self) -> str:
+        return "".join(line["output"] for line in self.lines if "output" in line)
+
+    @property
+    def exit_code(self) -> int:
+        return self.lines[-1]["exit_code"]
+
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    # A daemon around a stub CLI, its job worker running, and commands that
+    # print what they were asked to do.
+    config = tmp_path / "cfg.yaml"
+    config.write_text("{}\n")
+    broken = []
+
+    def forget_domains():
+        if broken:
+            raise RuntimeError(broken.pop())
+
+    cli_app = SimpleNamespace(
+        inventory=SimpleNamespace(forget_domains=forget_domains),
+        fleet=None,
+        journal=None,
+        backend=SimpleNamespace(close=lambda: None),
+        config_parser=SimpleNamespace(tracing_config={"summary": False}),
+    )
+
+    def run_command(args, parser, cli_app, seed_cache):
+        print(f"{args.command} {args.vm_name}")
+        return 0 if args.vm_name != "missing" else 3
+
+    monkeypatch.setattr(daemon, "build_cli", lambda args, parser: (cli_app, None))
+    monkeypatch.setattr(daemon, "run_command", run_command)
+    monkeypatch.chdir(tmp_path)
+    parser = build_parser()
+    args = parser.parse_args(["-c", str(config), "daemon"])
+    server = ProvisioningDaemon(
+        parser, args, SimpleNamespace(config_file_path=str(config))
+    )
+    server.broken = broken
+    threading.Thread(target=server._work, daemon=True).start()
+    return server
+
+
+def serve(server: ProvisioningDaemon, *argv: str) -> StreamHandler:
+    # On its own thread, so a job that never finishes fails the test.
+    handler = StreamHandler()
+    thread = threading.Thread(
+        target=server.serve_cli,
+        args=({"argv": list(argv), "cwd": server.cwd}, handler),
+        daemon=True,
+    )
+    thread.start()
+    thread.join(10)
+    assert not thread.is_alive(), "the job never finished"
+    return handler
+
+
+def test_job_output_and_exit_code_are_streamed(served, monkeypatch):
+    monkeypatch.setattr(sys, "stdout", served.output)
+    handler = serve(served, "-c", served.config_path, "delete", "node-1")
+    assert handler.lines[0] == {"job": 1}
+    assert handler.output == "delete node-1\n"
+    assert handler.exit_code == 0
+
+    handler = serve(served, "-c", served.config_path, "delete", "missing")
+    assert handler.exit_code == 3
+    assert served.jobs[2].status == "failed"
+
+
+def test_worker_survives_a_job_that_raises(served, monkeypatch):
+    monkeypatch.setattr(sys, "stdout", served.output)
+    served.broken.append("libvirtd went away")
+    handler = serve(served, "-c", served.config_path, "delete", "node-1")
+    assert handler.exit_code == 1
+    assert "libvirtd went away" in handler.output
+    assert served.health()["running"] is None
+
+    handler = serve(served, "-c", served.config_path, "delete", "node-2")
+    assert handler.exit_code == 0
+    assert handler.output == "delete node-2\n"
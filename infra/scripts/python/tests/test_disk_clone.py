@@ -0,0 +1,82 @@
+import errno
+import os
+
+import pytest
+
+from vms.disk_clone import DiskCloner
+
+MIB = 1024 * 1024
+
+
+@pytest.fixture
+def source(tmp_path):
+    # 8 MiB with data in its first and last MiB and a hole between.
+    path = tmp_path / "base.qcow2"
+    with open(path, "wb") as f:
+        f.write(b"\x01" * MIB)
+        f.seek(7 * MIB)
+        f.write(b"\x02" * MIB)
+    return path
+
+
+def cloner(method: str, **kwargs) -> DiskCloner:
+    # A cloner restricted to one copy method, as if the others were refused.
+    cloner = DiskCloner(chunk_size=MIB, progress_interval=0, **kwargs)
+    methods = [m for m in cloner._methods() if m[0] == method]
+    if not methods:
+        pytest.skip(f"{method} is not available here")
+    cloner._methods = lambda: methods
+    return cloner
+
+
+@pytest.mark.parametrize("method", ["copy_file_range", "sparse"])
+def test_copy_keeps_holes(source, tmp_path, method):
+    if os.stat(source).st_blocks * 512 >= 8 * MIB:
+        pytest.skip("the filesystem does not keep holes")
+    target = tmp_path / "node.qcow2"
+    result = cloner(method, verify="full").clone(str(source), str(target))
+
+    assert result.method == method
+    assert (result.size, result.bytes_written) == (8 * MIB, 2 * MIB)
+    assert target.read_bytes() == source.read_bytes()
+    assert os.stat(target).st_blocks * 512 < 8 * MIB
+    assert not (tmp_path / "node.qcow2.partial").exists()
+
+
+def test_unsupported_method_falls_back(source, tmp_path):
+    def refuse(src_fd, dst_fd, progress):
+        raise OSError(errno.EOPNOTSUPP, "no reflinks here")
+
+    disk_cloner = cloner("sparse")
+    sparse = disk_cloner._methods()
+    disk_cloner._methods = lambda: [("reflink", refuse)] + sparse
+    target = tmp_path / "node.qcow2"
+    assert disk_cloner.clone(str(source), str(target)).method == "sparse"
+    assert target.read_bytes() == source.read_bytes()
+
+
+def test_failed_copy_leaves_no_partial_file(source, tmp_path):
+    def fail(src_fd, dst_fd, progress):
+        os.pwrite(dst_fd, b"half", 0)
+        raise OSError(errno.EIO, "device went away")
+
+    disk_cloner = DiskCloner()
+    disk_cloner._methods = lambda: [("sparse", fail)]
+    target = tmp_path / "node.qcow2"
+    with pytest.raises(OSError, match="device went away"):
+        disk_cloner.clone(str(source), str(target))
+    assert sorted(os.listdir(tmp_path)) == ["base.qcow2"]
+
+
+@pytest.mark.parametrize("verify", ["sample", "full"])
+def test_corrupt_copy_fails_verification(source, tmp_path, verify):
+    def corrupt(src_fd, dst_fd, progress):
+        os.pwrite(dst_fd, b"\x01" * MIB, 0)  # The last MiB never arrives.
+        return MIB
+
+    disk_cloner = DiskCloner(verify=verify)
+    disk_cloner._methods = lambda: [("sparse", corrupt)]
+    target = tmp_path / "node.qcow2"
+    with pytest.raises(RuntimeError, match="contents differ"):
+        disk_cloner.clone(str(source), str(target))
+    assert sorted(os.listdir(tmp_path)) == ["base.qcow2"]
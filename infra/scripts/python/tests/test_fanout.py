@@ -0,0 +1,69 @@
+import asyncio
+
+import pytest
+
+from fanout import _LINE_LIMIT, FanOut
+from ssh_pool import SSHSessionPool
+
+
+@pytest.fixture
+def fan_out(ssh_server):
+    sessions = SSHSessionPool(
+        ssh_server.user,
+        ssh_server.key_path,
+        port=ssh_server.port,
+        control_dir=ssh_server.control_dir,
+    )
+    return FanOut(sessions, parallel=4, timeout=20)
+
+
+def nodes(ssh_server, count: int) -> list[dict]:
+    return [
+        {"name": f"leap-k8s-worker-{i}", "ip_address": ssh_server.host}
+        for i in range(1, count + 1)
+    ]
+
+
+def test_runs_on_every_node_over_one_master(fan_out, ssh_server, capsys):
+    results = fan_out.run(nodes(ssh_server, 3), ["echo", "hello"], close=True)
+    assert [r.exit_code for r in results] == [0, 0, 0]
+    assert all(r.error is None for r in results)
+    out = capsys.readouterr().out.splitlines()
+    assert sorted(out) == [f"[leap-k8s-worker-{i}] hello" for i in range(1, 4)]
+
+
+def test_exit_codes_and_stderr_are_per_node(fan_out, ssh_server, capsys):
+    [result] = fan_out.run(
+        nodes(ssh_server, 1), ["sh", "-c", "'echo oops >&2; exit 3'"], close=True
+    )
+    assert result.exit_code == 3
+    assert not result.ok
+    assert capsys.readouterr().err == "[leap-k8s-worker-1] oops\n"
+
+
+def test_overlong_line_is_split_not_fatal(fan_out, ssh_server, capsys):
+    size = _LINE_LIMIT * 2 + 10
+    ssh_server.tool("long-line", f"head -c {size} /dev/zero | tr '\\\\0' x; echo")
+    [result] = fan_out.run(
+        nodes(ssh_server, 1), ["long-line", "&&", "echo", "after"], close=True
+    )
+    assert result.exit_code == 0
+    assert result.error == "output line over 1024 KiB was split"
+    out = capsys.readouterr().out.splitlines()
+    assert out[-1] == "[leap-k8s-worker-1] after"
+    assert sum(len(line) - len("[leap-k8s-worker-1] ") for line in out[:-1]) == size
+
+
+def test_timeout_kills_the_command(fan_out, ssh_server):
+    fan_out.timeout = 1
+    [result] = fan_out.run(nodes(ssh_server, 1), ["sleep", "30"], close=True)
+    assert result.error == "timed out after 1s"
+    assert result.exit_code is not None
+
+
+def test_discard_closes_the_master(fan_out, ssh_server):
+    sessions = fan_out.sessions
+    fan_out.run(nodes(ssh_server, 1), ["true"])
+    assert asyncio.run(sessions._control(ssh_server.host, "check")) == 0
+    sessions.discard([ssh_server.host])
+    assert asyncio.run(sessions._control(ssh_server.host, "check")) != 0
@@ -0,0 +1,70 @@
+import subprocess
+import types
+from types import SimpleNamespace
+
+import pytest
+
+import cli
+from cli import CLI
+from journal import ProvisionJournal
+
+
+def host(remote: bool) -> SimpleNamespace:
+    return SimpleNamespace(backend=SimpleNamespace(manages_storage=remote))
+
+
+@pytest.fixture
+def fleet_cli(tmp_path, monkeypatch):
+    # Just what collect_garbage reads, for a fleet of a local and a remote
+    # host whose CLIs share one journal.
+    monkeypatch.setattr(cli, "TMP_XML_PREFIX", str(tmp_path / "vm-"))
+    journal = ProvisionJournal(str(tmp_path / "journal.db"))
+    stub = SimpleNamespace(
+        journal=journal,
+        fleet=SimpleNamespace(
+            hosts={"local": host(remote=False), "remote": host(remote=True)},
+            domains=lambda: {"local": [], "remote": ["running-1"]},
+        ),
+        inventory=SimpleNamespace(domains=lambda: []),
+        all_nodes_config=[],
+        warm_pool=SimpleNamespace(orphaned_staged_xml=lambda: []),
+    )
+    for name in ("_remote_disk_nodes", "_orphaned_artifacts"):
+        setattr(stub, name, types.MethodType(getattr(CLI, name), stub))
+    yield stub
+    journal.close()
+
+
+def record(journal: ProvisionJournal, node: str, tmp_path, host: str) -> tuple:
+    iso_path, disk_path = tmp_path / f"{node}.iso", tmp_path / f"{node}.qcow2"
+    for step, path in (("iso", iso_path), ("disk", disk_path)):
+        path.write_bytes(b"")
+        with journal.step(node, step) as entry:
+            entry.artifact = str(path)
+    journal.record_placement(node, host, f"qemu+ssh://{host}/system")
+    return iso_path, disk_path
+
+
+def test_nodes_running_on_a_remote_host_are_kept(fleet_cli, tmp_path):
+    iso_path, disk_path = record(fleet_cli.journal, "running-1", tmp_path, "remote")
+    assert CLI.collect_garbage(fleet_cli)
+    assert iso_path.exists() and disk_path.exists()
+    assert fleet_cli.journal.entries("running-1")
+
+
+def test_remote_disk_paths_are_never_removed_locally(fleet_cli, tmp_path):
+    iso_path, disk_path = record(fleet_cli.journal, "gone-1", tmp_path, "remote")
+    assert CLI.collect_garbage(fleet_cli)
+    assert not iso_path.exists()
+    assert disk_path.exists()
+    assert fleet_cli.journal.entries("gone-1") == []
+
+
+def test_local_orphans_are_removed(fleet_cli, tmp_path, monkeypatch):
+    def run_command(command, sudo=False, **kwargs):
+        subprocess.run(command, check=True)
+
+    monkeypatch.setattr(cli.OSUtils, "run_command", run_command)
+    iso_path, disk_path = record(fleet_cli.journal, "gone-2", tmp_path, "local")
+    assert CLI.collect_garbage(fleet_cli)
+    assert not iso_path.exists() and not disk_path.exists()
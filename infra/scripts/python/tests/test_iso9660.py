@@ -0,0 +1,98 @@
+import shutil
+import struct
+
+import pytest
+
+from cloud_init.config import CloudInit
+from cloud_init.iso_builder import CloudInitISOBuilder
+
+SECTOR = 2048
+SEED_FILES = ("meta-data", "network-config", "user-data")
+
+
+def _directory(image: bytes, extent: int, size: int, joliet: bool) -> dict:
+    files = {}
+    data = image[extent * SECTOR : extent * SECTOR + size]
+    offset = 0
+    while offset < len(data):
+        length = data[offset]
+        if length == 0:
+            # Records never straddle a sector; skip to the next one.
+            offset = (offset // SECTOR + 1) * SECTOR
+            continue
+        record = data[offset : offset + length]
+        file_extent = struct.unpack_from("<I", record, 2)[0]
+        file_size = struct.unpack_from("<I", record, 10)[0]
+        identifier = record[33 : 33 + record[32]]
+        offset += length
+        if record[25] & 0x02 or identifier in (b"\x00", b"\x01"):
+            continue
+        name = identifier.decode("utf-16-be" if joliet else "ascii")
+        name = name.split(";")[0]
+        files[name] = image[file_extent * SECTOR : file_extent * SECTOR + file_size]
+    return files
+
+
+def parse_iso(path: str) -> tuple[str, dict]:
+    # The volume label, and the files of the Joliet hierarchy by name.
+    with open(path, "rb") as f:
+        image = f.read()
+    label, files = None, None
+    sector = 16
+    while True:
+        descriptor = image[sector * SECTOR : (sector + 1) * SECTOR]
+        kind = descriptor[0]
+        assert descriptor[1:6] == b"CD001"
+        if kind == 255:
+            break
+        root = descriptor[156:190]
+        extent = struct.unpack_from("<I", root, 2)[0]
+        size = struct.unpack_from("<I", root, 10)[0]
+        if kind == 1:
+            label = descriptor[40:72].decode("ascii").rstrip()
+        elif kind == 2 and descriptor[88:91] in (b"%/@", b"%/C", b"%/E"):
+            files = _directory(image, extent, size, joliet=True)
+        sector += 1
+    return label, files
+
+
+@pytest.fixture
+def config() -> CloudInit:
+    return CloudInit(
+        hostname="iso-test-node",
+        ip_address="192.168.10.50",
+        ssh_user="root",
+        ssh_public_keys_content=["ssh-ed25519 AAAAC3Nza test@example"],
+        nameservers=["8.8.8.8"],
+        gateway="192.168.10.1",
+        packages=["curl"],
+        runcmd=["echo ready"],
+    )
+
+
+def expected_payloads(config: CloudInit) -> dict:
+    return {
+        "user-data": config.generate_user_data().encode("utf-8"),
+        "meta-data": config.generate_meta_data().encode("utf-8"),
+        "network-config": config.generate_network_config().encode("utf-8"),
+    }
+
+
+def test_native_iso_holds_the_seed_files(config, tmp_path):
+    iso_path = CloudInitISOBuilder(config, str(tmp_path), method="native").build_iso()
+    label, files = parse_iso(iso_path)
+    assert label == "cidata"
+    assert files == expected_payloads(config)
+
+
+@pytest.mark.skipif(shutil.which("mkisofs") is None, reason="mkisofs not installed")
+def test_native_and_mkisofs_isos_parse_the_same(config, tmp_path):
+    native = CloudInitISOBuilder(config, str(tmp_path / "native"), method="native")
+    mkisofs = CloudInitISOBuilder(config, str(tmp_path / "mkisofs"), method="mkisofs")
+    native_label, native_files = parse_iso(native.build_iso())
+    mkisofs_label, mkisofs_files = parse_iso(mkisofs.build_iso())
+
+    assert native_label == mkisofs_label == "cidata"
+    assert sorted(native_files) == sorted(mkisofs_files) == list(SEED_FILES)
+    for name in SEED_FILES:
+        assert native_files[name] == mkisofs_files[name], name
@@ -0,0 +1,18 @@
+from journal import ProvisionJournal
+
+
+def test_reads_never_create_the_database(tmp_path):
+    path = tmp_path / "provision-journal.db"
+    journal = ProvisionJournal(str(path))
+    assert journal.entries() == []
+    assert journal.placements() == {}
+    assert journal.snapshots() == []
+    journal.reset("leap-k8s-worker-1")
+    assert not path.exists()
+
+    with journal.step("leap-k8s-worker-1", "iso") as entry:
+        entry.artifact = "/tmp/seed.iso"
+    assert path.exists()
+    [entry] = ProvisionJournal(str(path)).entries()
+    assert (entry.node, entry.step, entry.done) == ("leap-k8s-worker-1", "iso", True)
+    journal.close()
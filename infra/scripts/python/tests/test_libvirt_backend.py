@@ -0,0 +1,43 @@
+import uuid
+
+import pytest
+
+pytest.importorskip("libvirt")
+
+from hypervisor.libvirt_api import LibvirtBackend  # noqa: E402
+
+TEST_URI = "test:///default"
+DOMAIN_XML = """<domain type='test'>
+  <name>{name}</name>
+  <memory unit='KiB'>262144</memory>
+  <vcpu>1</vcpu>
+  <os><type arch='x86_64'>hvm</type></os>
+</domain>"""
+
+
+@pytest.fixture
+def backend():
+    backend = LibvirtBackend(TEST_URI)
+    yield backend
+    backend.close()
+
+
+def test_lists_the_test_drivers_domain(backend):
+    assert "test" in backend.list_domains()
+
+
+def test_define_start_undefine_round_trip(backend):
+    name = f"pytest-{uuid.uuid4().hex[:8]}"
+    backend.define_xml(DOMAIN_XML.format(name=name))
+    try:
+        assert name in backend.list_domains()
+        assert f"<name>{name}</name>" in backend.dump_xml(name, inactive=True)
+        assert not backend.is_active(name)
+
+        backend.start(name)
+        assert backend.is_active(name)
+        backend.destroy(name)
+        assert not backend.is_active(name)
+    finally:
+        backend.undefine(name)
+    assert name not in backend.list_domains()
@@ -0,0 +1,81 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from hypervisor import libvirt_api
+from hypervisor.libvirt_api import LibvirtConnectionPool
+
+
+class StubError(Exception):
+    pass
+
+
+class StubConnection:
+    def __init__(self):
+        self.alive = True
+        self.closed = False
+
+    def isAlive(self) -> bool:
+        return self.alive
+
+    def close(self) -> None:
+        self.closed = True
+
+
+@pytest.fixture
+def opened(monkeypatch):
+    # A stand-in for libvirt-python that records the connections it opens.
+    connections = []
+
+    def open_connection(uri):
+        connections.append(StubConnection())
+        return connections[-1]
+
+    stub = SimpleNamespace(open=open_connection, libvirtError=StubError)
+    monkeypatch.setattr(libvirt_api, "libvirt", stub)
+    return connections
+
+
+def test_connections_are_reused(opened):
+    pool = LibvirtConnectionPool("test:///stub", max_size=2)
+    with pool.connection() as first:
+        pass
+    with pool.connection() as second:
+        pass
+    assert first is second
+    assert len(opened) == 1
+
+
+def test_waiter_reopens_after_the_held_connection_dies(opened):
+    pool = LibvirtConnectionPool("test:///stub", max_size=1)
+    got = []
+
+    def waiter():
+        with pool.connection() as conn:
+            got.append(conn)
+
+    with pytest.raises(StubError):
+        with pool.connection() as held:
+            thread = threading.Thread(target=waiter, daemon=True)
+            thread.start()
+            time.sleep(0.2)  # Let the waiter block on the full pool.
+            held.alive = False
+            raise StubError("connection reset by libvirtd restart")
+    thread.join(5)
+
+    assert not thread.is_alive()
+    assert held.closed
+    assert got == [opened[1]]
+
+
+def test_dead_idle_connection_is_replaced(opened):
+    pool = LibvirtConnectionPool("test:///stub", max_size=1)
+    with pool.connection() as first:
+        pass
+    first.alive = False
+    with pool.connection() as second:
+        pass
+    assert second is not first
+    assert first.closed
@@ -0,0 +1,39 @@
+import pytest
+import yaml
+
+from vms.parser import VMConfigParser
+
+
+def write_config(tmp_path, defaults: dict) -> str:
+    config = {
+        "base_vm_name": "base",
+        "ssh_user": "root",
+        "ssh_public_key_path": "~/.ssh/id_ed25519.pub",
+        "ssh_private_key_path": "~/.ssh/id_ed25519",
+        "node_pools": [
+            {
+                "name": "pool",
+                "count": 200,
+                "base_ip": "10.1.0.1",
+                "base_mac": "52:54:00:00:00:01",
+                "defaults": defaults,
+            }
+        ],
+    }
+    path = tmp_path / "config.yaml"
+    path.write_text(yaml.safe_dump(config))
+    return str(path)
+
+
+def test_pools_expand_only_on_demand(tmp_path):
+    defaults = {"gateway_address": "10.1.0.254", "vcpu": 1, "memory_gb": 1}
+    parser = VMConfigParser(write_config(tmp_path, {**defaults, "disk_gb": 8}))
+    assert parser.get_node("pool-7")["ip_address"] == "10.1.0.7"
+    assert "all_nodes" not in vars(parser)
+    assert len(parser.all_nodes) == 200
+    assert parser.all_nodes is parser.all_nodes
+
+
+def test_pool_defaults_need_node_keys(tmp_path):
+    with pytest.raises(ValueError, match="pool 'pool' defaults lack vcpu, disk_gb"):
+        VMConfigParser(write_config(tmp_path, {"gateway_address": "x", "memory_gb": 1}))
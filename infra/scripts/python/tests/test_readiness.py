@@ -0,0 +1,54 @@
+import time
+
+from readiness import ReadinessWaiter
+from utils import AsyncCommandRunner
+
+
+def make_waiter(ssh_server, deadline: float) -> ReadinessWaiter:
+    waiter = ReadinessWaiter(
+        ssh_server.user,
+        ssh_server.key_path,
+        port=ssh_server.port,
+        deadline=deadline,
+        poll_interval=0.2,
+        connect_timeout=2,
+        runner=AsyncCommandRunner({"ssh": 4}, timeout=30, retries=0),
+    )
+    waiter.sessions.control_dir = ssh_server.control_dir
+    return waiter
+
+
+def node(host: str) -> dict:
+    return {"name": "leap-k8s-worker-1", "ip_address": host}
+
+
+def test_ready_once_cloud_init_is_done(ssh_server):
+    ssh_server.tool("cloud-init", 'echo "status: done"')
+    [result] = make_waiter(ssh_server, deadline=20).wait([node(ssh_server.host)])
+    assert result.status == "ready", result.detail
+    assert result.tcp_seconds <= result.ready_seconds
+
+
+def test_cloud_init_error_fails_the_node(ssh_server):
+    ssh_server.tool("cloud-init", 'echo "status: error"; exit 1')
+    [result] = make_waiter(ssh_server, deadline=20).wait([node(ssh_server.host)])
+    assert result.status == "failed"
+    assert result.detail == "cloud-init error"
+
+
+def test_hung_status_check_stops_at_the_deadline(ssh_server):
+    ssh_server.tool("cloud-init", "sleep 20")
+    started = time.monotonic()
+    [result] = make_waiter(ssh_server, deadline=2).wait([node(ssh_server.host)])
+    assert result.status == "timeout"
+    assert result.detail == "cloud-init unreachable"
+    assert time.monotonic() - started < 6
+
+
+def test_no_ssh_server_times_out(ssh_server):
+    waiter = make_waiter(ssh_server, deadline=1)
+    waiter.port = 1  # Nothing listens there.
+    [result] = waiter.wait([node(ssh_server.host)])
+    assert result.status == "timeout"
+    assert result.tcp_seconds is None
+    assert result.detail == "no SSH banner on port 1"
@@ -0,0 +1,127 @@
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+from cli import CLI
+from journal import ProvisionJournal
+from reconciler import Reconciler
+from vms.domain import DomainSpec
+
+MAC = "52:54:00:00:00:01"
+DISK = "/var/lib/libvirt/images/node-1.qcow2"
+
+
+def domain(vcpu: int, memory_mib: int, tuning: str = "") -> DomainSpec:
+    return DomainSpec.from_xml(
+        ET.fromstring(
+            f"""<domain><name>node-1</name>
+            <vcpu>{vcpu}</vcpu><memory unit='MiB'>{memory_mib}</memory>{tuning}
+            <devices>
+              <disk device='disk'><source file='{DISK}'/></disk>
+              <interface type='network'><mac address='{MAC}'/></interface>
+            </devices></domain>"""
+        )
+    )
+
+
+def reconciler(journal: ProvisionJournal = None, remote: bool = False) -> Reconciler:
+    builder = SimpleNamespace(expected_disk_paths=lambda: [DISK])
+    cli = SimpleNamespace(
+        config_parser=None,
+        inventory=None,
+        journal=journal,
+        backend=SimpleNamespace(manages_storage=remote),
+        make_vm_builder=lambda node_config, seed_cache: builder,
+    )
+    return Reconciler(cli)
+
+
+NODE = {"name": "node-1", "vcpu": 4, "memory_gb": 2, "mac_address": MAC}
+PINNED = """<cputune>
+  <vcpupin vcpu='0' cpuset='2'/><vcpupin vcpu='1' cpuset='3'/>
+</cputune>"""
+
+
+def test_unpinned_domain_is_resized_in_place():
+    resize, replace = reconciler()._drift(NODE, domain(2, 2048))
+    assert resize == ["vcpu 2 -> 4"]
+    assert replace == []
+
+
+def test_pinned_domain_is_replaced_instead_of_resized():
+    resize, replace = reconciler()._drift(NODE, domain(2, 2048, PINNED))
+    assert resize == ["vcpu 2 -> 4"]
+    assert replace == ["pinned to host CPUs/NUMA cell"]
+
+
+def test_numa_bound_domain_is_replaced_instead_of_resized():
+    numatune = "<numatune><memory mode='strict' nodeset='0'/></numatune>"
+    _, replace = reconciler()._drift(NODE, domain(4, 1024, numatune))
+    assert replace == ["pinned to host CPUs/NUMA cell"]
+
+
+def test_pinned_domain_without_drift_is_left_alone():
+    assert reconciler()._drift(NODE, domain(4, 2048, PINNED)) == ([], [])
+
+
+def moved(disk: str) -> DomainSpec:
+    live = domain(4, 2048)
+    live.disk_paths = [disk]
+    return live
+
+
+def test_replaced_nodes_old_overlay_is_removed_with_it():
+    old = "/srv/old-images/node-1.qcow2"
+    assert reconciler()._stale_disks(NODE, moved(old)) == ([old], [])
+
+
+def test_journal_recorded_overlay_is_removed_with_it(tmp_path):
+    journal = ProvisionJournal(str(tmp_path / "journal.db"))
+    old = "/srv/old-images/node-1-v1.qcow2"
+    with journal.step("node-1", "disk") as entry:
+        entry.artifact = old
+    assert reconciler(journal)._stale_disks(NODE, moved(old)) == ([old], [])
+    journal.close()
+
+
+def test_foreign_or_remote_disks_are_kept():
+    foreign = "/srv/images/shared.qcow2"
+    assert reconciler()._stale_disks(NODE, moved(foreign)) == (
+        [],
+        [f"keeps old disk {foreign}"],
+    )
+    old = "/srv/old-images/node-1.qcow2"
+    stale, kept = reconciler(remote=True)._stale_disks(NODE, moved(old))
+    assert stale == [] and kept == [f"keeps old disk {old}"]
+
+
+def test_remove_domain_forgets_everything_delete_does(tmp_path, monkeypatch):
+    calls = []
+    journal = ProvisionJournal(str(tmp_path / "journal.db"))
+    journal.record_placement("node-1", "host-a", "qemu:///system")
+    with journal.step("node-1", "disk") as entry:
+        entry.artifact = DISK
+    stub = SimpleNamespace(
+        backend=SimpleNamespace(
+            destroy=lambda name: calls.append(("destroy", name)),
+            undefine=lambda name: calls.append(("undefine", name)),
+        ),
+        inventory=SimpleNamespace(remove_domain=lambda name: None),
+        journal=journal,
+        config_parser=SimpleNamespace(get_node=lambda name: {"ip_address": "10.0.0.5"}),
+        discard_snapshots=lambda name: None,
+        discard_ssh_sessions=lambda hosts: calls.append(("ssh", hosts)),
+    )
+    monkeypatch.setattr(
+        "cli.OSUtils.run_command", lambda command, sudo=False: calls.append(command)
+    )
+    CLI.remove_domain(stub, "node-1", ["/srv/old-images/node-1.qcow2"])
+
+    assert calls == [
+        ("destroy", "node-1"),
+        ("undefine", "node-1"),
+        ["rm", "-f", "/srv/old-images/node-1.qcow2"],
+        ("ssh", ["10.0.0.5"]),
+    ]
+    assert journal.entries("node-1") == []
+    assert journal.placements() == {}
+    journal.close()
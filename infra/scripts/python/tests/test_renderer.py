@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+from cloud_init.config import CloudInit
+from cloud_init.renderer import CloudInitRenderer
+
+GLOBAL_CONFIG = {
+    "nameservers": ["8.8.8.8", "8.8.4.4"],
+    "timezone": "UTC",
+    "package_update": True,
+    "packages": ["curl"],
+    "runcmd": ["echo ready"],
+}
+
+
+@pytest.fixture
+def renderer() -> CloudInitRenderer:
+    return CloudInitRenderer.from_global_config(
+        "root", ["ssh-ed25519 AAAAC3Nza test@example"], GLOBAL_CONFIG
+    )
+
+
+@pytest.mark.parametrize("name", ["leap-k8s-worker-1", "needs quoting: yes"])
+def test_rendered_seed_matches_a_plain_cloud_init(renderer, name):
+    node = {
+        "name": name,
+        "ip_address": "192.168.10.111",
+        "gateway_address": "192.168.10.1",
+    }
+    rendered = renderer.render(node)
+    plain = CloudInit(
+        hostname=name,
+        ip_address=node["ip_address"],
+        ssh_user="root",
+        ssh_public_keys_content=["ssh-ed25519 AAAAC3Nza test@example"],
+        nameservers=GLOBAL_CONFIG["nameservers"],
+        gateway=node["gateway_address"],
+        timezone="UTC",
+        package_update=True,
+        packages=["curl"],
+        runcmd=["echo ready"],
+    )
+    assert rendered.generate_user_data() == plain.generate_user_data()
+    assert rendered.generate_network_config() == plain.generate_network_config()
+    # Instance IDs are random until the seed cache seals them.
+    rendered_meta = json.loads(rendered.generate_meta_data())
+    plain_meta = json.loads(plain.generate_meta_data())
+    assert rendered_meta["local-hostname"] == plain_meta["local-hostname"] == name
+    # The base class's own state is there for any CloudInit method to use.
+    assert rendered.user_data_config.to_yaml() == plain.generate_user_data()
+    assert rendered.network_config.to_yaml() == plain.generate_network_config()
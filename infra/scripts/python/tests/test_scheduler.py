@@ -0,0 +1,131 @@
+import copy
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from hypervisor.base import HostCapacity
+from scheduler import HostFleet, HostSpec, HostState, PlacementScheduler
+from vms.inventory import LibvirtInventory
+
+GIB_KIB = 1024**2
+
+
+def host(name: str, cpus: int, memory_gb: int, disk_gb: int = 100, domains=None):
+    capacity = HostCapacity(
+        cpus=cpus,
+        memory_kib=memory_gb * GIB_KIB,
+        storage_free_bytes=disk_gb * 1024**3,
+    )
+    for domain, (vcpus, domain_memory_gb) in (domains or {}).items():
+        capacity.add_domain(domain, vcpus, domain_memory_gb * GIB_KIB)
+    return HostState.from_capacity(HostSpec(name, f"test:///{name}"), capacity)
+
+
+def node(name: str, vcpu: int = 2, memory_gb: int = 4, disk_gb: int = 20, **extra):
+    return {
+        "name": name,
+        "vcpu": vcpu,
+        "memory_gb": memory_gb,
+        "disk_gb": disk_gb,
+        **extra,
+    }
+
+
+def placed(placements) -> dict:
+    return {p.name: (p.host, p.reason) for p in placements}
+
+
+def test_pinned_nodes_go_where_they_are_told():
+    scheduler = PlacementScheduler([host("a", 8, 32), host("b", 8, 32)])
+    placements = scheduler.place([node("n1", host="b")])
+    assert placed(placements) == {"n1": ("b", "pinned")}
+
+
+def test_pinned_node_reports_why_it_cannot_go():
+    down = HostState(HostSpec("c", "test:///c"), error="connection refused")
+    scheduler = PlacementScheduler([host("a", 2, 4), down])
+    placements = scheduler.place(
+        [node("big", vcpu=4, host="a"), node("lost", host="x"), node("off", host="c")]
+    )
+    assert placed(placements) == {
+        "big": (None, "does not fit on pinned host a"),
+        "lost": (None, "unknown host 'x'"),
+        "off": (None, "host c is down: connection refused"),
+    }
+
+
+def test_existing_nodes_stay_and_are_not_counted_twice():
+    busy = host("a", 4, 8, domains={"n1": (2, 4)})
+    scheduler = PlacementScheduler([busy, host("b", 8, 32)])
+    placements = scheduler.place([node("n1")])
+    assert placed(placements) == {"n1": ("a", "existing")}
+    assert busy.free[0] == 2  # Only what the domain already took.
+
+
+def test_recorded_host_is_reused_while_it_has_room():
+    scheduler = PlacementScheduler(
+        [host("a", 8, 32), host("b", 8, 32)], recorded={"n1": "b", "n2": "b"}
+    )
+    placements = scheduler.place([node("n1", vcpu=6), node("n2", vcpu=6)])
+    # n2's record loses to n1's, and it packs onto the other host.
+    assert placed(placements) == {"n1": ("b", "recorded"), "n2": ("a", "packed")}
+
+
+def test_best_fit_takes_the_tightest_host_largest_node_first():
+    scheduler = PlacementScheduler(
+        [host("roomy", 16, 64), host("snug", 4, 8), host("mid", 8, 16)]
+    )
+    placements = scheduler.place(
+        [node("small", 2, 4), node("large", 8, 16), node("medium", 4, 8)]
+    )
+    assert placed(placements) == {
+        "large": ("mid", "packed"),
+        "medium": ("snug", "packed"),
+        "small": ("roomy", "packed"),
+    }
+
+
+def test_unschedulable_node_says_what_it_needed():
+    scheduler = PlacementScheduler([host("a", 4, 8, disk_gb=10)])
+    [placement] = scheduler.place([node("n1", vcpu=2, memory_gb=4, disk_gb=20)])
+    assert not placement.ok
+    assert placement.reason == (
+        "no host has room for 2 vCPU, 4.0 GiB memory, 20 GiB disk"
+    )
+
+
+class FleetCLI:
+    # Just enough of CLI for HostFleet: a per-host copy with its own backend.
+    journal = None
+    config_parser = SimpleNamespace(base_vm_name="test")
+
+    def for_host(self, backend):
+        host_cli = copy.copy(self)
+        host_cli.backend = backend
+        host_cli.inventory = LibvirtInventory(backend)
+        host_cli.vm_exists = host_cli.inventory.has_domain
+        return host_cli
+
+
+@pytest.mark.skipif(
+    not os.environ.get("VM_PROVISIONER_FLEET_TESTS"),
+    reason="set VM_PROVISIONER_FLEET_TESTS=1 to schedule over two test:/// hosts",
+)
+def test_fleet_schedules_over_two_test_hosts():
+    pytest.importorskip("libvirt")
+    specs = [
+        HostSpec("hv1", "test:///default", backend="libvirt"),
+        HostSpec("hv2", "test:///default", backend="libvirt"),
+    ]
+    fleet = HostFleet(FleetCLI(), specs)
+    nodes = [
+        node("pinned", vcpu=1, memory_gb=0.25, disk_gb=1, host="hv2"),
+        node("packed", vcpu=1, memory_gb=0.25, disk_gb=1),
+    ]
+    states, placements = fleet.schedule(nodes, record=False)
+    assert all(state.up for state in states), [state.error for state in states]
+    assert placed(placements)["pinned"] == ("hv2", "pinned")
+    assert placed(placements)["packed"][0] in ("hv1", "hv2")
+    for host_cli in fleet.hosts.values():
+        host_cli.backend.close()
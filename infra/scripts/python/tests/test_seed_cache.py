@@ -0,0 +1,52 @@
+from cloud_init.cache import SeedISOCache
+from cloud_init.config import CloudInit
+from cloud_init.iso_builder import CloudInitISOBuilder
+
+
+def config(packages: list[str]) -> CloudInit:
+    return CloudInit(
+        hostname="cache-test-node",
+        ip_address="192.168.10.50",
+        ssh_user="root",
+        ssh_public_keys_content=["ssh-ed25519 AAAAC3Nza test@example"],
+        nameservers=["8.8.8.8"],
+        gateway="192.168.10.1",
+        packages=packages,
+    )
+
+
+def cached_build(cache: SeedISOCache, seed: CloudInit, base_dir: str) -> str:
+    # What CLI.build_cloud_init_iso does with a seed cache.
+    digest = cache.seal(seed)
+    iso_path = cache.lookup(seed.hostname, digest)
+    if iso_path is None:
+        iso_path = CloudInitISOBuilder(seed, base_dir, "native").build_iso()
+        cache.store(seed.hostname, digest, iso_path)
+    return iso_path
+
+
+def test_hit_returns_the_stored_iso(tmp_path):
+    cache = SeedISOCache(str(tmp_path))
+    iso_path = cached_build(cache, config(["curl"]), str(tmp_path))
+    seed = config(["curl"])
+    assert cache.lookup(seed.hostname, cache.seal(seed)) == iso_path
+
+
+def read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def test_iso_rewritten_without_the_cache_is_not_reused(tmp_path):
+    cache = SeedISOCache(str(tmp_path))
+    iso_path = cached_build(cache, config(["curl"]), str(tmp_path))
+    assert b"- jq" not in read(iso_path)
+
+    # A run with the cache off rebuilds the same path for another config.
+    CloudInitISOBuilder(config(["curl", "jq"]), str(tmp_path), "native").build_iso()
+    assert b"- jq" in read(iso_path)
+
+    seed = config(["curl"])
+    assert cache.lookup(seed.hostname, cache.seal(seed)) is None
+    assert cached_build(cache, config(["curl"]), str(tmp_path)) == iso_path
+    assert b"- jq" not in read(iso_path)
@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import pytest
+
+from journal import ProvisionJournal
+from snapshots import ClusterSnapshots
+
+DOMAIN_XML = """<domain><name>{name}</name><devices>
+  <disk device='disk'><source file='/images/{name}.qcow2'/><target dev='vda'/></disk>
+</devices></domain>"""
+
+
+class FakeBackend:
+    manages_storage = False
+
+    def __init__(self, failing: set):
+        self.failing = failing
+        self.snapshotted = []
+
+    def dump_xml(self, vm_name: str, inactive: bool = False) -> str:
+        return DOMAIN_XML.format(name=vm_name)
+
+    def is_active(self, vm_name: str) -> bool:
+        return False
+
+    def resume(self, vm_name: str) -> None:
+        pass
+
+    def create_snapshot(self, vm_name: str, xml: str, disk_only: bool = True):
+        if vm_name in self.failing:
+            raise RuntimeError("disk busy")
+        self.snapshotted.append(vm_name)
+
+
+@pytest.fixture
+def cluster(tmp_path):
+    backend = FakeBackend(failing={"n2"})
+    journal = ProvisionJournal(str(tmp_path / "journal.db"))
+    cli = SimpleNamespace(
+        journal=journal,
+        fleet=None,
+        backend=backend,
+        vm_exists=lambda vm_name: True,
+        inventory=SimpleNamespace(add_domain=lambda vm_name: None),
+    )
+    yield ClusterSnapshots(cli), backend
+    journal.close()
+
+
+NODES = [{"name": "n1"}, {"name": "n2"}, {"name": "n3"}]
+
+
+def test_retaking_a_partial_snapshot_completes_the_missing_nodes(cluster):
+    snapshots, backend = cluster
+    first = snapshots.take("bootstrapped", NODES)
+    assert [r.status for r in first] == ["snapshotted", "failed", "snapshotted"]
+
+    backend.failing.clear()
+    second = snapshots.take("bootstrapped", NODES)
+    assert [(r.status, r.detail) for r in second] == [
+        ("snapshotted", "taken earlier"),
+        ("snapshotted", "disk"),
+        ("snapshotted", "taken earlier"),
+    ]
+    assert backend.snapshotted == ["n1", "n3", "n2"]
+    nodes = {record.node for record in snapshots.journal.snapshots()}
+    assert nodes == {"n1", "n2", "n3"}
+
+
+def test_complete_snapshot_is_not_taken_again(cluster):
+    snapshots, backend = cluster
+    backend.failing.clear()
+    snapshots.take("bootstrapped", NODES)
+    with pytest.raises(ValueError, match="already exists"):
+        snapshots.take("bootstrapped", NODES)
@@ -0,0 +1,44 @@
+from status import StatusMonitor, format_status_table
+
+
+class Backend:
+    def __init__(self, stats: dict = None, error: str = None):
+        self.stats = stats
+        self.error = error
+
+    def domain_stats(self) -> dict:
+        if self.error is not None:
+            raise RuntimeError(f"{self.error}\ndetails")
+        return self.stats
+
+
+def node(name: str) -> tuple[str, dict]:
+    return "worker", {"name": name, "vcpu": 2, "memory_gb": 4}
+
+
+def test_unreachable_host_marks_its_nodes_unknown():
+    monitor = StatusMonitor(
+        {
+            "hv1": Backend({"n1": {"state.state": 1, "vcpu.current": 2}}),
+            "hv2": Backend(error="failed to connect to the hypervisor"),
+        },
+        [node("n1"), node("n2")],
+        placements={"n1": "hv1", "n2": "hv2"},
+    )
+    statuses = monitor.statuses(monitor.sample())
+    assert [(s.name, s.host, s.state, s.error) for s in statuses] == [
+        ("n1", "hv1", "running", None),
+        ("n2", "hv2", "unknown", "failed to connect to the hypervisor"),
+    ]
+    table = format_status_table(statuses).splitlines()
+    assert table[0].endswith("ERROR")
+    assert table[2].endswith("failed to connect to the hypervisor")
+
+
+def test_local_host_without_domstats_reports_every_node():
+    monitor = StatusMonitor(
+        {None: Backend(error="error: unknown command: 'domstats'")}, [node("n1")]
+    )
+    [status] = monitor.statuses(monitor.sample())
+    assert status.state == "unknown"
+    assert status.error == "error: unknown command: 'domstats'"
@@ -0,0 +1,55 @@
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+from vms.storage import GIB, DiskPlacer
+
+POOLS = {"fast": ("/pools/fast", 100 * GIB), "slow": ("/pools/slow", 100 * GIB)}
+
+
+def placer(targets: list[dict], disks: dict = None, min_free_gb: float = 0):
+    # disks: domain name -> the pool its disk is in.
+    disks = disks or {}
+
+    def domain_xml(name):
+        path = f"{POOLS[disks[name]][0]}/{name}.qcow2"
+        return ET.fromstring(
+            f"<domain><devices><disk device='disk'><source file='{path}'/></disk>"
+            "</devices></domain>"
+        )
+
+    backend = SimpleNamespace(
+        manages_storage=True, storage_pool=lambda name: POOLS[name]
+    )
+    inventory = SimpleNamespace(
+        backend=backend, domains=lambda: list(disks), domain_xml=domain_xml
+    )
+    return DiskPlacer.from_config(
+        inventory, {"targets": targets, "min_free_gb": min_free_gb}
+    )
+
+
+def test_disks_go_where_load_per_weight_is_lowest():
+    targets = [{"pool": "fast", "weight": 2}, {"pool": "slow"}]
+    disks = {"a": "fast", "b": "fast"}
+    placements = placer(targets, disks)
+    # fast: (2 + 1) / 2 = 1.5 against slow's (0 + 1) / 1.
+    assert placements.place("vm-1").target.name == "slow"
+    # Placed but not yet defined counts too: slow is now at (1 + 1) / 1.
+    assert placements.place("vm-2").target.name == "fast"
+    placement = placements.place("vm-3")
+    assert placement.disk_path == "/pools/fast/vm-3.qcow2"
+    assert placement.load == 3
+
+
+def test_targets_below_min_free_gb_are_skipped():
+    targets = [{"pool": "fast"}, {"pool": "slow"}]
+    placements = placer(targets, min_free_gb=40)
+    # A second 50 GiB disk would leave a pool below 40 GiB free.
+    assert placements.place("vm-1", 50 * GIB).target.name == "fast"
+    assert placements.place("vm-2", 50 * GIB).target.name == "slow"
+    with pytest.raises(ValueError, match="fast: 50.0 GiB free; slow: 50.0 GiB"):
+        placements.place("vm-3", 50 * GIB)
+    placements.settle("vm-1")
+    assert placements.place("vm-3", 50 * GIB).target.name == "fast"
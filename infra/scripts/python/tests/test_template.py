@@ -0,0 +1,117 @@
+import copy
+import xml.etree.ElementTree as ET
+
+import pytest
+
+from vms.domain import memory_gb_to_kib
+from vms.template import DomainTemplate, DomainValidator, patch_domain
+
+BASE_XML = """<domain type='kvm'>
+  <name>leap-base-VM-latest</name>
+  <uuid>11111111-2222-3333-4444-555555555555</uuid>
+  <memory unit='KiB'>4194304</memory>
+  <currentMemory unit='KiB'>4194304</currentMemory>
+  <vcpu placement='static'>2</vcpu>
+  <os><type arch='x86_64' machine='pc-q35-8.2'>hvm</type><boot dev='cdrom'/></os>
+  <cpu mode='host-passthrough'><topology sockets='1' cores='2' threads='1'/></cpu>
+  <devices>
+    <disk type='file' device='disk'>
+      <driver name='qemu' type='qcow2'/>
+      <source file='/var/lib/libvirt/images/leap-base.qcow2'/>
+      <target dev='vda' bus='virtio'/>
+    </disk>
+    <disk type='file' device='cdrom'>
+      <target dev='sda' bus='sata'/>
+      <readonly/>
+    </disk>
+    <interface type='bridge'>
+      <mac address='52:54:00:aa:bb:cc'/>
+      <source bridge='br0'/>
+      <model type='virtio'/>
+    </interface>
+  </devices>
+</domain>"""
+UUID = "aaaaaaaa-bbbb-cccc-dddd-eeeeeeeeeeee"
+
+
+def node(name: str, mac: str, **extra) -> dict:
+    return {"name": name, "vcpu": 4, "memory_gb": 8, "mac_address": mac, **extra}
+
+
+def element_tree_xml(node_config: dict, disk_path: str, iso_path: str) -> str:
+    # How domain XML was built before templates: patch a copy of the base.
+    root = copy.deepcopy(ET.fromstring(BASE_XML))
+    patch_domain(
+        root,
+        name=node_config["name"],
+        domain_uuid=UUID,
+        vcpu=node_config["vcpu"],
+        memory_kib=memory_gb_to_kib(node_config["memory_gb"]),
+        node_metadata=node_config,
+        disk_path=disk_path,
+        mac_address=node_config["mac_address"],
+        iso_path=iso_path,
+    )
+    return ET.tostring(root, encoding="unicode", xml_declaration=True)
+
+
+@pytest.mark.parametrize(
+    "node_config",
+    [
+        node("worker-1", "52:54:00:00:00:01"),
+        node("worker-2", "52:54:00:00:00:02", role="worker"),
+        node("gpu-1", "52:54:00:00:00:03", role="worker", pool="gpu"),
+        node("odd & <named>", "52:54:00:00:00:04", pool='a "quoted" pool'),
+    ],
+)
+def test_render_matches_the_element_tree_path(node_config):
+    template = DomainTemplate.compile(ET.fromstring(BASE_XML))
+    disk_path = f"/var/lib/libvirt/images/{node_config['name']}.qcow2"
+    iso_path = f"/srv/cloud-init-data/{node_config['name']}-cidata.iso"
+    rendered = template.render(node_config, disk_path, iso_path, UUID)
+    expected = element_tree_xml(node_config, disk_path, iso_path)
+    assert ET.canonicalize(rendered.xml) == ET.canonicalize(expected)
+
+
+def test_every_field_is_patched():
+    template = DomainTemplate.compile(ET.fromstring(BASE_XML))
+    assert template.field_counts == {
+        "name": 1,
+        "uuid": 1,
+        "vcpu": 2,  # <vcpu> and the topology's cores.
+        "memory_kib": 2,
+        "disk_path": 1,
+        "mac": 1,
+        "iso_path": 1,
+        "meta:role": 1,
+        "meta:pool": 1,
+    }
+
+
+@pytest.mark.parametrize(
+    "second, shared",
+    [
+        (node("worker-1", "52:54:00:00:00:02"), "name worker-1"),
+        (node("worker-2", "52:54:00:00:00:01"), "MAC 52:54:00:00:00:01"),
+        (node("worker-2", "52:54:00:00:00:01".upper()), "MAC 52:54:00:00:00:01"),
+    ],
+)
+def test_render_all_rejects_shared_names_and_macs(second, shared):
+    template = DomainTemplate.compile(ET.fromstring(BASE_XML))
+    nodes = [
+        (node_config, f"/images/{i}.qcow2", f"/isos/{i}.iso")
+        for i, node_config in enumerate([node("worker-1", "52:54:00:00:00:01"), second])
+    ]
+    with pytest.raises(ValueError, match=f"share {shared}"):
+        template.render_all(nodes, DomainValidator(schema_path="/nonexistent"))
+
+
+def test_render_all_accepts_distinct_nodes():
+    template = DomainTemplate.compile(ET.fromstring(BASE_XML))
+    nodes = [
+        (node(f"worker-{i}", f"52:54:00:00:00:0{i}"), f"/images/{i}.qcow2", "/i.iso")
+        for i in range(1, 4)
+    ]
+    rendered = template.render_all(nodes, DomainValidator(schema_path="/nonexistent"))
+    assert [item.name for item in rendered] == ["worker-1", "worker-2", "worker-3"]
+    assert len({item.uuid for item in rendered}) == 3
@@ -0,0 +1,85 @@
+import xml.etree.ElementTree as ET
+from types import SimpleNamespace
+
+import pytest
+
+from vms.tuning import NUMAPlacer, PerformanceProfile
+
+
+def capabilities(cells: int = 2, cores: int = 4) -> str:
+    # cores two-thread cores per cell; core c of a cell holds CPUs c and c+cores.
+    xml = ["<capabilities><host><topology><cells num='%d'>" % cells]
+    for cell in range(cells):
+        first = cell * cores * 2
+        xml.append(f"<cell id='{cell}'><cpus num='{cores * 2}'>")
+        for core in range(cores):
+            siblings = f"{first + core},{first + core + cores}"
+            for cpu in (first + core, first + core + cores):
+                xml.append(f"<cpu id='{cpu}' siblings='{siblings}'/>")
+        xml.append("</cpus></cell>")
+    xml.append("</cells></topology></host></capabilities>")
+    return "".join(xml)
+
+
+def placer(domains: dict = None) -> NUMAPlacer:
+    # domains: name -> host CPUs its vCPUs are pinned to.
+    domains = domains or {}
+
+    def domain_xml(name):
+        pins = "".join(
+            f"<vcpupin vcpu='{i}' cpuset='{cpu}'/>"
+            for i, cpu in enumerate(domains[name])
+        )
+        return ET.fromstring(f"<domain><cputune>{pins}</cputune></domain>")
+
+    backend = SimpleNamespace(capabilities=capabilities)
+    return NUMAPlacer(
+        SimpleNamespace(
+            backend=backend, domains=lambda: list(domains), domain_xml=domain_xml
+        )
+    )
+
+
+def pinned(numa_node: int = 0) -> PerformanceProfile:
+    return PerformanceProfile.from_config(
+        "pinned", {"cpu_pinning": True, "numa_node": numa_node}
+    )
+
+
+def test_successive_nodes_get_whole_cores_of_their_own():
+    numa = placer()
+    first = numa.place("vm-1", 3, 1024 * 1024, pinned())
+    second = numa.place("vm-2", 2, 1024 * 1024, pinned())
+
+    # CPU 0's core is kept for the host; vm-1's odd vCPU still takes a
+    # whole core, so vm-2 gets neither CPU 2 nor its sibling 6.
+    assert first.vcpu_pins == [1, 5, 2]
+    assert second.vcpu_pins == [3, 7]
+    topology = numa.topology()
+    first_cores = {topology.core_of(cpu) for cpu in first.vcpu_pins}
+    second_cores = {topology.core_of(cpu) for cpu in second.vcpu_pins}
+    assert not first_cores & second_cores
+    assert first.housekeeping == second.housekeeping == {0, 4}
+
+
+def test_cell_is_refused_once_its_cores_are_used_up():
+    numa = placer()
+    numa.place("vm-1", 4, 1024 * 1024, pinned())
+    with pytest.raises(ValueError, match="node 0 has 2 free CPU"):
+        numa.place("vm-2", 4, 1024 * 1024, pinned())
+    # Placing the same node again does not count its own claim.
+    assert numa.place("vm-1", 4, 1024 * 1024, pinned()).vcpu_pins == [1, 5, 2, 6]
+
+
+def test_pins_of_defined_domains_are_honoured():
+    numa = placer({"existing": [9, 10]})
+    placement = numa.place("vm-1", 4, 1024 * 1024, pinned(numa_node=1))
+    # Cores (9, 13) and (10, 14) belong to the existing domain.
+    assert placement.vcpu_pins == [8, 12, 11, 15]
+
+
+def test_unpinned_cell_choice_is_best_fit():
+    numa = placer({"existing": [9, 13, 10, 14]})
+    profile = PerformanceProfile.from_config("pinned", {"cpu_pinning": True})
+    # Node 1 has two free cores to node 0's three; a 2-vCPU VM fits either.
+    assert numa.place("vm-1", 2, 1024 * 1024, profile).cell == 1
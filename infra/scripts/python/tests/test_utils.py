@@ -0,0 +1,114 @@
+import asyncio
+import os
+import subprocess
+import time
+
+import pytest
+
+from tracing import Tracer
+from utils import AsyncCommandRunner, OSUtils
+
+
+@pytest.fixture
+def relayed(monkeypatch, capsys):
+    # What the daemon does. capsys replaces sys.stdout and sys.stderr at the
+    # Python level only, so it sees a child's output only if it is relayed.
+    monkeypatch.setattr(OSUtils, "relay_output", True)
+    return capsys
+
+
+def test_run_command_relays_child_output(relayed):
+    OSUtils.run_command("echo out; echo err >&2", shell=True)
+    assert relayed.readouterr() == ("out\n", "err\n")
+
+
+def test_run_command_relays_output_of_a_failing_child(relayed):
+    with pytest.raises(subprocess.CalledProcessError):
+        OSUtils.run_command("echo partial; exit 3", shell=True)
+    assert relayed.readouterr().out == "partial\n"
+
+
+def test_async_runner_relays_uncaptured_output(relayed):
+    runner = AsyncCommandRunner()
+    asyncio.run(runner.run_command(["echo", "hello"], capture_output=False))
+    assert relayed.readouterr().out == "hello\n"
+
+
+def test_scoped_spans_stay_out_of_the_trace():
+    tracer = Tracer()
+    with tracer.span("job", "node"):
+        pass
+    with tracer.scope() as spans:
+        with tracer.span("read", "node"):
+            pass
+    assert [span.name for span in spans] == ["read"]
+    assert [span.name for span in tracer.spans()] == ["job"]
+
+
+def tool(tmp_path, name: str, failures: int, stderr: str) -> tuple:
+    # A command that fails its first attempts with stderr, then succeeds.
+    attempts = tmp_path / f"{name}.attempts"
+    path = tmp_path / name
+    path.write_text(
+        "#!/bin/sh\n"
+        f"echo x >> {attempts}\n"
+        f"if [ $(wc -l < {attempts}) -le {failures} ]; then\n"
+        f"  echo '{stderr}' >&2; exit 1\n"
+        "fi\n"
+        "echo ok\n"
+    )
+    path.chmod(0o755)
+    return str(path), attempts
+
+
+def attempts_of(attempts) -> int:
+    return len(attempts.read_text().splitlines())
+
+
+def run(runner: AsyncCommandRunner, command: list[str], **kwargs):
+    return asyncio.run(runner.run_command(command, check_output=True, **kwargs))
+
+
+def test_transient_virsh_errors_are_retried(tmp_path):
+    virsh, attempts = tool(tmp_path, "virsh", 2, "error: resource busy")
+    runner = AsyncCommandRunner(retries=3, retry_backoff=0)
+    assert run(runner, [virsh, "start", "node-1"]) == "ok"
+    assert attempts_of(attempts) == 3
+
+
+def test_retries_give_up_after_the_limit(tmp_path):
+    virsh, attempts = tool(tmp_path, "virsh", 5, "error: resource busy")
+    runner = AsyncCommandRunner(retries=2, retry_backoff=0)
+    with pytest.raises(subprocess.CalledProcessError) as raised:
+        run(runner, [virsh, "start", "node-1"])
+    assert "resource busy" in raised.value.stderr
+    assert attempts_of(attempts) == 3
+
+
+@pytest.mark.parametrize(
+    "name, stderr",
+    [
+        ("virsh", "error: domain 'node-1' already exists"),
+        ("qemu-img", "error: resource busy"),
+    ],
+)
+def test_other_failures_are_not_retried(tmp_path, name, stderr):
+    command, attempts = tool(tmp_path, name, 1, stderr)
+    runner = AsyncCommandRunner(retries=3, retry_backoff=0)
+    with pytest.raises(subprocess.CalledProcessError):
+        run(runner, [command])
+    assert attempts_of(attempts) == 1
+
+
+def test_timeout_kills_the_child(tmp_path):
+    pid_file = tmp_path / "pid"
+    script = tmp_path / "virsh"
+    script.write_text(f"#!/bin/sh\necho $$ > {pid_file}\nexec sleep 30\n")
+    script.chmod(0o755)
+    runner = AsyncCommandRunner(timeout=0.5)
+    start = time.monotonic()
+    with pytest.raises(subprocess.TimeoutExpired):
+        run(runner, [str(script)])
+    assert time.monotonic() - start < 5
+    with pytest.raises(ProcessLookupError):
+        os.kill(int(pid_file.read_text()), 0)
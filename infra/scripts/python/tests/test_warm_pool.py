@@ -0,0 +1,54 @@
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+import vms.warm_pool as warm_pool
+from vms.warm_pool import WarmPool
+
+BASE_XML = (
+    "<domain><devices><disk device='disk'>"
+    "<source file='/var/lib/libvirt/images/base.qcow2'/>"
+    "</disk></devices></domain>"
+)
+
+
+class FakeBackend:
+    name = "virsh"
+    uri = "qemu+ssh://root@hv1/system"
+
+
+class FakeInventory:
+    backend = FakeBackend()
+
+    def domain_xml(self, name: str) -> ET.Element:
+        return ET.fromstring(BASE_XML)
+
+
+def test_concurrent_refills_stop_at_the_target(tmp_path, monkeypatch):
+    # qemu-img stands in as a short sleep so the refills overlap.
+    monkeypatch.setattr(
+        warm_pool.OSUtils, "run_command", staticmethod(lambda *a, **k: time.sleep(0.02))
+    )
+    pool = WarmPool("base", FakeInventory(), pool_dir=str(tmp_path))
+    refills = [threading.Thread(target=pool.warm, args=(5, 8)) for _ in range(4)]
+    for refill in refills:
+        refill.start()
+    for refill in refills:
+        refill.join()
+    assert len(pool.slots()) == 5
+    assert pool.orphaned_staged_xml() == []
+
+
+def test_refill_uses_the_parent_connection(tmp_path, monkeypatch):
+    launched = []
+    monkeypatch.setattr(
+        warm_pool.subprocess, "Popen", lambda argv, **kwargs: launched.append(argv)
+    )
+    pool = WarmPool("base", FakeInventory(), pool_dir=str(tmp_path))
+    with pool._state() as state:
+        state["target"] = 2
+    pool.refill_in_background("cluster.yaml")
+    argv = launched[0]
+    assert argv[argv.index("--backend") + 1] == "virsh"
+    assert argv[argv.index("--uri") + 1] == "qemu+ssh://root@hv1/system"
+    assert argv[-3:] == ["pool", "warm", "2"]
@@ -0,0 +1,289 @@
+import asyncio
+import contextvars
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+
+from tables import format_table
+
+METRIC_PREFIX = "softlabor"
+QUANTILES = (0.5, 0.95, 0.99)
+
+# A context variable rather than a thread-local, so that asyncio tasks sharing
+# one thread each see their own node.
+_current_node = contextvars.ContextVar("trace_node", default=None)
+# Set inside Tracer.scope(): where this context's spans go instead.
+_scope = contextvars.ContextVar("trace_scope", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    category: str
+    node: str = None
+    command: str = None
+    exit_code: int = None
+    error: str = None
+    start: float = 0.0
+    duration: float = 0.0
+    thread_id: int = 0
+    attrs: dict = field(default_factory=dict)
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None and self.exit_code in (None, 0)
+
+
+def command_label(command: list[str]) -> str:
+    # "sudo virsh -c qemu:///system define --file x" -> "virsh define"
+    args = list(command)
+    if args[:1] == ["sudo"]:
+        args = args[1:]
+    if not args:
+        return "command"
+    tool = os.path.basename(args[0])
+    rest = args[1:]
+    if tool == "virsh" and rest[:1] == ["-c"]:
+        rest = rest[2:]
+    if tool in ("virsh", "qemu-img") and rest and not rest[0].startswith("-"):
+        return f"{tool} {rest[0]}"
+    return tool
+
+
+def _execution_id() -> int:
+    # Concurrent asyncio tasks get their own lane in the trace viewer.
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    return id(task) if task is not None else threading.get_ident()
+
+
+def _percentile(ordered: list[float], quantile: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[max(math.ceil(quantile * len(ordered)) - 1, 0)]
+
+
+class Tracer:
+    def __init__(self):
+        self._spans = []
+        self._lock = threading.Lock()
+        self._epoch = time.time() - time.monotonic()
+
+    def current_node(self) -> str:
+        return _current_node.get()
+
+    @contextmanager
+    def span(
+        self, name: str, category: str = "phase", node: str = None, command=None
+    ):
+        # Spans opened without a node inherit the one of the enclosing span on
+        # this thread or task, so commands run deep inside a phase are attributed.
+        record = Span(
+            name=name,
+            category=category,
+            node=node or self.current_node(),
+            command=" ".join(command) if isinstance(command, list) else command,
+            thread_id=_execution_id(),
+        )
+        token = _current_node.set(record.node)
+        start = time.monotonic()
+        try:
+            yield record
+        except BaseException as e:
+            if record.exit_code is None:
+                record.exit_code = getattr(e, "returncode", 1)
+            record.error = str(e).strip() or type(e).__name__
+            raise
+        finally:
+            _current_node.reset(token)
+            record.duration = time.monotonic() - start
+            record.start = self._epoch + start
+            if record.exit_code is None:
+                record.exit_code = 0
+            scoped = _scope.get()
+            if scoped is not None:
+                scoped.append(record)
+            else:
+                with self._lock:
+                    self._spans.append(record)
+
+    @contextmanager
+    def scope(self):
+        # Spans of this thread or task (and of contexts copied from it) are
+        # collected apart from the shared trace and dropped afterwards, so a
+        # request served beside a running job neither joins nor clears it.
+        spans = []
+        token = _scope.set(spans)
+        try:
+            yield spans
+        finally:
+            _scope.reset(token)
+
+    def spans(self, category: str = None) -> list[Span]:
+        with self._lock:
+            spans = list(self._spans)
+        if category is not None:
+            spans = [span for span in spans if span.category == category]
+        return spans
+
+    def reset(self) -> None:
+        with self._lock:
+            self._spans = []
+
+    def _grouped(self) -> dict[tuple[str, str], list[Span]]:
+        groups = {}
+        for span in self.spans():
+            groups.setdefault((span.category, span.name), []).append(span)
+        return groups
+
+    def format_summary(self) -> str:
+        headers = ("CATEGORY", "SPAN", "COUNT", "FAILED", "TOTAL", "P50", "P95", "MAX")
+        rows = []
+        for (category, name), spans in sorted(self._grouped().items()):
+            durations = sorted(span.duration for span in spans)
+            rows.append(
+                (
+                    category,
+                    name,
+                    str(len(spans)),
+                    str(sum(1 for span in spans if not span.ok)),
+                    f"{sum(durations):.2f}s",
+                    f"{_percentile(durations, 0.5) * 1000:.0f}ms",
+                    f"{_percentile(durations, 0.95) * 1000:.0f}ms",
+                    f"{durations[-1] * 1000:.0f}ms",
+                )
+            )
+        lines = ["Trace summary:", format_table(headers, rows)]
+
+        slowest = sorted(self.spans("node"), key=lambda s: s.duration, reverse=True)
+        if slowest:
+            lines.append(
+                "Slowest nodes: "
+                + ", ".join(f"{s.node} {s.duration:.1f}s" for s in slowest[:5])
+            )
+        return "\n".join(lines)
+
+    def write_chrome_trace(self, path: str) -> None:
+        # Complete ("X") events, loadable in chrome://tracing and Perfetto.
+        pid = os.getpid()
+        spans = sorted(self.spans(), key=lambda span: span.start)
+        thread_ids = {}
+        events = []
+        for span in spans:
+            tid = thread_ids.setdefault(span.thread_id, len(thread_ids) + 1)
+            args = {"node": span.node, "exit_code": span.exit_code}
+            if span.command:
+                args["command"] = span.command
+            if span.error:
+                args["error"] = span.error
+            args.update(span.attrs)
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": span.category,
+                    "ph": "X",
+                    "ts": round(span.start * 1e6),
+                    "dur": round(span.duration * 1e6),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": args,
+                }
+            )
+        events.extend(
+            {
+                "name": "thread_name",
+                "ph": "M",
+                "pid": pid,
+                "tid": tid,
+                "args": {"name": f"worker-{tid}"},
+            }
+            for tid in thread_ids.values()
+        )
+        _write_atomic(path, json.dumps({"traceEvents": events}))
+
+    def format_prometheus(self) -> str:
+        duration_metric = f"{METRIC_PREFIX}_span_duration_seconds"
+        failures_metric = f"{METRIC_PREFIX}_span_failures_total"
+        node_metric = f"{METRIC_PREFIX}_node_provision_seconds"
+        lines = [
+            f"# HELP {duration_metric} Duration of traced provisioning spans.",
+            f"# TYPE {duration_metric} summary",
+        ]
+        groups = sorted(self._grouped().items())
+        for (category, name), spans in groups:
+            labels = f'category="{_escape(category)}",name="{_escape(name)}"'
+            durations = sorted(span.duration for span in spans)
+            for quantile in QUANTILES:
+                lines.append(
+                    f'{duration_metric}{{{labels},quantile="{quantile}"}} '
+                    f"{_percentile(durations, quantile):.6f}"
+                )
+            lines.append(f"{duration_metric}_sum{{{labels}}} {sum(durations):.6f}")
+            lines.append(f"{duration_metric}_count{{{labels}}} {len(durations)}")
+
+        lines.append(f"# HELP {failures_metric} Traced spans that failed.")
+        lines.append(f"# TYPE {failures_metric} counter")
+        for (category, name), spans in groups:
+            labels = f'category="{_escape(category)}",name="{_escape(name)}"'
+            failed = sum(1 for span in spans if not span.ok)
+            lines.append(f"{failures_metric}{{{labels}}} {failed}")
+
+        lines.append(f"# HELP {node_metric} Wall time to provision each node.")
+        lines.append(f"# TYPE {node_metric} gauge")
+        for span in self.spans("node"):
+            labels = f'node="{_escape(span.node)}",ok="{str(span.ok).lower()}"'
+            lines.append(f"{node_metric}{{{labels}}} {span.duration:.6f}")
+
+        lines.append(
+            f"# HELP {METRIC_PREFIX}_last_run_timestamp_seconds "
+            "Time the metrics were written."
+        )
+        lines.append(f"# TYPE {METRIC_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(f"{METRIC_PREFIX}_last_run_timestamp_seconds {time.time():.3f}")
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path: str) -> None:
+        # node_exporter's textfile collector may read at any time: never let it
+        # see a half-written file.
+        _write_atomic(path, self.format_prometheus())
+
+    def finish(
+        self, summary: bool = True, trace_file: str = None, metrics_file: str = None
+    ) -> None:
+        # Plain queries (list, plan) only record commands; keep them quiet.
+        if summary and any(span.category != "command" for span in self.spans()):
+            print()
+            print(self.format_summary())
+        try:
+            if trace_file:
+                self.write_chrome_trace(trace_file)
+                print(f"Wrote trace to {trace_file}")
+            if metrics_file:
+                self.write_prometheus(metrics_file)
+                print(f"Wrote metrics to {metrics_file}")
+        except OSError as e:
+            print(f"Error exporting trace: {e}")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _write_atomic(path: str, content: str) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    return _tracer
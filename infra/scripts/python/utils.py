@@ -1,20 +1,170 @@
+import asyncio
+import os
 import subprocess
+import sys
+
+from tracing import command_label, get_tracer
 
 
 class OSUtils:
+    # Set while sys.stdout and sys.stderr are Python-level routers (the
+    # daemon's). A child writes to the process's real fds and would bypass
+    # them, so its output is captured and printed through them instead.
+    relay_output = False
+
+    @staticmethod
+    def _run_relayed(command: list[str], shell: bool) -> None:
+        result = subprocess.run(command, capture_output=True, text=True, shell=shell)
+        sys.stdout.write(result.stdout)
+        sys.stderr.write(result.stderr)
+        if result.returncode != 0:
+            raise subprocess.CalledProcessError(
+                result.returncode, command, result.stdout, result.stderr
+            )
+
     @staticmethod
     def run_command(command: list[str], check_output=False, shell=False, sudo=False, capture_output: bool = True):
         if sudo:
             command = ["sudo"] + command
+        with get_tracer().span(
+            command_label(command), category="command", command=command
+        ) as span:
+            try:
+                if check_output:
+                    result = subprocess.run(
+                        command, check=True, capture_output=capture_output, text=True, shell=shell
+                    )
+                    return result.stdout.strip()
+                elif OSUtils.relay_output:
+                    OSUtils._run_relayed(command, shell)
+                else:
+                    subprocess.run(command, check=True, shell=shell)
+            except subprocess.CalledProcessError:
+                raise
+            except FileNotFoundError:
+                span.exit_code = 127
+                raise
+
+
+# stderr fragments of libvirt failures that usually clear up on their own:
+# daemon restarts, dropped connections and contended domain job locks.
+TRANSIENT_ERRORS = (
+    "failed to connect socket",
+    "cannot recv data",
+    "end of file while reading data",
+    "internal error: connection closed",
+    "cannot acquire state change lock",
+    "timed out during operation",
+    "resource busy",
+)
+DEFAULT_COMMAND_LIMITS = {
+    "qemu-img": 4,
+    "virsh": 16,
+    "mkisofs": 4,
+    "disk-clone": 2,
+    "ssh": 16,
+    "default": 8,
+}
+
+
+# Async counterpart of OSUtils.run_command. Every command waits on a semaphore
+# for its tool, so qemu-img can be throttled independently of cheap virsh calls.
+class AsyncCommandRunner:
+    def __init__(
+        self,
+        command_limits: dict = None,
+        timeout: float = None,
+        retries: int = 3,
+        retry_backoff: float = 0.5,
+    ):
+        limits = dict(DEFAULT_COMMAND_LIMITS)
+        limits.update(command_limits or {})
+        self.command_limits = {tool: max(1, int(n)) for tool, n in limits.items()}
+        self.timeout = timeout
+        self.retries = max(0, int(retries))
+        self.retry_backoff = retry_backoff
+        self._semaphores = {}
+
+    @classmethod
+    def from_config(cls, config: dict) -> "AsyncCommandRunner":
+        return cls(
+            command_limits=config.get("command_limits"),
+            timeout=config.get("timeout_seconds"),
+            retries=config.get("retries", 3),
+            retry_backoff=config.get("retry_backoff", 0.5),
+        )
+
+    def limit(self, tool: str) -> asyncio.Semaphore:
+        # Created lazily so they bind to the loop that actually runs them.
+        if tool not in self._semaphores:
+            limit = self.command_limits.get(tool, self.command_limits["default"])
+            self._semaphores[tool] = asyncio.Semaphore(limit)
+        return self._semaphores[tool]
+
+    @staticmethod
+    def _is_transient(tool: str, stderr: str) -> bool:
+        stderr = (stderr or "").lower()
+        return tool == "virsh" and any(error in stderr for error in TRANSIENT_ERRORS)
+
+    async def _run_once(
+        self, command: list[str], capture_output: bool, timeout: float
+    ) -> tuple[int, str, str]:
+        relay = not capture_output and OSUtils.relay_output
+        process = await asyncio.create_subprocess_exec(
+            *command,
+            stdout=asyncio.subprocess.PIPE if capture_output or relay else None,
+            stderr=asyncio.subprocess.PIPE,
+        )
         try:
-            if check_output:
-                result = subprocess.run(
-                    command, check=True, capture_output=capture_output, text=True, shell=shell
-                )
-                return result.stdout.strip()
-            else:
-                subprocess.run(command, check=True, shell=shell)
-        except subprocess.CalledProcessError:
-            raise
-        except FileNotFoundError:
-            raise
+            stdout, stderr = await asyncio.wait_for(process.communicate(), timeout)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+            raise subprocess.TimeoutExpired(command, timeout)
+        stdout = stdout.decode() if stdout is not None else ""
+        stderr = stderr.decode()
+        if relay:
+            sys.stdout.write(stdout)
+        if not capture_output and stderr:
+            sys.stderr.write(stderr)
+        return process.returncode, stdout, stderr
+
+    async def run_command(
+        self,
+        command: list[str],
+        check_output: bool = False,
+        sudo: bool = False,
+        capture_output: bool = True,
+        timeout: float = None,
+    ):
+        tool = os.path.basename(command[0])
+        if sudo:
+            command = ["sudo"] + command
+        timeout = timeout if timeout is not None else self.timeout
+
+        attempt = 0
+        while True:
+            async with self.limit(tool):
+                with get_tracer().span(
+                    command_label(command), category="command", command=command
+                ) as span:
+                    span.attrs["attempt"] = attempt + 1
+                    try:
+                        returncode, stdout, stderr = await self._run_once(
+                            command, capture_output or check_output, timeout
+                        )
+                    except FileNotFoundError:
+                        span.exit_code = 127
+                        raise
+                    span.exit_code = returncode
+                    if returncode != 0 and (
+                        attempt >= self.retries
+                        or not self._is_transient(tool, stderr)
+                    ):
+                        raise subprocess.CalledProcessError(
+                            returncode, command, stdout, stderr
+                        )
+            if returncode == 0:
+                return stdout.strip() if check_output else None
+            attempt += 1
+            await asyncio.sleep(self.retry_backoff * 2 ** (attempt - 1))
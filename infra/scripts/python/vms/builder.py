@@ -1,7 +1,14 @@
+import asyncio
 import os
-import shutil
-import uuid
-from utils import OSUtils
+from tracing import get_tracer
+from utils import AsyncCommandRunner, OSUtils
+from vms.disk_clone import DiskCloner
+from vms.inventory import LibvirtInventory
+from vms.storage import GIB, DiskPlacer, OverlayOptions
+from vms.domain import memory_gb_to_kib
+from vms.template import DomainTemplate, get_domain_validator
+from vms.tuning import NUMAPlacer, PerformanceProfile, apply_profile, format_cpuset
+from vms.warm_pool import WarmPool
 import xml.etree.ElementTree as ET
 
 
@@ -11,7 +18,21 @@ class VMBuilder:
         vm_config: dict,
         base_vm_name: str,
         cloud_init_iso_path: str,
+        inventory: LibvirtInventory = None,
+        disk_cloner: DiskCloner = None,
+        warm_pool: WarmPool = None,
+        backing_layer: str = None,
+        profile: PerformanceProfile = None,
+        placer: NUMAPlacer = None,
+        overlay_options: OverlayOptions = None,
+        disk_placer: DiskPlacer = None,
     ):
+        self.inventory = inventory if inventory is not None else LibvirtInventory()
+        self.backend = self.inventory.backend
+        self.disk_cloner = disk_cloner if disk_cloner is not None else DiskCloner()
+        self.warm_pool = warm_pool
+        self.warm_slot = None
+        self.tracer = get_tracer()
         self.vm_config = vm_config
         self.base_vm_name = base_vm_name
         self.cloud_init_iso_path = cloud_init_iso_path
@@ -22,118 +43,303 @@ class VMBuilder:
         self.mac_address = vm_config["mac_address"]
         self.disk_dir = None  # To be determined from base VM XML
         self.is_cow_clone = vm_config.get("is_cow_clone", True)
+        # A baked role layer chained on the base; overlays go on top of it.
+        self.backing_layer = backing_layer
+        self.profile = profile
+        self.placer = placer
+        self.overlay_options = overlay_options
+        self.disk_placer = disk_placer
+        self.disk_placement = None
 
     def _get_base_disk_path(self) -> str:
-        base_xml = OSUtils.run_command(
-            ["virsh", "dumpxml", self.base_vm_name], check_output=True
-        )
-        root = ET.fromstring(base_xml)
+        root = self.inventory.domain_xml(self.base_vm_name)
         for disk in root.findall(".//disk[@device='disk']/source"):
             if "file" in disk.attrib:
                 return disk.attrib["file"]
         raise ValueError(f"Could not find base disk path for VM: {self.base_vm_name}")
 
+    def target_disk_path(self, base_disk_path: str) -> str:
+        if self.disk_placement is not None:
+            return self.disk_placement.disk_path
+        return os.path.join(os.path.dirname(base_disk_path), f"{self.vm_name}.qcow2")
+
+    def expected_disk_paths(self) -> list[str]:
+        # Next to the base disk, where overlays went before disk_placement
+        # was configured, then on every placement target.
+        base_dir = os.path.dirname(self._get_base_disk_path())
+        directories = [base_dir]
+        if self.disk_placer is not None:
+            directories += self.disk_placer.directories()
+        paths = []
+        for directory in directories:
+            path = os.path.join(directory, f"{self.vm_name}.qcow2")
+            if path not in paths:
+                paths.append(path)
+        return paths
+
+    def _place_disk(self) -> None:
+        if self.disk_placer is None or not self.disk_placer.enabled:
+            return
+        # Only a full copy or a fully preallocated overlay takes its size up
+        # front; a thin overlay grows later, which min_free_gb leaves room for.
+        allocates = not self.is_cow_clone or (
+            self.overlay_options is not None and self.overlay_options.allocates_fully
+        )
+        with self.tracer.span("vm.place_disk", "vm", self.vm_name) as span:
+            self.disk_placement = self.disk_placer.place(
+                self.vm_name, self.disk_gb * GIB if allocates else 0
+            )
+            span.attrs["target"] = self.disk_placement.target.name
+            span.attrs["load"] = self.disk_placement.load
+        print(f"Placed {self.vm_name}'s disk on {self.disk_placement.describe()}.")
+
+    def _can_claim_warm_slot(self) -> bool:
+        # Warm slots are overlays of the bare base, not of a baked layer, and
+        # are staged next to it; a disk placed elsewhere is built fresh.
+        if (
+            self.warm_pool is None
+            or not self.is_cow_clone
+            or self.backing_layer is not None
+        ):
+            return False
+        return self.disk_placement is None or self.disk_placement.directory == (
+            os.path.dirname(self._get_base_disk_path())
+        )
+
+    def _overlay_command(self, base_disk_path: str, new_disk_path: str) -> list[str]:
+        return [
+            "qemu-img",
+            "create",
+            "-f",
+            "qcow2",
+            "-b",
+            base_disk_path,
+            "-F",
+            "qcow2",
+            *(self.overlay_options.qemu_img_args() if self.overlay_options else []),
+            new_disk_path,
+            f"{self.disk_gb}G",
+        ]
+
     def _clone_disk(self, base_disk_path: str, is_cow: bool = True) -> str:
         self.disk_dir = os.path.dirname(base_disk_path)
-        new_disk_path = os.path.join(self.disk_dir, f"{self.vm_name}.qcow2")
+        new_disk_path = self.target_disk_path(base_disk_path)
 
-        if is_cow:
-            qemu_img_cmd = [
-                "qemu-img",
-                "create",
-                "-f",
-                "qcow2",
-                "-b",
+        if self.backend.manages_storage:
+            return self.backend.create_volume(
                 base_disk_path,
-                "-F",
-                "qcow2",
                 new_disk_path,
-                f"{self.disk_gb}G",
-            ]
+                self.disk_gb,
+                cow=is_cow,
+                pool_name=self._placement_pool(),
+            )
+        if is_cow:
+            qemu_img_cmd = self._overlay_command(
+                self.backing_layer or base_disk_path, new_disk_path
+            )
             OSUtils.run_command(qemu_img_cmd, sudo=True)
 
         else:
-            shutil.copyfile(base_disk_path, new_disk_path)
+            self.disk_cloner.clone(base_disk_path, new_disk_path, label=self.vm_name)
         return new_disk_path
 
-    def _generate_vm_xml(self, new_disk_path: str) -> str:
-        base_xml = OSUtils.run_command(
-            ["virsh", "dumpxml", self.base_vm_name], check_output=True
+    def _generate_vm_xml(self, new_disk_path: str, root: ET.Element = None) -> str:
+        if root is None:
+            template = self.inventory.domain_template(self.base_vm_name)
+        else:
+            template = DomainTemplate.compile(root)
+        rendered = template.render(
+            self.vm_config, new_disk_path, self.cloud_init_iso_path
         )
-        root = ET.fromstring(base_xml)
-
-        name_elem = root.find("name")
-        if name_elem is not None:
-            name_elem.text = self.vm_name
-
-        uuid_elem = root.find("uuid")
-        if uuid_elem is not None:
-            uuid_elem.text = str(uuid.uuid4())
-
-        vcpu_elem = root.find("vcpu")
-        if vcpu_elem is not None:
-            vcpu_elem.text = str(self.vcpu)
-
-        cpu_topology_elem = root.find("cpu/topology")
-        if cpu_topology_elem is not None:
-            cpu_topology_elem.set("cores", str(self.vcpu))
-
-        memory_mb = int(self.memory_gb * 1024)
-        memory_elem = root.find("memory")
-        current_memory_elem = root.find("currentMemory")
-        if memory_elem is not None:
-            memory_elem.text = str(memory_mb * 1024)
-            memory_elem.set("unit", "KiB")
-        if current_memory_elem is not None:
-            current_memory_elem.text = str(memory_mb * 1024)
-            current_memory_elem.set("unit", "KiB")
-
-        for disk in root.findall(".//disk[@device='disk']"):
-            source = disk.find("source")
-            if source is not None and "file" in source.attrib:
-                source.set("file", new_disk_path)
-                if "backing_file" in source.attrib:
-                    del source.attrib["backing_file"]
-
-        for interface in root.findall(".//interface[@type='bridge']"):
-            source = interface.find("source")
-            if source is not None and "br0" in source.get("bridge"):
-                mac = interface.find("mac")
-                if mac is not None:
-                    mac.set("address", self.mac_address)
-                break
-
-        disks_parent = root.find(".//disk[@device='cdrom']..")
-        for disk in disks_parent.findall(".//disk[@device='cdrom']"):
-            disks_parent.remove(disk)
-
-        disk_elem = ET.Element("disk", {"type": "file", "device": "cdrom"})
-        ET.SubElement(disk_elem, "driver", {"name": "qemu", "type": "raw"})
-        ET.SubElement(disk_elem, "source", {"file": self.cloud_init_iso_path})
-        ET.SubElement(disk_elem, "target", {"dev": "hdc", "bus": "sata"})
-        ET.SubElement(disk_elem, "readonly")
-        ET.SubElement(disk_elem, "boot", {"order": "2"})
-
-        disks_parent.append(disk_elem)
-
-        os_boot_elem = root.find(".//os/boot")
-        if os_boot_elem is not None:
-            os_boot_elem.set("dev", "hd")
-
-        return ET.tostring(root, encoding="unicode", xml_declaration=True)
+        vm_xml = self._apply_profile(rendered.xml)
+        get_domain_validator().validate(vm_xml)
+        return vm_xml
 
-    def define_and_start_vm(self) -> None:
-        base_disk_path = self._get_base_disk_path()
-        new_disk_path = self._clone_disk(base_disk_path, self.is_cow_clone)
+    def _apply_profile(self, vm_xml: str) -> str:
+        if self.profile is None:
+            return vm_xml
+        placement = None
+        if self.profile.needs_placement:
+            with self.tracer.span("vm.place_numa", "vm", self.vm_name) as span:
+                placement = self.placer.place(
+                    self.vm_name,
+                    int(self.vcpu),
+                    memory_gb_to_kib(self.memory_gb),
+                    self.profile,
+                )
+                span.attrs["numa_node"] = placement.cell
+            pins = ""
+            if placement.vcpu_pins:
+                pins = f", vCPUs on host CPUs {format_cpuset(placement.vcpu_pins)}"
+            print(
+                f"Placed {self.vm_name} on NUMA node {placement.cell}{pins} "
+                f"(profile '{self.profile.name}')."
+            )
+        root = ET.fromstring(vm_xml)
+        apply_profile(root, self.profile, placement)
+        return ET.tostring(root, encoding="unicode")
+
+    def _placement_pool(self) -> str:
+        if self.disk_placement is None:
+            return None
+        return self.disk_placement.target.pool
+
+    def _settle_placement(self) -> None:
+        if self.placer is not None:
+            self.placer.settle(self.vm_name)
+        if self.disk_placer is not None:
+            self.disk_placer.settle(self.vm_name)
+
+    def prepare_disk(self) -> str:
+        self._place_disk()
+        if self._can_claim_warm_slot():
+            with self.tracer.span("vm.claim_warm_slot", "vm", self.vm_name) as span:
+                self.warm_slot = self.warm_pool.claim(self.vm_name, self.disk_gb)
+                span.attrs["claimed"] = self.warm_slot is not None
+            if self.warm_slot is not None:
+                print(f"Claimed warm slot {self.warm_slot.slot_id} for {self.vm_name}.")
+                return self.warm_slot.disk_path
+
+        with self.tracer.span("vm.clone_disk", "vm", self.vm_name) as span:
+            span.attrs["cow"] = self.is_cow_clone
+            span.attrs["layer"] = self.backing_layer is not None
+            base_disk_path = self._get_base_disk_path()
+            try:
+                return self._clone_disk(base_disk_path, self.is_cow_clone)
+            except Exception:
+                self._settle_placement()
+                raise
+
+    def _stage_iso(self) -> None:
+        # The seed ISO is built locally; a remote host needs its own copy.
+        if not self.backend.manages_storage or self.cloud_init_iso_path is None:
+            return
+        with self.tracer.span("vm.upload_iso", "vm", self.vm_name):
+            self.cloud_init_iso_path = self.backend.upload_volume(
+                self.cloud_init_iso_path, self._get_base_disk_path()
+            )
 
-        vm_xml = self._generate_vm_xml(new_disk_path)
-        xml_path = f"/tmp/vm-{uuid.uuid4()}.xml"
-        with open(xml_path, "w") as file:
-            file.write(vm_xml)
+    def define_vm(self, new_disk_path: str) -> None:
+        self._stage_iso()
+        try:
+            with self.tracer.span("vm.render_xml", "vm", self.vm_name):
+                if self.warm_slot is not None:
+                    vm_xml = self._generate_vm_xml(
+                        new_disk_path, self.warm_slot.domain_root()
+                    )
+                else:
+                    vm_xml = self._generate_vm_xml(new_disk_path)
+            with self.tracer.span("vm.define", "vm", self.vm_name):
+                self.backend.define_xml(vm_xml)
+        except Exception:
+            self._settle_placement()
+            raise
+        self.inventory.add_domain(self.vm_name)
+        if self.warm_slot is not None:
+            self.warm_pool.release_staged_xml(self.warm_slot)
 
+    def start_vm(self) -> None:
         try:
-            OSUtils.run_command(["virsh", "define", "--file", xml_path], sudo=True)
-            OSUtils.run_command(["virsh", "start", self.vm_name], sudo=True)
-        except Exception as e:
-            os.remove(xml_path)
-            raise e
+            with self.tracer.span("vm.start", "vm", self.vm_name):
+                self.backend.start(self.vm_name)
+        finally:
+            self._settle_placement()
+
+    async def _clone_disk_async(
+        self, base_disk_path: str, is_cow: bool, runner: AsyncCommandRunner
+    ) -> str:
+        self.disk_dir = os.path.dirname(base_disk_path)
+        new_disk_path = self.target_disk_path(base_disk_path)
+
+        if self.backend.manages_storage:
+            return await asyncio.to_thread(
+                self.backend.create_volume,
+                base_disk_path,
+                new_disk_path,
+                self.disk_gb,
+                is_cow,
+                self._placement_pool(),
+            )
+        if is_cow:
+            await runner.run_command(
+                self._overlay_command(
+                    self.backing_layer or base_disk_path, new_disk_path
+                ),
+                sudo=True,
+            )
+        else:
+            async with runner.limit("disk-clone"):
+                await asyncio.to_thread(
+                    self.disk_cloner.clone,
+                    base_disk_path,
+                    new_disk_path,
+                    self.vm_name,
+                )
+        return new_disk_path
+
+    async def prepare_disk_async(self, runner: AsyncCommandRunner) -> str:
+        await asyncio.to_thread(self._place_disk)
+        if await asyncio.to_thread(self._can_claim_warm_slot):
+            with self.tracer.span("vm.claim_warm_slot", "vm", self.vm_name) as span:
+                self.warm_slot = await asyncio.to_thread(
+                    self.warm_pool.claim, self.vm_name, self.disk_gb
+                )
+                span.attrs["claimed"] = self.warm_slot is not None
+            if self.warm_slot is not None:
+                print(f"Claimed warm slot {self.warm_slot.slot_id} for {self.vm_name}.")
+                return self.warm_slot.disk_path
+
+        with self.tracer.span("vm.clone_disk", "vm", self.vm_name) as span:
+            span.attrs["cow"] = self.is_cow_clone
+            span.attrs["layer"] = self.backing_layer is not None
+            base_disk_path = await asyncio.to_thread(self._get_base_disk_path)
+            try:
+                return await self._clone_disk_async(
+                    base_disk_path, self.is_cow_clone, runner
+                )
+            except Exception:
+                self._settle_placement()
+                raise
+
+    async def define_vm_async(
+        self, new_disk_path: str, runner: AsyncCommandRunner
+    ) -> None:
+        await asyncio.to_thread(self._stage_iso)
+        try:
+            with self.tracer.span("vm.render_xml", "vm", self.vm_name):
+                if self.warm_slot is not None:
+                    root = self.warm_slot.domain_root()
+                else:
+                    # Compiling the template may need a dumpxml; keep it off
+                    # the loop.
+                    await asyncio.to_thread(
+                        self.inventory.domain_template, self.base_vm_name
+                    )
+                    root = None
+                if self.profile is not None and self.profile.needs_placement:
+                    # Placement asks the host for its topology and hugepages.
+                    vm_xml = await asyncio.to_thread(
+                        self._generate_vm_xml, new_disk_path, root
+                    )
+                else:
+                    vm_xml = self._generate_vm_xml(new_disk_path, root)
+            with self.tracer.span("vm.define", "vm", self.vm_name):
+                await self.backend.define_xml_async(vm_xml, runner)
+        except Exception:
+            self._settle_placement()
+            raise
+        self.inventory.add_domain(self.vm_name)
+        if self.warm_slot is not None:
+            self.warm_pool.release_staged_xml(self.warm_slot)
+
+    async def start_vm_async(self, runner: AsyncCommandRunner) -> None:
+        try:
+            with self.tracer.span("vm.start", "vm", self.vm_name):
+                await self.backend.start_async(self.vm_name, runner)
+        finally:
+            self._settle_placement()
+
+    def define_and_start_vm(self) -> None:
+        new_disk_path = self.prepare_disk()
+        self.define_vm(new_disk_path)
+        self.start_vm()
@@ -0,0 +1,211 @@
+import errno
+import fcntl
+import hashlib
+import os
+import time
+from dataclasses import dataclass
+
+FICLONE = 0x40049409
+VERIFY_MODES = ("none", "sample", "full")
+
+# errnos meaning "this method is not available here", not "the copy failed".
+_UNSUPPORTED = {
+    errno.EOPNOTSUPP,
+    errno.ENOTTY,
+    errno.EXDEV,
+    errno.EINVAL,
+    errno.ENOSYS,
+}
+_SAMPLE_COUNT = 64
+_SAMPLE_SIZE = 1024 * 1024
+
+
+@dataclass
+class CloneResult:
+    method: str
+    size: int
+    bytes_written: int
+    duration: float
+
+    @property
+    def throughput(self) -> float:
+        return self.size / self.duration if self.duration > 0 else 0.0
+
+
+def _format_bytes(value: float) -> str:
+    for unit in ("B", "KiB", "MiB", "GiB"):
+        if value < 1024:
+            return f"{value:.1f}{unit}"
+        value /= 1024
+    return f"{value:.1f}TiB"
+
+
+class CloneProgress:
+    def __init__(self, label: str, total: int, interval: float = 2.0):
+        self.label = label
+        self.total = total
+        self.interval = interval
+        self.done = 0
+        self._start = time.monotonic()
+        self._last_report = self._start
+
+    def advance(self, size: int) -> None:
+        self.done += size
+        now = time.monotonic()
+        if self.interval and now - self._last_report >= self.interval:
+            self._last_report = now
+            self.report(now)
+
+    def report(self, now: float = None) -> None:
+        elapsed = (now or time.monotonic()) - self._start
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        eta = (self.total - self.done) / rate if rate > 0 else 0.0
+        percent = self.done * 100 / self.total if self.total else 100.0
+        print(
+            f"[{self.label}] cloning {percent:5.1f}% "
+            f"{_format_bytes(self.done)}/{_format_bytes(self.total)} "
+            f"{_format_bytes(rate)}/s ETA {eta:.0f}s"
+        )
+
+
+class DiskCloner:
+    def __init__(
+        self,
+        chunk_size: int = 16 * 1024 * 1024,
+        verify: str = "sample",
+        progress_interval: float = 2.0,
+    ):
+        if verify not in VERIFY_MODES:
+            raise ValueError(f"Unknown clone verification mode: {verify}")
+        self.chunk_size = chunk_size
+        self.verify = verify
+        self.progress_interval = progress_interval
+
+    def _reflink(self, src_fd: int, dst_fd: int, progress: CloneProgress) -> int:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        progress.advance(progress.total)
+        return 0
+
+    def _data_extents(self, fd: int, size: int):
+        offset = 0
+        while offset < size:
+            try:
+                start = os.lseek(fd, offset, os.SEEK_DATA)
+            except OSError as e:
+                if e.errno == errno.ENXIO:
+                    return
+                raise
+            end = os.lseek(fd, start, os.SEEK_HOLE)
+            yield start, end
+            offset = end
+
+    def _copy_file_range(
+        self, src_fd: int, dst_fd: int, progress: CloneProgress
+    ) -> int:
+        written = 0
+        for start, end in self._data_extents(src_fd, progress.total):
+            offset = start
+            while offset < end:
+                count = os.copy_file_range(
+                    src_fd,
+                    dst_fd,
+                    min(self.chunk_size, end - offset),
+                    offset,
+                    offset,
+                )
+                if count == 0:
+                    raise OSError(errno.EIO, "copy_file_range made no progress")
+                offset += count
+                written += count
+                progress.advance(count)
+        return written
+
+    def _sparse_copy(self, src_fd: int, dst_fd: int, progress: CloneProgress) -> int:
+        written = 0
+        offset = 0
+        while True:
+            chunk = os.pread(src_fd, self.chunk_size, offset)
+            if not chunk:
+                break
+            if chunk.count(0) != len(chunk):
+                os.pwrite(dst_fd, chunk, offset)
+                written += len(chunk)
+            offset += len(chunk)
+            progress.advance(len(chunk))
+        return written
+
+    def _methods(self):
+        methods = [("reflink", self._reflink)]
+        if hasattr(os, "copy_file_range") and hasattr(os, "SEEK_DATA"):
+            methods.append(("copy_file_range", self._copy_file_range))
+        methods.append(("sparse", self._sparse_copy))
+        return methods
+
+    def _digest(self, fd: int, size: int) -> bytes:
+        hasher = hashlib.blake2b()
+        if self.verify == "full":
+            windows = [
+                (offset, self.chunk_size) for offset in range(0, size, self.chunk_size)
+            ]
+        else:
+            step = max(size // _SAMPLE_COUNT, 1)
+            last = max(size - _SAMPLE_SIZE, 0)
+            offsets = {min(i * step, last) for i in range(_SAMPLE_COUNT + 1)}
+            windows = [(offset, _SAMPLE_SIZE) for offset in sorted(offsets)]
+        for offset, length in windows:
+            hasher.update(os.pread(fd, length, offset))
+        return hasher.digest()
+
+    def _verify(self, src_fd: int, dst_fd: int, size: int) -> None:
+        dst_size = os.fstat(dst_fd).st_size
+        if dst_size != size:
+            raise RuntimeError(f"Clone size mismatch: {dst_size} != {size} bytes")
+        if self.verify != "none" and self._digest(src_fd, size) != self._digest(
+            dst_fd, size
+        ):
+            raise RuntimeError("Clone verification failed: contents differ")
+
+    def clone(self, src_path: str, dst_path: str, label: str = None) -> CloneResult:
+        tmp_path = f"{dst_path}.partial"
+        start = time.monotonic()
+        src_fd = os.open(src_path, os.O_RDONLY)
+        try:
+            size = os.fstat(src_fd).st_size
+            dst_fd = os.open(tmp_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                methods = self._methods()
+                for method, copy in methods:
+                    progress = CloneProgress(
+                        label or os.path.basename(dst_path),
+                        size,
+                        self.progress_interval,
+                    )
+                    try:
+                        written = copy(src_fd, dst_fd, progress)
+                        break
+                    except OSError as e:
+                        if e.errno not in _UNSUPPORTED or method == methods[-1][0]:
+                            raise
+                        os.ftruncate(dst_fd, 0)
+                # Restore trailing holes that were skipped rather than written.
+                os.ftruncate(dst_fd, size)
+                os.fsync(dst_fd)
+                self._verify(src_fd, dst_fd, size)
+            finally:
+                os.close(dst_fd)
+            os.replace(tmp_path, dst_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            os.close(src_fd)
+
+        result = CloneResult(method, size, written, time.monotonic() - start)
+        print(
+            f"[{label or os.path.basename(dst_path)}] cloned {_format_bytes(size)} "
+            f"via {method} in {result.duration:.1f}s "
+            f"({_format_bytes(result.throughput)}/s, "
+            f"{_format_bytes(written)} written)"
+        )
+        return result
@@ -0,0 +1,99 @@
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+METADATA_NAMESPACE = "https://github.com/nnurry/soft-labor/node"
+METADATA_PREFIX = "softlabor"
+
+ET.register_namespace(METADATA_PREFIX, METADATA_NAMESPACE)
+
+_MEMORY_UNITS_KIB = {
+    "b": 1 / 1024,
+    "bytes": 1 / 1024,
+    "k": 1,
+    "kib": 1,
+    "kb": 1000 / 1024,
+    "m": 1024,
+    "mib": 1024,
+    "mb": 1000 * 1000 / 1024,
+    "g": 1024 * 1024,
+    "gib": 1024 * 1024,
+    "gb": 1000 * 1000 * 1000 / 1024,
+    "t": 1024 * 1024 * 1024,
+    "tib": 1024 * 1024 * 1024,
+    "tb": 1000 * 1000 * 1000 * 1000 / 1024,
+}
+
+
+def memory_gb_to_kib(memory_gb: float) -> int:
+    return int(memory_gb * 1024) * 1024
+
+
+def _memory_kib(elem: ET.Element) -> int:
+    if elem is None or not elem.text:
+        return None
+    unit = elem.get("unit", "KiB").lower()
+    return int(int(elem.text) * _MEMORY_UNITS_KIB.get(unit, 1))
+
+
+def apply_resources(root: ET.Element, vcpu: int, memory_gb: float) -> None:
+    set_resources(root, vcpu, memory_gb_to_kib(memory_gb))
+
+
+def set_resources(root: ET.Element, vcpu, memory_kib) -> None:
+    vcpu_elem = root.find("vcpu")
+    if vcpu_elem is not None:
+        vcpu_elem.text = str(vcpu)
+
+    cpu_topology_elem = root.find("cpu/topology")
+    if cpu_topology_elem is not None:
+        cpu_topology_elem.set("cores", str(vcpu))
+
+    for tag in ("memory", "currentMemory"):
+        memory_elem = root.find(tag)
+        if memory_elem is not None:
+            memory_elem.text = str(memory_kib)
+            memory_elem.set("unit", "KiB")
+
+
+def set_node_metadata(root: ET.Element, node_config: dict) -> None:
+    metadata = root.find("metadata")
+    if metadata is None:
+        metadata = ET.SubElement(root, "metadata")
+    for elem in metadata.findall(f"{{{METADATA_NAMESPACE}}}node"):
+        metadata.remove(elem)
+    attrs = {
+        key: str(node_config[key]) for key in ("role", "pool") if node_config.get(key)
+    }
+    ET.SubElement(metadata, f"{{{METADATA_NAMESPACE}}}node", attrs)
+
+
+@dataclass
+class DomainSpec:
+    name: str
+    vcpu: int = None
+    memory_kib: int = None
+    disk_paths: list[str] = field(default_factory=list)
+    mac_addresses: list[str] = field(default_factory=list)
+    managed: bool = False
+    pinned: bool = False  # vCPUs pinned or memory bound to host NUMA cells.
+
+    @classmethod
+    def from_xml(cls, root: ET.Element) -> "DomainSpec":
+        vcpu_elem = root.find("vcpu")
+        return cls(
+            name=root.findtext("name"),
+            vcpu=int(vcpu_elem.text) if vcpu_elem is not None else None,
+            memory_kib=_memory_kib(root.find("memory")),
+            disk_paths=[
+                source.get("file")
+                for source in root.findall(".//disk[@device='disk']/source")
+                if source.get("file")
+            ],
+            mac_addresses=[
+                mac.get("address", "").lower()
+                for mac in root.findall(".//interface/mac")
+            ],
+            managed=root.find(f"metadata/{{{METADATA_NAMESPACE}}}node") is not None,
+            pinned=root.find("cputune/vcpupin") is not None
+            or root.find("numatune") is not None,
+        )
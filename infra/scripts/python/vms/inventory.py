@@ -0,0 +1,89 @@
+import copy
+import threading
+import xml.etree.ElementTree as ET
+
+from hypervisor.base import HypervisorBackend
+from hypervisor.factory import create_backend
+from vms.template import DomainTemplate
+
+
+class LibvirtInventory:
+    def __init__(self, backend: HypervisorBackend = None):
+        self.backend = backend if backend is not None else create_backend()
+        self._lock = threading.RLock()
+        self._domains = None
+        self._domain_xml = {}
+        self._templates = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _load_domains(self) -> list[str]:
+        if self._domains is None:
+            self.misses += 1
+            self._domains = self.backend.list_domains()
+        else:
+            self.hits += 1
+        return self._domains
+
+    def domains(self) -> list[str]:
+        with self._lock:
+            return list(self._load_domains())
+
+    def has_domain(self, vm_name: str) -> bool:
+        with self._lock:
+            return vm_name in self._load_domains()
+
+    def domain_xml(self, vm_name: str) -> ET.Element:
+        with self._lock:
+            root = self._domain_xml.get(vm_name)
+            if root is None:
+                self.misses += 1
+                # The persistent definition, without runtime-only state.
+                root = ET.fromstring(self.backend.dump_xml(vm_name, inactive=True))
+                self._domain_xml[vm_name] = root
+            else:
+                self.hits += 1
+        # Callers patch the tree in place, so never hand out the cached copy.
+        return copy.deepcopy(root)
+
+    def domain_template(self, vm_name: str) -> DomainTemplate:
+        with self._lock:
+            template = self._templates.get(vm_name)
+            if template is None:
+                template = DomainTemplate.compile(self.domain_xml(vm_name))
+                self._templates[vm_name] = template
+            return template
+
+    def add_domain(self, vm_name: str) -> None:
+        with self._lock:
+            if self._domains is not None and vm_name not in self._domains:
+                self._domains.append(vm_name)
+            self._domain_xml.pop(vm_name, None)
+            self._templates.pop(vm_name, None)
+
+    def remove_domain(self, vm_name: str) -> None:
+        with self._lock:
+            if self._domains is not None and vm_name in self._domains:
+                self._domains.remove(vm_name)
+            self._domain_xml.pop(vm_name, None)
+            self._templates.pop(vm_name, None)
+
+    def forget_domains(self) -> None:
+        # A long-lived inventory cannot see domains defined or undefined by
+        # anyone else; re-list them, but keep the definitions already parsed.
+        with self._lock:
+            self._domains = None
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._domains = None
+            self._domain_xml.clear()
+            self._templates.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    def format_stats(self) -> str:
+        stats = self.stats()
+        return f"Inventory cache: {stats['hits']} hits, {stats['misses']} misses"
@@ -0,0 +1,103 @@
+import glob
+import hashlib
+import json
+import os
+from dataclasses import dataclass
+
+ROLES = ("master", "worker")
+# Part of every layer digest; bump it when baking changes what a layer holds.
+LAYER_FORMAT_VERSION = 1
+
+
+def bake_domain_name(base_vm_name: str, role: str) -> str:
+    return f"{base_vm_name}-bake-{role}"
+
+
+def is_bake_domain(base_vm_name: str, vm_name: str) -> bool:
+    return vm_name in {bake_domain_name(base_vm_name, role) for role in ROLES}
+
+
+@dataclass
+class LayerRecipe:
+    role: str
+    package_update: bool = False
+    packages: list[str] = None
+    runcmd: list = None
+
+    @property
+    def empty(self) -> bool:
+        return not (self.package_update or self.packages or self.runcmd)
+
+    def digest(self, base_disk_path: str) -> str:
+        # The base file's identity is included so rebuilding the base in place
+        # cannot leave a layer pointing at blocks that have changed under it.
+        try:
+            stat = os.stat(base_disk_path)
+            base_identity = [stat.st_size, stat.st_mtime_ns]
+        except OSError:
+            base_identity = None
+        payload = {
+            "version": LAYER_FORMAT_VERSION,
+            "role": self.role,
+            "base": base_disk_path,
+            "base_identity": base_identity,
+            "package_update": bool(self.package_update),
+            "packages": self.packages or [],
+            "runcmd": self.runcmd or [],
+        }
+        encoded = json.dumps(payload, sort_keys=True).encode("utf-8")
+        return hashlib.sha256(encoded).hexdigest()
+
+
+@dataclass
+class LayerStatus:
+    role: str
+    path: str
+    current: bool
+    size: int = 0
+
+
+class LayerCatalog:
+    # Baked layers sit next to the base disk as <base>-<role>-<digest>.qcow2.
+    # The digest covers the role's package set, so editing it simply stops
+    # matching the old layer and nodes fall back to the base until re-baked.
+    def __init__(self, base_vm_name: str, global_config: dict, bake_config: dict):
+        self.base_vm_name = base_vm_name
+        self.global_config = global_config or {}
+        self.bake_config = bake_config or {}
+
+    def recipe(self, role: str) -> LayerRecipe:
+        extras = self.bake_config.get("roles", {}).get(role) or {}
+        return LayerRecipe(
+            role=role,
+            package_update=bool(self.global_config.get("package_update")),
+            packages=list(self.global_config.get("packages") or [])
+            + list(extras.get("packages") or []),
+            runcmd=list(self.global_config.get("runcmd") or [])
+            + list(extras.get("runcmd") or []),
+        )
+
+    def _prefix(self, role: str, base_disk_path: str) -> str:
+        return os.path.join(
+            os.path.dirname(base_disk_path), f"{self.base_vm_name}-{role}-"
+        )
+
+    def layer_path(self, role: str, base_disk_path: str) -> str:
+        digest = self.recipe(role).digest(base_disk_path)
+        return f"{self._prefix(role, base_disk_path)}{digest[:12]}.qcow2"
+
+    def lookup(self, role: str, base_disk_path: str) -> str:
+        if not self.bake_config.get("enabled", True) or self.recipe(role).empty:
+            return None
+        path = self.layer_path(role, base_disk_path)
+        return path if os.path.exists(path) else None
+
+    def layers(self, base_disk_path: str) -> list[LayerStatus]:
+        found = []
+        for role in ROLES:
+            current = self.layer_path(role, base_disk_path)
+            pattern = f"{self._prefix(role, base_disk_path)}*.qcow2"
+            for path in sorted(glob.glob(pattern)):
+                size = os.path.getsize(path) if os.path.exists(path) else 0
+                found.append(LayerStatus(role, path, path == current, size))
+        return found
@@ -1,12 +1,22 @@
+import ipaddress
 import os
+from functools import cached_property
 
 import yaml
 
+from vms.pools import NodePool, find_range_collisions, mac_to_int
+from vms.tuning import PerformanceProfile
+
+# Keys a pool's defaults must supply; pools generate the name, addresses and role.
+POOL_NODE_KEYS = ("gateway_address", "vcpu", "memory_gb", "disk_gb")
+
 
 class VMConfigParser:
     def __init__(self, config_file_path: str):
         self.config_file_path = os.path.expanduser(config_file_path)
         self.config_data = self._load_config()
+        self._validate_nodes()
+        self._validate_profiles()
 
     def _load_config(self) -> dict:
         if not os.path.exists(self.config_file_path):
@@ -20,13 +30,129 @@ class VMConfigParser:
     def base_vm_name(self) -> str:
         return self.config_data["base_vm_name"]
 
-    @property
+    @cached_property
+    def node_pools(self) -> list[NodePool]:
+        return [NodePool(spec) for spec in self.config_data.get("node_pools", [])]
+
+    @cached_property
+    def _explicit_nodes(self) -> dict[str, dict]:
+        nodes = {}
+        for node in self.config_data.get("master_nodes", []) + self.config_data.get(
+            "worker_nodes", []
+        ):
+            if node["name"] in nodes:
+                raise ValueError(f"Duplicate node name in config: {node['name']}")
+            nodes[node["name"]] = node
+        return nodes
+
+    def _pool_nodes(self, role: str) -> list[dict]:
+        return [node for pool in self.node_pools if pool.role == role for node in pool]
+
+    @cached_property
     def master_nodes(self) -> list[dict]:
-        return self.config_data.get("master_nodes", [])
+        return self.config_data.get("master_nodes", []) + self._pool_nodes("master")
 
-    @property
+    @cached_property
     def worker_nodes(self) -> list[dict]:
-        return self.config_data.get("worker_nodes", [])
+        return self.config_data.get("worker_nodes", []) + self._pool_nodes("worker")
+
+    @cached_property
+    def all_nodes(self) -> list[dict]:
+        return self.master_nodes + self.worker_nodes
+
+    @cached_property
+    def _explicit_master_names(self) -> frozenset:
+        masters = self.config_data.get("master_nodes", [])
+        return frozenset(node["name"] for node in masters)
+
+    def node_role(self, node_config: dict) -> str:
+        # Pool nodes carry their role; explicit nodes take it from their list.
+        role = node_config.get("role")
+        if role:
+            return role
+        if node_config["name"] in self._explicit_master_names:
+            return "master"
+        return "worker"
+
+    def get_node(self, vm_name: str) -> dict:
+        node = self._explicit_nodes.get(vm_name)
+        if node is not None:
+            return node
+        for pool in self.node_pools:
+            offset = pool.offset_of(vm_name)
+            if offset is not None:
+                return pool.node(offset)
+        return None
+
+    @cached_property
+    def performance_profiles(self) -> dict[str, PerformanceProfile]:
+        specs = self.config_data.get("performance_profiles") or {}
+        return {
+            name: PerformanceProfile.from_config(name, spec)
+            for name, spec in specs.items()
+        }
+
+    def node_profile(self, node_config: dict) -> PerformanceProfile:
+        # Explicit nodes name a profile directly; pool nodes inherit the
+        # pool's `defaults: profile:`.
+        name = node_config.get("profile")
+        if name is None:
+            return None
+        return self.performance_profiles[name]
+
+    def _validate_profiles(self) -> None:
+        referenced = [
+            (node.get("profile"), f"node '{name}'")
+            for name, node in self._explicit_nodes.items()
+        ] + [
+            (pool.defaults.get("profile"), f"pool '{pool.name}'")
+            for pool in self.node_pools
+        ]
+        errors = [
+            f"{owner} uses undefined performance profile '{name}'"
+            for name, owner in referenced
+            if name is not None and name not in self.performance_profiles
+        ]
+        if errors:
+            raise ValueError("Invalid node configuration: " + "; ".join(errors))
+
+    def _validate_nodes(self) -> None:
+        # Compare whole pools as integer ranges so validation never expands them.
+        ip_ranges, mac_ranges = [], []
+        for name, node in self._explicit_nodes.items():
+            ip = int(ipaddress.IPv4Address(node["ip_address"]))
+            mac = mac_to_int(node["mac_address"])
+            ip_ranges.append((ip, ip, name))
+            mac_ranges.append((mac, mac, name))
+            for pool in self.node_pools:
+                if pool.offset_of(name) is not None:
+                    raise ValueError(
+                        f"Node '{name}' collides with a name in pool '{pool.name}'"
+                    )
+        missing = []
+        for pool in self.node_pools:
+            label = f"pool '{pool.name}'"
+            ip_ranges.append((*pool.ip_range, label))
+            mac_ranges.append((*pool.mac_range, label))
+            keys = [key for key in POOL_NODE_KEYS if key not in pool.defaults]
+            if keys:
+                missing.append(f"{label} defaults lack {', '.join(keys)}")
+        if missing:
+            raise ValueError("Invalid node configuration: " + "; ".join(missing))
+
+        pool_names = [pool.name for pool in self.node_pools]
+        if len(set(pool_names)) != len(pool_names):
+            raise ValueError("Duplicate node pool names in config")
+
+        errors = [
+            f"IP address collision between {a} and {b}"
+            for a, b in find_range_collisions(ip_ranges)
+        ] + [
+            f"MAC address collision between {a} and {b}"
+            for a, b in find_range_collisions(mac_ranges)
+        ]
+        if errors:
+            raise ValueError("Invalid node configuration: " + "; ".join(errors))
 
     @property
     def ssh_user(self) -> str:
@@ -43,3 +169,39 @@ class VMConfigParser:
     @property
     def cloud_init_global_config(self) -> dict:
         return self.config_data.get("cloud_init_global_config", {})
+
+    @property
+    def bake_config(self) -> dict:
+        return self.config_data.get("bake", {})
+
+    @property
+    def provisioning_config(self) -> dict:
+        return self.config_data.get("provisioning", {})
+
+    @property
+    def hypervisor_config(self) -> dict:
+        return self.config_data.get("hypervisor", {})
+
+    @property
+    def cloud_init_iso_builder(self) -> str:
+        return self.config_data.get("cloud_init_iso_builder", "native")
+
+    @property
+    def cloud_init_cache_config(self) -> dict:
+        return self.config_data.get("cloud_init_cache", {})
+
+    @property
+    def readiness_config(self) -> dict:
+        return self.config_data.get("readiness", {})
+
+    @property
+    def status_config(self) -> dict:
+        return self.config_data.get("status", {})
+
+    @property
+    def exec_config(self) -> dict:
+        return self.config_data.get("exec", {})
+
+    @property
+    def tracing_config(self) -> dict:
+        return self.config_data.get("tracing", {})
@@ -0,0 +1,97 @@
+import ipaddress
+
+ROLES = ("master", "worker")
+MAC_MAX = (1 << 48) - 1
+
+
+def mac_to_int(mac_address: str) -> int:
+    return int(mac_address.replace(":", "").replace("-", ""), 16)
+
+
+def int_to_mac(value: int) -> str:
+    raw = f"{value:012x}"
+    return ":".join(raw[i : i + 2] for i in range(0, 12, 2))
+
+
+class NodePool:
+    def __init__(self, spec: dict):
+        try:
+            self.name = spec["name"]
+            self.count = int(spec["count"])
+            self.base_ip = ipaddress.IPv4Address(spec["base_ip"])
+            self.base_mac = mac_to_int(spec["base_mac"])
+        except KeyError as e:
+            raise ValueError(f"Node pool is missing required key: {e}")
+        self.role = spec.get("role", "worker")
+        self.start_index = int(spec.get("start_index", 1))
+        self.defaults = dict(spec.get("defaults", {}))
+        self._prefix = f"{self.name}-"
+
+        if self.role not in ROLES:
+            raise ValueError(f"Node pool '{self.name}' has unknown role: {self.role}")
+        if self.count < 0 or self.start_index < 0:
+            raise ValueError(f"Node pool '{self.name}' has a negative count or index")
+
+        network = ipaddress.IPv4Network(f"{self.base_ip}/24", strict=False)
+        if self.count and self.base_ip + (self.count - 1) not in network:
+            raise ValueError(
+                f"Node pool '{self.name}' runs past the end of {network}"
+            )
+        if self.base_mac + self.count - 1 > MAC_MAX:
+            raise ValueError(f"Node pool '{self.name}' runs past the MAC range")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __iter__(self):
+        for offset in range(self.count):
+            yield self.node(offset)
+
+    def node_name(self, offset: int) -> str:
+        return f"{self._prefix}{self.start_index + offset}"
+
+    def node(self, offset: int) -> dict:
+        if not 0 <= offset < self.count:
+            raise IndexError(f"Node pool '{self.name}' has no node at offset {offset}")
+        node_config = dict(self.defaults)
+        node_config.update(
+            {
+                "name": self.node_name(offset),
+                "ip_address": str(self.base_ip + offset),
+                "mac_address": int_to_mac(self.base_mac + offset),
+                "pool": self.name,
+                "role": self.role,
+            }
+        )
+        return node_config
+
+    def offset_of(self, vm_name: str) -> int:
+        if not vm_name.startswith(self._prefix):
+            return None
+        suffix = vm_name[len(self._prefix) :]
+        if not suffix.isdigit() or (len(suffix) > 1 and suffix[0] == "0"):
+            return None
+        offset = int(suffix) - self.start_index
+        if 0 <= offset < self.count:
+            return offset
+        return None
+
+    @property
+    def ip_range(self) -> tuple[int, int]:
+        start = int(self.base_ip)
+        return start, start + self.count - 1
+
+    @property
+    def mac_range(self) -> tuple[int, int]:
+        return self.base_mac, self.base_mac + self.count - 1
+
+
+def find_range_collisions(ranges: list[tuple[int, int, str]]) -> list[tuple[str, str]]:
+    collisions = []
+    furthest = None
+    for start, end, label in sorted(r for r in ranges if r[0] <= r[1]):
+        if furthest is not None and start <= furthest[0]:
+            collisions.append((furthest[1], label))
+        if furthest is None or end > furthest[0]:
+            furthest = (end, label)
+    return collisions
@@ -0,0 +1,262 @@
+import os
+import re
+import threading
+from dataclasses import dataclass
+
+from tables import format_table
+from vms.inventory import LibvirtInventory
+
+GIB = 1024**3
+PREALLOCATION_MODES = ("off", "metadata", "falloc", "full")
+_SIZE_RE = re.compile(r"^(\d+)\s*([kKmM]?)$")
+_SIZE_UNITS = {"": 1, "k": 1024, "m": 1024**2}
+
+
+def _cluster_size_bytes(value) -> int:
+    match = _SIZE_RE.match(str(value).strip())
+    if not match:
+        raise ValueError(f"cluster_size must be bytes or like 64k or 2M: {value!r}")
+    size = int(match.group(1)) * _SIZE_UNITS[match.group(2).lower()]
+    # qcow2 clusters are a power of two from 512 bytes to 2 MiB.
+    if size < 512 or size > 2 * 1024**2 or size & (size - 1):
+        raise ValueError(f"cluster_size must be a power of two in 512..2M: {value!r}")
+    return size
+
+
+@dataclass(frozen=True)
+class OverlayOptions:
+    cluster_size: int = None  # Bytes; qemu-img's default is 64 KiB.
+    preallocation: str = None
+    extended_l2: bool = None
+    lazy_refcounts: bool = None
+
+    @classmethod
+    def from_config(cls, spec: dict) -> "OverlayOptions":
+        spec = spec or {}
+        cluster_size = spec.get("cluster_size")
+        preallocation = spec.get("preallocation")
+        extended_l2 = spec.get("extended_l2")
+        lazy_refcounts = spec.get("lazy_refcounts")
+        if preallocation is not None and preallocation not in PREALLOCATION_MODES:
+            raise ValueError(
+                f"overlay preallocation must be one of {list(PREALLOCATION_MODES)}: "
+                f"{preallocation!r}"
+            )
+        options = cls(
+            cluster_size=(
+                _cluster_size_bytes(cluster_size) if cluster_size is not None else None
+            ),
+            preallocation=preallocation,
+            extended_l2=None if extended_l2 is None else bool(extended_l2),
+            lazy_refcounts=None if lazy_refcounts is None else bool(lazy_refcounts),
+        )
+        # QEMU refuses to preallocate an image with a backing file unless
+        # its clusters are split into subclusters.
+        if preallocation not in (None, "off") and not options.extended_l2:
+            raise ValueError("overlay preallocation needs extended_l2: true")
+        if options.extended_l2 and (options.cluster_size or 64 * 1024) < 16 * 1024:
+            raise ValueError("overlay extended_l2 needs a cluster_size of 16k or more")
+        return options
+
+    def qemu_img_args(self) -> list[str]:
+        options = []
+        if self.cluster_size is not None:
+            options.append(f"cluster_size={self.cluster_size}")
+        if self.preallocation is not None:
+            options.append(f"preallocation={self.preallocation}")
+        for name, value in (
+            ("extended_l2", self.extended_l2),
+            ("lazy_refcounts", self.lazy_refcounts),
+        ):
+            if value is not None:
+                options.append(f"{name}={'on' if value else 'off'}")
+        return ["-o", ",".join(options)] if options else []
+
+    @property
+    def allocates_fully(self) -> bool:
+        return self.preallocation in ("falloc", "full")
+
+
+@dataclass(frozen=True)
+class StorageTarget:
+    name: str
+    path: str = None  # A directory on this machine...
+    pool: str = None  # ...or a libvirt storage pool, local or remote.
+    weight: float = 1.0  # Relative I/O capacity of the device behind it.
+
+    @classmethod
+    def from_config(cls, spec) -> "StorageTarget":
+        if isinstance(spec, str):
+            spec = {"path": spec}
+        path, pool = spec.get("path"), spec.get("pool")
+        if (path is None) == (pool is None):
+            raise ValueError(f"Storage target needs either path or pool: {spec}")
+        weight = float(spec.get("weight", 1.0))
+        if weight <= 0:
+            raise ValueError(f"Storage target weight must be positive: {spec}")
+        if path is not None:
+            path = os.path.abspath(os.path.expanduser(path))
+        name = spec.get("name") or pool or path
+        return cls(name=name, path=path, pool=pool, weight=weight)
+
+
+@dataclass
+class DiskPlacement:
+    vm_name: str
+    target: StorageTarget
+    directory: str
+    free_bytes: int
+    load: int  # Disks of other domains and in-flight overlays on the target.
+
+    @property
+    def disk_path(self) -> str:
+        return os.path.join(self.directory, f"{self.vm_name}.qcow2")
+
+    def describe(self) -> str:
+        return (
+            f"{self.target.name} ({self.directory}): weight {self.target.weight:g}, "
+            f"{self.load} other disk(s), {self.free_bytes / GIB:.1f} GiB free"
+        )
+
+
+@dataclass
+class TargetUsage:
+    target: StorageTarget
+    directory: str = None
+    free_bytes: int = None
+    domains: list[str] = None  # The owner of each disk in the directory.
+    error: str = None
+
+
+class DiskPlacer:
+    # Spreads node overlays over storage targets: each goes to the target
+    # with the fewest disks per unit of I/O weight, counting every defined
+    # domain's disks and the overlays this run has placed but not yet
+    # defined, with free space breaking ties. Targets that would drop below
+    # min_free_gb are skipped.
+    def __init__(
+        self,
+        inventory: LibvirtInventory,
+        targets: list[StorageTarget],
+        min_free_gb: float = 0,
+    ):
+        self.inventory = inventory
+        self.backend = inventory.backend
+        self.targets = targets
+        self.min_free_bytes = int(min_free_gb * GIB)
+        self._lock = threading.Lock()
+        self._claims = {}
+
+    @classmethod
+    def from_config(cls, inventory: LibvirtInventory, spec: dict) -> "DiskPlacer":
+        spec = spec or {}
+        targets = [StorageTarget.from_config(t) for t in spec.get("targets") or []]
+        names = [target.name for target in targets]
+        if len(set(names)) != len(names):
+            raise ValueError("Duplicate storage target names in disk_placement")
+        return cls(inventory, targets, float(spec.get("min_free_gb", 0)))
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.targets)
+
+    def _locate(self, target: StorageTarget) -> tuple[str, int]:
+        # The target's directory and its free bytes.
+        if target.pool is not None:
+            path, available = self.backend.storage_pool(target.pool)
+            return os.path.normpath(path), available
+        if self.backend.manages_storage:
+            # The files would land on this machine, not the hypervisor.
+            raise ValueError("directory targets need a local hypervisor; use a pool")
+        stat = os.statvfs(target.path)
+        return target.path, stat.f_bavail * stat.f_frsize
+
+    def directories(self) -> list[str]:
+        return [self._locate(target)[0] for target in self.targets]
+
+    def _disks_by_directory(self, exclude: str = None) -> dict[str, list[str]]:
+        disks = {}
+        for name in self.inventory.domains():
+            if name == exclude:
+                continue
+            root = self.inventory.domain_xml(name)
+            for source in root.findall("devices/disk[@device='disk']/source"):
+                if "file" in source.attrib:
+                    directory = os.path.dirname(os.path.normpath(source.get("file")))
+                    disks.setdefault(directory, []).append(name)
+        return disks
+
+    def place(self, vm_name: str, reserve_bytes: int = 0) -> DiskPlacement:
+        with self._lock:
+            disks = self._disks_by_directory(exclude=vm_name)
+            candidates, skipped = [], []
+            for target in self.targets:
+                try:
+                    directory, free = self._locate(target)
+                except Exception as e:
+                    skipped.append(f"{target.name}: {str(e).strip()}")
+                    continue
+                claims = [
+                    claim
+                    for name, claim in self._claims.items()
+                    if name != vm_name and claim[0] == target.name
+                ]
+                free -= sum(reserved for _, reserved in claims)
+                if free - reserve_bytes < self.min_free_bytes:
+                    skipped.append(f"{target.name}: {max(free, 0) / GIB:.1f} GiB free")
+                    continue
+                load = len(disks.get(directory, [])) + len(claims)
+                candidates.append(
+                    DiskPlacement(vm_name, target, directory, free, load)
+                )
+            if not candidates:
+                raise ValueError(
+                    f"No storage target can hold {vm_name}'s disk: "
+                    + "; ".join(skipped)
+                )
+            placement = min(
+                candidates,
+                key=lambda c: ((c.load + 1) / c.target.weight, -c.free_bytes),
+            )
+            self._claims[vm_name] = (placement.target.name, reserve_bytes)
+            return placement
+
+    def settle(self, vm_name: str) -> None:
+        # The domain is defined (or failed); its disk now counts through its
+        # XML and its preallocated space through the free-space figure.
+        with self._lock:
+            self._claims.pop(vm_name, None)
+
+    def usage(self) -> list[TargetUsage]:
+        disks = self._disks_by_directory()
+        usage = []
+        for target in self.targets:
+            try:
+                directory, free = self._locate(target)
+                usage.append(
+                    TargetUsage(target, directory, free, disks.get(directory, []))
+                )
+            except Exception as e:
+                usage.append(TargetUsage(target, error=str(e).strip()))
+        return usage
+
+
+def format_storage_table(usage: list[TargetUsage]) -> str:
+    headers = ("TARGET", "DIRECTORY", "WEIGHT", "FREE", "DISKS", "DOMAINS")
+    rows = []
+    for entry in usage:
+        if entry.error is not None:
+            weight = f"{entry.target.weight:g}"
+            rows.append((entry.target.name, "-", weight, "-", "-", entry.error))
+            continue
+        rows.append(
+            (
+                entry.target.name,
+                entry.directory,
+                f"{entry.target.weight:g}",
+                f"{entry.free_bytes / GIB:.1f}G",
+                str(len(entry.domains)),
+                ",".join(sorted(set(entry.domains))) or "-",
+            )
+        )
+    return format_table(headers, rows)
@@ -0,0 +1,274 @@
+import copy
+import os
+import re
+import threading
+import uuid
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass
+
+from vms.domain import memory_gb_to_kib, set_node_metadata, set_resources
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:
+    lxml_etree = None
+
+DOMAIN_SCHEMA_PATH = "/usr/share/libvirt/schemas/domain.rng"
+
+_UUID_RE = re.compile(r"^[0-9a-fA-F]{8}-?([0-9a-fA-F]{4}-?){3}[0-9a-fA-F]{12}$")
+_MAC_RE = re.compile(r"^([0-9a-fA-F]{2}:){5}[0-9a-fA-F]{2}$")
+
+# Sentinels stand in for per-node values while the base is patched once; they
+# are then located in the serialised text and become the patch points.
+_FIELDS = ("name", "uuid", "vcpu", "memory_kib", "disk_path", "mac", "iso_path")
+_SENTINELS = {field: f"@@softlabor-{field}@@" for field in _FIELDS}
+_METADATA_FIELDS = ("role", "pool")
+
+
+def patch_domain(
+    root: ET.Element,
+    name: str,
+    domain_uuid: str,
+    vcpu,
+    memory_kib,
+    node_metadata: dict,
+    disk_path: str,
+    mac_address: str,
+    iso_path: str,
+) -> None:
+    name_elem = root.find("name")
+    if name_elem is not None:
+        name_elem.text = name
+
+    uuid_elem = root.find("uuid")
+    if uuid_elem is not None:
+        uuid_elem.text = domain_uuid
+
+    set_resources(root, vcpu, memory_kib)
+    set_node_metadata(root, node_metadata)
+
+    for disk in root.findall(".//disk[@device='disk']"):
+        source = disk.find("source")
+        if source is not None and "file" in source.attrib:
+            source.set("file", disk_path)
+            if "backing_file" in source.attrib:
+                del source.attrib["backing_file"]
+
+    for interface in root.findall(".//interface[@type='bridge']"):
+        source = interface.find("source")
+        if source is not None and "br0" in source.get("bridge"):
+            mac = interface.find("mac")
+            if mac is not None:
+                mac.set("address", mac_address)
+            break
+
+    disks_parent = root.find(".//disk[@device='cdrom']..")
+    for disk in disks_parent.findall(".//disk[@device='cdrom']"):
+        disks_parent.remove(disk)
+
+    disk_elem = ET.Element("disk", {"type": "file", "device": "cdrom"})
+    ET.SubElement(disk_elem, "driver", {"name": "qemu", "type": "raw"})
+    ET.SubElement(disk_elem, "source", {"file": iso_path})
+    ET.SubElement(disk_elem, "target", {"dev": "hdc", "bus": "sata"})
+    ET.SubElement(disk_elem, "readonly")
+    ET.SubElement(disk_elem, "boot", {"order": "2"})
+
+    disks_parent.append(disk_elem)
+
+    os_boot_elem = root.find(".//os/boot")
+    if os_boot_elem is not None:
+        os_boot_elem.set("dev", "hd")
+
+
+def _escape(value) -> str:
+    # Valid in both text and double-quoted attribute positions.
+    return (
+        str(value)
+        .replace("&", "&amp;")
+        .replace("<", "&lt;")
+        .replace(">", "&gt;")
+        .replace('"', "&quot;")
+        .replace("\n", "&#10;")
+    )
+
+
+@dataclass
+class DomainRender:
+    name: str
+    uuid: str
+    mac_address: str
+    xml: str
+
+
+class DomainTemplate:
+    def __init__(self, segments: list, field_counts: dict):
+        self._segments = segments
+        self.field_counts = field_counts
+
+    @classmethod
+    def compile(cls, base_root: ET.Element) -> "DomainTemplate":
+        root = copy.deepcopy(base_root)
+        patch_domain(
+            root,
+            name=_SENTINELS["name"],
+            domain_uuid=_SENTINELS["uuid"],
+            vcpu=_SENTINELS["vcpu"],
+            memory_kib=_SENTINELS["memory_kib"],
+            node_metadata={f: f"@@softlabor-{f}@@" for f in _METADATA_FIELDS},
+            disk_path=_SENTINELS["disk_path"],
+            mac_address=_SENTINELS["mac"],
+            iso_path=_SENTINELS["iso_path"],
+        )
+        text = ET.tostring(root, encoding="unicode", xml_declaration=True)
+
+        # Metadata attributes are optional per node, so the whole ` key="..."`
+        # is a patch point rather than just its value.
+        patterns = [re.escape(sentinel) for sentinel in _SENTINELS.values()]
+        patterns += [
+            rf' {field}="@@softlabor-{field}@@"' for field in _METADATA_FIELDS
+        ]
+        by_token = {sentinel: field for field, sentinel in _SENTINELS.items()}
+        by_token.update(
+            {
+                f' {field}="@@softlabor-{field}@@"': f"meta:{field}"
+                for field in _METADATA_FIELDS
+            }
+        )
+
+        segments = []
+        field_counts = {}
+        position = 0
+        for match in re.finditer("|".join(patterns), text):
+            segments.append(text[position : match.start()])
+            field = by_token[match.group(0)]
+            segments.append((field,))
+            field_counts[field] = field_counts.get(field, 0) + 1
+            position = match.end()
+        segments.append(text[position:])
+        if "@@softlabor-" in "".join(s for s in segments if isinstance(s, str)):
+            raise ValueError("Base domain XML left an unresolved template field")
+        return cls(segments, field_counts)
+
+    def render(
+        self,
+        node_config: dict,
+        disk_path: str,
+        iso_path: str,
+        domain_uuid: str = None,
+    ) -> DomainRender:
+        domain_uuid = domain_uuid or str(uuid.uuid4())
+        values = {
+            "name": _escape(node_config["name"]),
+            "uuid": domain_uuid,
+            "vcpu": _escape(node_config["vcpu"]),
+            "memory_kib": str(memory_gb_to_kib(node_config["memory_gb"])),
+            "disk_path": _escape(disk_path),
+            "mac": _escape(node_config["mac_address"]),
+            "iso_path": _escape(iso_path),
+        }
+        for field in _METADATA_FIELDS:
+            value = node_config.get(field)
+            values[f"meta:{field}"] = f' {field}="{_escape(value)}"' if value else ""
+        xml = "".join(
+            segment if isinstance(segment, str) else values[segment[0]]
+            for segment in self._segments
+        )
+        return DomainRender(
+            node_config["name"], domain_uuid, node_config["mac_address"].lower(), xml
+        )
+
+    def render_all(
+        self, nodes: list[tuple[dict, str, str]], validator: "DomainValidator" = None
+    ) -> list[DomainRender]:
+        rendered = [
+            self.render(node_config, disk_path, iso_path)
+            for node_config, disk_path, iso_path in nodes
+        ]
+        if validator is not None:
+            validator.validate_all(rendered)
+        return rendered
+
+
+class DomainValidator:
+    # Full RelaxNG validation against libvirt's own schema when lxml and the
+    # schema files are installed; structural checks of the fields we patch
+    # otherwise.
+    def __init__(self, schema_path: str = DOMAIN_SCHEMA_PATH):
+        self._relaxng = None
+        self._lock = threading.Lock()
+        if lxml_etree is not None and os.path.exists(schema_path):
+            self._relaxng = lxml_etree.RelaxNG(lxml_etree.parse(schema_path))
+
+    @property
+    def mode(self) -> str:
+        return "relaxng" if self._relaxng is not None else "structural"
+
+    def validate(self, xml: str) -> ET.Element:
+        try:
+            root = ET.fromstring(xml)
+        except ET.ParseError as e:
+            raise ValueError(f"Generated domain XML is not well-formed: {e}")
+        name = root.findtext("name") or "?"
+
+        if self._relaxng is not None:
+            document = lxml_etree.fromstring(xml.encode())
+            with self._lock:
+                valid = self._relaxng.validate(document)
+                last_error = self._relaxng.error_log.last_error
+            if not valid:
+                raise ValueError(
+                    f"Domain XML for {name} fails the libvirt schema: {last_error}"
+                )
+            return root
+
+        errors = []
+        if root.tag != "domain" or not root.get("type"):
+            errors.append("root element must be <domain type=...>")
+        if not root.findtext("name"):
+            errors.append("missing <name>")
+        if root.find("uuid") is not None and not _UUID_RE.match(
+            root.findtext("uuid") or ""
+        ):
+            errors.append(f"invalid uuid {root.findtext('uuid')!r}")
+        for tag in ("vcpu", "memory", "currentMemory"):
+            text = (root.findtext(tag) or "1").strip()
+            if not text.isdigit() or int(text) == 0:
+                errors.append(f"<{tag}> must be a positive integer")
+        for disk in root.findall("devices/disk"):
+            source = disk.find("source")
+            if source is not None and not source.get("file", "x"):
+                errors.append(f"{disk.get('device')} disk has an empty source")
+            if disk.find("target") is None:
+                errors.append(f"{disk.get('device')} disk has no <target>")
+        for mac in root.findall("devices/interface/mac"):
+            if not _MAC_RE.match(mac.get("address", "")):
+                errors.append(f"invalid MAC address {mac.get('address')!r}")
+        if errors:
+            raise ValueError(f"Invalid domain XML for {name}: " + "; ".join(errors))
+        return root
+
+    def validate_all(self, rendered: list[DomainRender]) -> None:
+        seen = {}
+        for item in rendered:
+            self.validate(item.xml)
+            keys = (("name", item.name), ("uuid", item.uuid), ("MAC", item.mac_address))
+            for kind, value in keys:
+                # By identity: two domains sharing a name are still two.
+                other = seen.setdefault((kind, value), item)
+                if other is not item:
+                    raise ValueError(
+                        f"Domains {other.name} and {item.name} share {kind} {value}"
+                    )
+
+
+_validator = None
+_validator_lock = threading.Lock()
+
+
+def get_domain_validator() -> DomainValidator:
+    # Loading libvirt's schema is costly, so it is shared by every builder.
+    global _validator
+    with _validator_lock:
+        if _validator is None:
+            _validator = DomainValidator()
+        return _validator
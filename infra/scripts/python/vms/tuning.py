@@ -0,0 +1,415 @@
+import threading
+import xml.etree.ElementTree as ET
+from dataclasses import dataclass, field
+
+DISK_CACHE_MODES = ("none", "writeback", "writethrough", "directsync", "unsafe")
+DISK_IO_MODES = ("native", "threads", "io_uring")
+DISK_BUSES = ("virtio", "scsi")
+# QEMU only accepts io=native when the host page cache is bypassed.
+_DIRECT_CACHE_MODES = ("none", "directsync")
+_PAGE_SIZES_KIB = {"2M": 2048, "1G": 1024 * 1024}
+_PROFILE_KEYS = {
+    "cpu_pinning",
+    "numa_node",
+    "reserved_cpus",
+    "hugepages",
+    "disk_cache",
+    "disk_io",
+    "disk_bus",
+    "disk_queues",
+    "iothreads",
+    "net_queues",
+}
+
+
+def parse_cpuset(text: str) -> set[int]:
+    # libvirt cpuset syntax, e.g. "0-3,8,^2".
+    cpus, excluded = set(), set()
+    for part in str(text).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        target = excluded if part.startswith("^") else cpus
+        low, _, high = part.lstrip("^").partition("-")
+        target.update(range(int(low), int(high or low) + 1))
+    return cpus - excluded
+
+
+def format_cpuset(cpus) -> str:
+    ranges = []
+    for cpu in sorted(cpus):
+        if ranges and cpu == ranges[-1][1] + 1:
+            ranges[-1][1] = cpu
+        else:
+            ranges.append([cpu, cpu])
+    return ",".join(f"{low}-{high}" if high > low else str(low) for low, high in ranges)
+
+
+def _page_size_kib(value) -> int:
+    if value is True:
+        return _PAGE_SIZES_KIB["2M"]
+    if isinstance(value, int):
+        return value
+    size = _PAGE_SIZES_KIB.get(str(value).strip().upper())
+    if size is None:
+        raise ValueError(f"hugepages must be true, 2M, 1G or a size in KiB: {value!r}")
+    return size
+
+
+def _queue_count(value, key: str):
+    if value is None or value == "auto":
+        return value
+    if isinstance(value, bool) or not isinstance(value, int) or value < 1:
+        raise ValueError(f"{key} must be a positive integer or 'auto': {value!r}")
+    return value
+
+
+@dataclass(frozen=True)
+class PerformanceProfile:
+    name: str
+    cpu_pinning: bool = False
+    numa_node: int = None  # None: whichever node fits
+    reserved_cpus: str = None  # Host CPUs for emulator and I/O threads.
+    hugepage_kib: int = None
+    disk_cache: str = None
+    disk_io: str = None
+    disk_bus: str = None
+    disk_queues: object = None  # A count, or "auto" for one per vCPU.
+    iothreads: int = 0
+    net_queues: object = None
+
+    @classmethod
+    def from_config(cls, name: str, spec: dict) -> "PerformanceProfile":
+        spec = spec or {}
+        unknown = sorted(set(spec) - _PROFILE_KEYS)
+        try:
+            if unknown:
+                raise ValueError(f"unknown key(s) {unknown}")
+            numa_node = spec.get("numa_node")
+            hugepages = spec.get("hugepages")
+            profile = cls(
+                name=name,
+                cpu_pinning=bool(spec.get("cpu_pinning", False)),
+                numa_node=None if numa_node in (None, "auto") else int(numa_node),
+                reserved_cpus=spec.get("reserved_cpus"),
+                hugepage_kib=_page_size_kib(hugepages) if hugepages else None,
+                disk_cache=spec.get("disk_cache"),
+                disk_io=spec.get("disk_io"),
+                disk_bus=spec.get("disk_bus"),
+                disk_queues=_queue_count(spec.get("disk_queues"), "disk_queues"),
+                iothreads=int(spec.get("iothreads", 0)),
+                net_queues=_queue_count(spec.get("net_queues"), "net_queues"),
+            )
+            if profile.reserved_cpus is not None:
+                parse_cpuset(profile.reserved_cpus)
+            for key, value, allowed in (
+                ("disk_cache", profile.disk_cache, DISK_CACHE_MODES),
+                ("disk_io", profile.disk_io, DISK_IO_MODES),
+                ("disk_bus", profile.disk_bus, DISK_BUSES),
+            ):
+                if value is not None and value not in allowed:
+                    raise ValueError(f"{key} must be one of {list(allowed)}: {value!r}")
+            if profile.disk_io == "native" and (
+                profile.disk_cache not in _DIRECT_CACHE_MODES
+            ):
+                raise ValueError("disk_io: native needs disk_cache: none or directsync")
+            if profile.iothreads < 0:
+                raise ValueError("iothreads must not be negative")
+        except ValueError as e:
+            raise ValueError(f"Performance profile '{name}': {e}")
+        return profile
+
+    @property
+    def needs_placement(self) -> bool:
+        return self.cpu_pinning or self.hugepage_kib is not None
+
+    @staticmethod
+    def queues(value, vcpus: int) -> int:
+        return vcpus if value == "auto" else value
+
+
+@dataclass
+class HostTopology:
+    # NUMA cell -> its physical cores, each the host CPUs (SMT siblings) that
+    # share it; and the hugepage sizes in KiB each cell can back memory with.
+    cores: dict[int, list[tuple[int, ...]]]
+    page_sizes: dict[int, set[int]]
+
+    @classmethod
+    def from_capabilities(cls, xml: str) -> "HostTopology":
+        root = ET.fromstring(xml)
+        cores, page_sizes = {}, {}
+        for cell in root.findall("host/topology/cells/cell"):
+            cell_id = int(cell.get("id"))
+            found = set()
+            for cpu in cell.findall("cpus/cpu"):
+                siblings = cpu.get("siblings")
+                found.add(
+                    tuple(sorted(parse_cpuset(siblings)))
+                    if siblings
+                    else (int(cpu.get("id")),)
+                )
+            cores[cell_id] = sorted(found)
+            page_sizes[cell_id] = {
+                int(pages.get("size"))
+                for pages in cell.findall("pages")
+                if pages.get("unit", "KiB") == "KiB"
+            }
+        return cls(cores, page_sizes)
+
+    def core_of(self, cpu: int) -> tuple[int, ...]:
+        for cell_cores in self.cores.values():
+            for core in cell_cores:
+                if cpu in core:
+                    return core
+        return (cpu,)
+
+
+@dataclass
+class NUMAPlacement:
+    cell: int
+    # Host CPU for each vCPU, in vCPU order; empty without pinning.
+    vcpu_pins: list[int] = field(default_factory=list)
+    # Where the emulator and I/O threads run, away from the vCPUs.
+    housekeeping: set[int] = field(default_factory=set)
+    hugepage_kib: int = None
+    pages: int = 0
+
+
+class NUMAPlacer:
+    # Hands pinned nodes whole physical cores, and hugepages, from a single
+    # NUMA cell. A core any other defined domain pins a vCPU to, or that a
+    # node still being built in this run has claimed, is never handed out
+    # again, so no two pinned VMs share a core or an SMT sibling of one.
+    def __init__(self, inventory):
+        self.inventory = inventory
+        self.backend = inventory.backend
+        self._lock = threading.Lock()
+        self._topology = None
+        self._claims = {}
+
+    def topology(self) -> HostTopology:
+        if self._topology is None:
+            topology = HostTopology.from_capabilities(self.backend.capabilities())
+            if not topology.cores:
+                raise ValueError("the host reports no NUMA topology to place nodes on")
+            self._topology = topology
+        return self._topology
+
+    def _pinned_elsewhere(self, vm_name: str) -> set[int]:
+        pinned = set()
+        for name in self.inventory.domains():
+            if name == vm_name:
+                continue
+            for pin in self.inventory.domain_xml(name).findall("cputune/vcpupin"):
+                pinned |= parse_cpuset(pin.get("cpuset", ""))
+        for name, placement in self._claims.items():
+            if name != vm_name:
+                pinned.update(placement.vcpu_pins)
+        return pinned
+
+    def _claimed_pages(self, cell: int, size_kib: int, vm_name: str) -> int:
+        # Claimed pages are only taken from the pool once the domain starts.
+        return sum(
+            placement.pages
+            for name, placement in self._claims.items()
+            if name != vm_name
+            and placement.cell == cell
+            and placement.hugepage_kib == size_kib
+        )
+
+    def place(
+        self, vm_name: str, vcpus: int, memory_kib: int, profile: PerformanceProfile
+    ) -> NUMAPlacement:
+        with self._lock:
+            topology = self.topology()
+            if profile.reserved_cpus is not None:
+                reserved = parse_cpuset(profile.reserved_cpus)
+            else:
+                reserved = set(topology.core_of(0))
+            busy = self._pinned_elsewhere(vm_name) | reserved
+
+            pages = 0
+            free_pages = {}
+            if profile.hugepage_kib is not None:
+                if memory_kib % profile.hugepage_kib:
+                    raise ValueError(
+                        f"{vm_name}'s memory is not a multiple of "
+                        f"{profile.hugepage_kib} KiB hugepages"
+                    )
+                pages = memory_kib // profile.hugepage_kib
+                free_pages = self.backend.free_pages(profile.hugepage_kib)
+
+            if profile.numa_node is not None:
+                if profile.numa_node not in topology.cores:
+                    raise ValueError(f"the host has no NUMA node {profile.numa_node}")
+                cells = [profile.numa_node]
+            else:
+                cells = sorted(topology.cores)
+            fits, reasons = [], []
+            for cell in cells:
+                free_cores = [
+                    core for core in topology.cores[cell] if not busy.intersection(core)
+                ]
+                threads = [cpu for core in free_cores for cpu in core]
+                if profile.cpu_pinning and len(threads) < vcpus:
+                    reasons.append(
+                        f"node {cell} has {len(threads)} free CPU(s) "
+                        f"for {vcpus} vCPU(s)"
+                    )
+                    continue
+                if pages:
+                    if profile.hugepage_kib not in topology.page_sizes.get(cell, ()):
+                        reasons.append(
+                            f"node {cell} has no {profile.hugepage_kib} KiB hugepages"
+                        )
+                        continue
+                    available = free_pages.get(cell, 0) - self._claimed_pages(
+                        cell, profile.hugepage_kib, vm_name
+                    )
+                    if available < pages:
+                        reasons.append(
+                            f"node {cell} has {max(available, 0)} free "
+                            f"{profile.hugepage_kib} KiB hugepage(s) for {pages}"
+                        )
+                        continue
+                fits.append((len(free_cores), cell, threads))
+            if not fits:
+                raise ValueError(
+                    f"Cannot apply profile '{profile.name}' to {vm_name}: "
+                    + "; ".join(reasons)
+                )
+
+            # Best fit, like the host scheduler: the node with the fewest free
+            # cores that still holds the VM, leaving roomy nodes for big VMs.
+            _, cell, threads = min(fits)
+            placement = NUMAPlacement(
+                cell=cell,
+                vcpu_pins=threads[:vcpus] if profile.cpu_pinning else [],
+                housekeeping=reserved,
+                hugepage_kib=profile.hugepage_kib,
+                pages=pages,
+            )
+            self._claims[vm_name] = placement
+            return placement
+
+    def settle(self, vm_name: str) -> None:
+        # The domain is defined and started (or failed); its pins are now in
+        # its XML and its hugepages out of the free count.
+        with self._lock:
+            self._claims.pop(vm_name, None)
+
+
+def _replace(parent: ET.Element, tag: str) -> ET.Element:
+    for elem in parent.findall(tag):
+        parent.remove(elem)
+    return ET.SubElement(parent, tag)
+
+
+def _child(parent: ET.Element, tag: str, attrs: dict = None) -> ET.Element:
+    elem = parent.find(tag)
+    if elem is None:
+        elem = ET.SubElement(parent, tag, attrs or {})
+    return elem
+
+
+def _disk_dev(bus: str, index: int) -> str:
+    return ("vd" if bus == "virtio" else "sd") + chr(ord("a") + index)
+
+
+def apply_profile(
+    root: ET.Element, profile: PerformanceProfile, placement: NUMAPlacement = None
+) -> None:
+    vcpus = int(root.findtext("vcpu"))
+    devices = root.find("devices")
+
+    if profile.iothreads:
+        _replace(root, "iothreads").text = str(profile.iothreads)
+    if placement is not None:
+        if placement.vcpu_pins:
+            vcpu = root.find("vcpu")
+            vcpu.set("placement", "static")
+            vcpu.attrib.pop("cpuset", None)
+            cputune = _replace(root, "cputune")
+            for index, cpu in enumerate(placement.vcpu_pins):
+                ET.SubElement(
+                    cputune, "vcpupin", {"vcpu": str(index), "cpuset": str(cpu)}
+                )
+            housekeeping = format_cpuset(placement.housekeeping)
+            if housekeeping:
+                ET.SubElement(cputune, "emulatorpin", {"cpuset": housekeeping})
+                for iothread in range(1, profile.iothreads + 1):
+                    ET.SubElement(
+                        cputune,
+                        "iothreadpin",
+                        {"iothread": str(iothread), "cpuset": housekeeping},
+                    )
+        numatune = _replace(root, "numatune")
+        ET.SubElement(
+            numatune, "memory", {"mode": "strict", "nodeset": str(placement.cell)}
+        )
+        if placement.hugepage_kib is not None:
+            backing = _child(root, "memoryBacking")
+            hugepages = _replace(backing, "hugepages")
+            ET.SubElement(
+                hugepages,
+                "page",
+                {
+                    "size": str(placement.hugepage_kib),
+                    "unit": "KiB",
+                    "nodeset": str(placement.cell),
+                },
+            )
+
+    disks = [disk for disk in devices.findall("disk") if disk.get("device") == "disk"]
+    for index, disk in enumerate(disks):
+        driver = _child(disk, "driver", {"name": "qemu", "type": "qcow2"})
+        if profile.disk_cache:
+            driver.set("cache", profile.disk_cache)
+        if profile.disk_io:
+            driver.set("io", profile.disk_io)
+        target = disk.find("target")
+        if profile.disk_bus:
+            target.set("bus", profile.disk_bus)
+            target.set("dev", _disk_dev(profile.disk_bus, index))
+            address = disk.find("address")
+            if address is not None:
+                disk.remove(address)  # The old bus's slot; libvirt assigns anew.
+        if target.get("bus") == "virtio":
+            if profile.iothreads:
+                driver.set("iothread", str(index % profile.iothreads + 1))
+            if profile.disk_queues:
+                driver.set(
+                    "queues", str(profile.queues(profile.disk_queues, vcpus))
+                )
+
+    if profile.disk_bus == "scsi":
+        # The seed ISO joins the disks on the virtio-scsi controller.
+        for cdrom in devices.findall("disk[@device='cdrom']"):
+            target = cdrom.find("target")
+            target.set("bus", "scsi")
+            target.set("dev", _disk_dev("scsi", len(disks)))
+    if any(disk.find("target").get("bus") == "scsi" for disk in disks):
+        controller = devices.find("controller[@type='scsi']")
+        if controller is None:
+            controller = ET.SubElement(
+                devices, "controller", {"type": "scsi", "index": "0"}
+            )
+        controller.set("model", "virtio-scsi")
+        driver = _child(controller, "driver")
+        if profile.iothreads:
+            driver.set("iothread", "1")
+        if profile.disk_queues:
+            driver.set("queues", str(profile.queues(profile.disk_queues, vcpus)))
+
+    if profile.net_queues:
+        for interface in devices.findall("interface"):
+            model = interface.find("model")
+            if model is None or model.get("type") != "virtio":
+                raise ValueError(
+                    f"Profile '{profile.name}' sets net_queues, but the base VM's "
+                    "NIC is not virtio"
+                )
+            driver = _child(interface, "driver")
+            driver.set("name", "vhost")
+            driver.set("queues", str(profile.queues(profile.net_queues, vcpus)))
@@ -0,0 +1,272 @@
+import fcntl
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import uuid
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from utils import OSUtils
+from vms.inventory import LibvirtInventory
+from vms.storage import OverlayOptions
+
+STATE_FILE = "state.json"
+LOCK_FILE = ".lock"
+
+
+@dataclass
+class WarmSlot:
+    slot_id: str
+    disk_path: str
+    xml_path: str
+    disk_gb: int
+    base_disk_path: str
+    created: float
+
+    def domain_root(self) -> ET.Element:
+        return ET.parse(self.xml_path).getroot()
+
+
+class WarmPool:
+    def __init__(
+        self,
+        base_vm_name: str,
+        inventory: LibvirtInventory,
+        pool_dir: str = "warm-pool",
+        overlay_options: OverlayOptions = None,
+    ):
+        self.base_vm_name = base_vm_name
+        self.inventory = inventory
+        # Claimed slots become node disks, so build them like node overlays.
+        self.overlay_options = overlay_options
+        self.pool_dir = os.path.abspath(pool_dir)
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _state(self):
+        # Serialise both threads of this run and concurrent CLI/refill processes.
+        os.makedirs(self.pool_dir, exist_ok=True)
+        with self._lock, open(os.path.join(self.pool_dir, LOCK_FILE), "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            state_path = os.path.join(self.pool_dir, STATE_FILE)
+            try:
+                with open(state_path, "r") as f:
+                    state = json.load(f)
+            except (FileNotFoundError, ValueError):
+                state = {"target": 0, "slots": []}
+            state.setdefault("building", [])
+            yield state
+            tmp_path = f"{state_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(state, f, indent=2)
+            os.replace(tmp_path, state_path)
+
+    def _base_disk_path(self, root: ET.Element) -> str:
+        for source in root.findall(".//disk[@device='disk']/source"):
+            if "file" in source.attrib:
+                return source.attrib["file"]
+        raise ValueError(f"Could not find base disk path for VM: {self.base_vm_name}")
+
+    def _build_slot(self, slot_id: str, disk_gb: int) -> WarmSlot:
+        root = self.inventory.domain_xml(self.base_vm_name)
+        base_disk_path = self._base_disk_path(root)
+        disk_path = os.path.join(
+            os.path.dirname(base_disk_path),
+            f"{self.base_vm_name}-warm-{slot_id}.qcow2",
+        )
+        OSUtils.run_command(
+            [
+                "qemu-img",
+                "create",
+                "-f",
+                "qcow2",
+                "-b",
+                base_disk_path,
+                "-F",
+                "qcow2",
+                *(self.overlay_options.qemu_img_args() if self.overlay_options else []),
+                disk_path,
+                f"{disk_gb}G",
+            ],
+            sudo=True,
+        )
+
+        xml_path = os.path.join(self.pool_dir, f"{slot_id}.xml")
+        ET.ElementTree(root).write(xml_path, encoding="unicode", xml_declaration=True)
+        return WarmSlot(
+            slot_id=slot_id,
+            disk_path=disk_path,
+            xml_path=xml_path,
+            disk_gb=disk_gb,
+            base_disk_path=base_disk_path,
+            created=time.time(),
+        )
+
+    def _discard(self, slot: WarmSlot) -> None:
+        try:
+            OSUtils.run_command(["rm", "-f", slot.disk_path], sudo=True)
+        finally:
+            if os.path.exists(slot.xml_path):
+                os.remove(slot.xml_path)
+
+    def slots(self) -> list[WarmSlot]:
+        with self._state() as state:
+            return [WarmSlot(**slot) for slot in state["slots"]]
+
+    @staticmethod
+    def _builder_alive(reservation: dict) -> bool:
+        try:
+            os.kill(reservation["pid"], 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    def _reserve(self) -> str:
+        # Slots being built count towards the target, so concurrent refills
+        # split the shortfall instead of each building all of it. A refill
+        # that died mid-build leaves a reservation its successors drop.
+        with self._state() as state:
+            state["building"] = [
+                reservation
+                for reservation in state["building"]
+                if self._builder_alive(reservation)
+            ]
+            if len(state["slots"]) + len(state["building"]) >= state["target"]:
+                return None
+            slot_id = uuid.uuid4().hex[:8]
+            state["building"].append({"slot_id": slot_id, "pid": os.getpid()})
+            return slot_id
+
+    def _release(self, slot_id: str, slot: WarmSlot = None) -> None:
+        with self._state() as state:
+            state["building"] = [
+                reservation
+                for reservation in state["building"]
+                if reservation["slot_id"] != slot_id
+            ]
+            if slot is not None:
+                state["slots"].append(slot.__dict__)
+
+    def warm(self, count: int, disk_gb: int) -> int:
+        with self._state() as state:
+            state["target"] = count
+
+        built = 0
+        while True:
+            slot_id = self._reserve()
+            if slot_id is None:
+                break
+            try:
+                slot = self._build_slot(slot_id, disk_gb)
+            except BaseException:
+                self._release(slot_id)
+                raise
+            self._release(slot_id, slot)
+            built += 1
+            print(f"Warmed slot {slot.slot_id} ({slot.disk_gb}G).")
+        return built
+
+    def claim(self, vm_name: str, disk_gb: int) -> WarmSlot:
+        if not os.path.exists(os.path.join(self.pool_dir, STATE_FILE)):
+            return None
+        base_root = self.inventory.domain_xml(self.base_vm_name)
+        current_base = self._base_disk_path(base_root)
+        disk_path = os.path.join(os.path.dirname(current_base), f"{vm_name}.qcow2")
+        if os.path.exists(disk_path):
+            return None
+
+        with self._state() as state:
+            slots = [WarmSlot(**slot) for slot in state["slots"]]
+            stale = [slot for slot in slots if slot.base_disk_path != current_base]
+            usable = [
+                slot for slot in slots if slot not in stale and slot.disk_gb <= disk_gb
+            ]
+            claimed = max(usable, key=lambda slot: slot.disk_gb, default=None)
+            state["slots"] = [
+                slot.__dict__
+                for slot in slots
+                if slot not in stale and slot is not claimed
+            ]
+
+        for slot in stale:
+            self._discard(slot)
+        if claimed is None:
+            return None
+
+        OSUtils.run_command(["mv", claimed.disk_path, disk_path], sudo=True)
+        if disk_gb > claimed.disk_gb:
+            OSUtils.run_command(
+                ["qemu-img", "resize", disk_path, f"{disk_gb}G"], sudo=True
+            )
+        claimed.disk_path = disk_path
+        return claimed
+
+    def orphaned_staged_xml(self) -> list[str]:
+        # Staged XML of slots claimed by a create that died before defining.
+        if not os.path.isdir(self.pool_dir):
+            return []
+        with self._state() as state:
+            owned = {slot["xml_path"] for slot in state["slots"]} | {
+                os.path.join(self.pool_dir, f"{reservation['slot_id']}.xml")
+                for reservation in state["building"]
+                if self._builder_alive(reservation)
+            }
+        return [
+            os.path.join(self.pool_dir, entry)
+            for entry in sorted(os.listdir(self.pool_dir))
+            if entry.endswith(".xml")
+            and os.path.join(self.pool_dir, entry) not in owned
+        ]
+
+    def release_staged_xml(self, slot: WarmSlot) -> None:
+        if os.path.exists(slot.xml_path):
+            os.remove(slot.xml_path)
+
+    def drain(self) -> int:
+        with self._state() as state:
+            slots = [WarmSlot(**slot) for slot in state["slots"]]
+            state["slots"] = []
+            state["target"] = 0
+        for slot in slots:
+            self._discard(slot)
+        return len(slots)
+
+    def target(self) -> int:
+        with self._state() as state:
+            return state["target"]
+
+    def refill_in_background(self, config_file_path: str) -> None:
+        if not os.path.exists(os.path.join(self.pool_dir, STATE_FILE)):
+            return
+        target = self.target()
+        if target <= 0 or len(self.slots()) >= target:
+            return
+        # Refill against the hypervisor this run used, not the config's default.
+        backend = self.inventory.backend
+        connection = ["--backend", backend.name]
+        if backend.uri:
+            connection += ["--uri", backend.uri]
+        log = open(os.path.join(self.pool_dir, "refill.log"), "a")
+        subprocess.Popen(
+            [
+                sys.executable,
+                os.path.abspath(sys.argv[0]),
+                "-c",
+                config_file_path,
+                *connection,
+                "pool",
+                "warm",
+                str(target),
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+            start_new_session=True,
+        )
+        log.close()
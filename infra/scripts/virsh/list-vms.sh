@@ -10,8 +10,12 @@ else
     if [ "$1" == "-n" ] || [ "$1" == "--name" ]; then
         VIRSH_LIST_ARGS+=("--name")
         shift
+    elif [ "$1" == "-s" ] || [ "$1" == "--stats" ]; then
+        # State, CPU, memory, block and net counters of every VM in one call.
+        echo "Collecting stats for all VMs..."
+        exec virsh domstats --state --cpu-total --balloon --vcpu --interface --block
     else 
-        echo "Error: Unrecognized argument: '$1'. Usage: $0 [-n | --name]"
+        echo "Error: Unrecognized argument: '$1'. Usage: $0 [-n | --name | -s | --stats]"
         exit 1
     fi
 fi